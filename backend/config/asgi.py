@@ -2,6 +2,15 @@
 ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+The change event stream (/api/events/) is served only through it, e.g.:
+
+    uvicorn config.asgi:application --workers 1
+
+Events are published in-process, so SSE clients see writes handled by the same
+worker process.
+
+DJANGO_ASGI=1 makes settings default DB_CONN_MAX_AGE to 0 (no persistent
+connections); run with DB_POOL=1 to reuse connections through the pool.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -12,5 +21,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+os.environ.setdefault('DJANGO_ASGI', '1')
 
 application = get_asgi_application()
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 from dotenv import load_dotenv
 from datetime import timedelta
 
@@ -52,6 +53,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'core.middleware.QueryMetricsMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -143,11 +146,15 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.AllowAny'],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'equipment.authentication.ClaimsJWTAuthentication',
     ],
 }
 SPECTACULAR_SETTINGS = {
@@ -165,23 +172,154 @@ CORS_ALLOWED_ORIGINS = [
     
 ]
 
-# PostgreSQL
+# PostgreSQL. Connections persist for DB_CONN_MAX_AGE seconds per thread (health-checked
+# before reuse); DB_POOL=1 instead uses an in-process pool per worker (core.db.postgresql):
+# DB_POOL_SIZE kept open, up to DB_POOL_MAX_OVERFLOW extra, DB_POOL_TIMEOUT seconds to wait.
+# Under ASGI (config/asgi.py sets DJANGO_ASGI=1) DB_CONN_MAX_AGE defaults to 0: async views
+# and the event stream run sync code in short-lived executor threads, so persistent per-thread
+# connections are never reused and pile up until max_connections (Django advises against them
+# there). Use DB_POOL=1 with ASGI to avoid a new connection per request.
+# Compare the modes with: manage.py benchmark_db_connections [--threads N --path /api/...]
+
+ASGI = os.getenv('DJANGO_ASGI') == '1'
+DB_POOL = os.getenv('DB_POOL', '0') == '1'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.db.postgresql' if DB_POOL else 'django.db.backends.postgresql',
         'NAME': os.getenv('DB_NAME'),
         'USER': os.getenv('DB_USER'),
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST', '127.0.0.1'),
         'PORT': os.getenv('DB_PORT', '5432'),
+        'CONN_MAX_AGE': 0 if DB_POOL else int(os.getenv('DB_CONN_MAX_AGE', '0' if ASGI else '60')),
+        'CONN_HEALTH_CHECKS': True,
+        'POOL': {
+            'SIZE': int(os.getenv('DB_POOL_SIZE', '10')),
+            'MAX_OVERFLOW': int(os.getenv('DB_POOL_MAX_OVERFLOW', '10')),
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', '5')),
+            'RECYCLE': int(os.getenv('DB_POOL_RECYCLE', '1800')),
+            'CHECK_AFTER': int(os.getenv('DB_POOL_CHECK_AFTER', '30')),
+        },
     }
 }
 
+# Read replicas (core.db.routing): DB_REPLICA_HOSTS is a comma-separated list of host[:port];
+# GET/HEAD/OPTIONS requests read from one of them, everything else uses 'default'. A user who
+# wrote reads from 'default' for REPLICA_STICKY_SECONDS afterwards (needs a shared CACHES backend
+# with several processes). Pointing DB_REPLICA_HOSTS at the primary itself exercises the routing locally.
+
+DATABASE_REPLICAS = []
+for index, address in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    host, _, port = address.strip().partition(':')
+    alias = f'replica_{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+# manage.py test: without real replicas a 'replica_1' alias mirrors the test database so
+# core.tests.ReplicaRoutingTests always runs; it enables DATABASE_REPLICAS itself.
+if not DATABASE_REPLICAS and sys.argv[1:2] == ['test']:
+    DATABASES['replica_1'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+
+DATABASE_ROUTERS = ['core.db.routing.ReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '5'))
+
+# Role cache (seconds a resolved user role is reused across requests)
+
+ROLE_CACHE_TTL = int(os.getenv('ROLE_CACHE_TTL', '60'))
+
+# Facets cache (seconds; entries are also invalidated on every equipment write)
+
+FACETS_CACHE_TTL = int(os.getenv('FACETS_CACHE_TTL', '300'))
+
+# Request coalescing (core.singleflight): identical concurrent facets/search computations for the
+# same role scope run once per process; a search result is reused for SINGLE_FLIGHT_TTL more seconds
+
+SINGLE_FLIGHT_TTL = float(os.getenv('SINGLE_FLIGHT_TTL', '1'))
+
+# Machine detail response cache: in-process LRU size, optional shared CACHES alias and its TTL
+
+DETAIL_CACHE_SIZE = int(os.getenv('DETAIL_CACHE_SIZE', '512'))
+DETAIL_CACHE_ALIAS = os.getenv('DETAIL_CACHE_ALIAS', '')
+DETAIL_CACHE_TTL = int(os.getenv('DETAIL_CACHE_TTL', '3600'))
+
+# Per-endpoint SQL query budgets ("<METHOD> <url name>": max queries), checked by
+# core.middleware.QueryMetricsMiddleware; QUERY_BUDGET_MODE is 'log' or 'raise'
+
+QUERY_BUDGETS = {
+    'GET machines-list': 6,
+    'GET machines-detail': 6,
+    'GET maintenance-list': 5,
+    'GET claims-list': 5,
+    'GET machine-search': 5,
+    'GET facets': 5,
+    'GET analytics': 8,
+    'GET sync': 8,
+}
+QUERY_BUDGET_DEFAULT = None
+QUERY_BUDGET_MODE = os.getenv('QUERY_BUDGET_MODE', 'log')
+
+# Machine search engine: 'postgres' (tsvector), 'basic' (icontains) or empty to pick by DB vendor
+
+MACHINE_SEARCH_ENGINE = os.getenv('MACHINE_SEARCH_ENGINE', '')
+
+# Read-only list/detail endpoints built from .values() instead of DRF serializers (equipment.fastread)
+
+FAST_READ = os.getenv('FAST_READ', '1') == '1'
+
+# Machine detail embeds only the latest N maintenance records and claims (full history is paginated)
+
+MACHINE_HISTORY_EMBED = int(os.getenv('MACHINE_HISTORY_EMBED', '10'))
+
+# Fleet analytics: result cache TTL (seconds) and operating hours between scheduled maintenance
+
+ANALYTICS_CACHE_TTL = int(os.getenv('ANALYTICS_CACHE_TTL', '600'))
+ANALYTICS_MAINTENANCE_INTERVAL = int(os.getenv('ANALYTICS_MAINTENANCE_INTERVAL', '500'))
+
+# Machine summary (MachineSummary) refresh: "signal" — on every maintenance/claim change,
+# "batch" — only by a periodic `manage.py rebuild_machine_summary`
+
+MACHINE_SUMMARY_REFRESH = os.getenv('MACHINE_SUMMARY_REFRESH', 'signal')
+
+# Delta sync (/api/sync/): default and max batch size, tombstone retention for prune_sync_tombstones.
+# Cost: every Machine/Maintenance/Claim save takes the change sequence row lock ("sync" in
+# ChangeVersion) until its transaction commits, so writes across the installation are serialized.
+# Keep write transactions short; bulk inserts (import, bulk create) are numbered after commit.
+
+SYNC_BATCH_SIZE = int(os.getenv('SYNC_BATCH_SIZE', '500'))
+SYNC_BATCH_MAX = int(os.getenv('SYNC_BATCH_MAX', '2000'))
+SYNC_TOMBSTONE_DAYS = int(os.getenv('SYNC_TOMBSTONE_DAYS', '90'))
+
+# Async (ASGI-native) search, facets and /api/me/ views; 0 routes them to the sync DRF views
+
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', '1') == '1'
+
+# Change events (/api/events/, ASGI only): per-connection queue, heartbeat (s), client retry (ms), connection cap,
+# lifetime (s) of the stream ticket from POST /api/events/ticket/ (the URL carries it instead of the access JWT)
+
+EVENTS_QUEUE_SIZE = int(os.getenv('EVENTS_QUEUE_SIZE', '100'))
+EVENTS_HEARTBEAT = float(os.getenv('EVENTS_HEARTBEAT', '15'))
+EVENTS_RETRY_MS = int(os.getenv('EVENTS_RETRY_MS', '3000'))
+EVENTS_MAX_CONNECTIONS = int(os.getenv('EVENTS_MAX_CONNECTIONS', '1000'))
+EVENTS_TICKET_LIFETIME = int(os.getenv('EVENTS_TICKET_LIFETIME', '30'))
+
 # Simple JWT
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'AUTH_HEADER_TYPES': ('Bearer',),
+    'TOKEN_OBTAIN_SERIALIZER': 'equipment.authentication.TokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'equipment.authentication.TokenRefreshSerializer',
 }
+
+# JWT claims (equipment.authentication): account, group and revocation changes reach other
+# processes within JWT_REVOCATION_WINDOW seconds, group permission changes within PERMISSION_CACHE_TTL
+
+JWT_REVOCATION_WINDOW = int(os.getenv('JWT_REVOCATION_WINDOW', '30'))
+PERMISSION_CACHE_TTL = int(os.getenv('PERMISSION_CACHE_TTL', '300'))
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
@@ -7,8 +8,21 @@ from rest_framework_simplejwt.views import (
     TokenObtainPairView, TokenRefreshView, TokenVerifyView
 )
 
-from core.views import health
-from equipment.views import MachineViewSet, MaintenanceTypeViewSet, MaintenanceViewSet, ClaimViewSet, MachineSearchView, me
+from core.views import health, metrics
+from equipment import async_views
+from equipment.views import MachineViewSet, MaintenanceTypeViewSet, MaintenanceViewSet, ClaimViewSet, MachineSearchView, me, facets, analytics, sync_changes, events, events_ticket
+
+# ASYNC_READ_VIEWS: поиск, фасеты и /api/me/ — async-версии (equipment/async_views.py)
+if settings.ASYNC_READ_VIEWS:
+    search_view, me_view, facets_view = async_views.search, async_views.me, async_views.facets
+    section_facets = [
+        path('api/machines/facets/', async_views.machine_facets, name='machines-facets'),
+        path('api/maintenance/facets/', async_views.maintenance_facets, name='maintenance-facets'),
+        path('api/claims/facets/', async_views.claim_facets, name='claims-facets'),
+    ]
+else:
+    search_view, me_view, facets_view = MachineSearchView.as_view(), me, facets
+    section_facets = []
 
 router = DefaultRouter()
 router.register(r'machines', MachineViewSet, basename='machines')
@@ -20,14 +34,21 @@ router.register(r'claims', ClaimViewSet, basename='claims')
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/health', health),
+    path('api/metrics', metrics),
 
+    *section_facets,  # раньше маршрутов router'а с теми же путями
     path('api/', include(router.urls)),
-    path('api/search', MachineSearchView.as_view(), name='machine-search'),
+    path('api/search', search_view, name='machine-search'),
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
     path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema')),
     
     path('api/auth/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/auth/token/verify/', TokenVerifyView.as_view(), name='token_verify'),
-    path("api/me/", me),
+    path("api/me/", me_view),
+    path("api/facets/", facets_view, name='facets'),
+    path("api/analytics/", analytics, name='analytics'),
+    path("api/sync/", sync_changes, name='sync'),
+    path("api/events/", events, name='events'),
+    path("api/events/ticket/", events_ticket, name='events-ticket'),
 ]
@@ -0,0 +1,152 @@
+"""
+Пул соединений с БД в памяти процесса (используется бэкендом core.db.postgresql).
+
+size соединений держатся открытыми; при нехватке открываются ещё до max_overflow
+«сверхштатных», которые закрываются при возврате. Когда заняты все, запрос ждёт
+свободное соединение до timeout секунд, затем получает PoolTimeout. Соединение,
+простоявшее дольше check_after секунд, перед выдачей проверяется (check), старше
+recycle секунд — закрывается при возврате. Статистика (ожидание, занятые,
+сверхштатные, таймауты) — в /api/metrics.
+"""
+import threading
+import time
+from collections import deque
+
+from core.metrics import percentile
+
+WAIT_WINDOW = 1000
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, size=10, max_overflow=10, timeout=5.0, recycle=1800, check_after=30, check=None):
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.check_after = check_after
+        self.check = check
+        self._cond = threading.Condition()
+        self._idle = deque()  # (соединение, когда открыто, когда возвращено)
+        self._opened_at = {}  # id(соединения) -> когда открыто
+        self.open = 0
+        self.in_use = 0
+        self.in_use_peak = 0
+        self.created = 0
+        self.overflow = 0
+        self.timeouts = 0
+        self.failed_checks = 0
+        self.waits = deque(maxlen=WAIT_WINDOW)
+
+    def acquire(self, connect):
+        """Свободное соединение из пула или новое через connect()."""
+        started = time.monotonic()
+        with self._cond:
+            while True:
+                if self._idle:
+                    # последнее возвращённое: скорее всего живое и «тёплое»
+                    connection, opened_at, released_at = self._idle.pop()
+                    break
+                if self.open < self.size + self.max_overflow:
+                    self.open += 1
+                    connection = released_at = None
+                    break
+                remaining = started + self.timeout - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(
+                        f"Нет свободного соединения за {self.timeout} с "
+                        f"(занято {self.in_use}, пул {self.size}+{self.max_overflow})")
+                self._cond.wait(remaining)
+            self.in_use += 1
+            self.in_use_peak = max(self.in_use_peak, self.in_use)
+            if self.in_use > self.size:
+                self.overflow += 1
+            self.waits.append((time.monotonic() - started) * 1000)
+
+        if connection is not None and self.check is not None \
+                and time.monotonic() - released_at > self.check_after and not self._usable(connection):
+            with self._cond:
+                self.failed_checks += 1
+                self._opened_at.pop(id(connection), None)
+            self._close(connection)
+            connection = None
+        if connection is None:
+            try:
+                connection = connect()
+            except BaseException:
+                with self._cond:
+                    self.open -= 1
+                    self.in_use -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self.created += 1
+                self._opened_at[id(connection)] = time.monotonic()
+        return connection
+
+    def release(self, connection):
+        """Возвращает соединение; сломанное, старое или сверхштатное закрывается."""
+        keep = not getattr(connection, "closed", False)
+        if keep:
+            try:
+                connection.rollback()  # незавершённая транзакция не должна достаться следующему
+            except Exception:
+                keep = False
+        now = time.monotonic()
+        with self._cond:
+            self.in_use -= 1
+            opened_at = self._opened_at.get(id(connection), now)
+            if keep and self.open <= self.size and now - opened_at < self.recycle:
+                self._idle.append((connection, opened_at, now))
+                connection = None
+            else:
+                self.open -= 1
+                self._opened_at.pop(id(connection), None)
+            self._cond.notify()
+        if connection is not None:
+            self._close(connection)
+
+    def close(self):
+        """Закрывает свободные соединения (занятые закроются при возврате)."""
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self.open -= len(idle)
+            for connection, _, _ in idle:
+                self._opened_at.pop(id(connection), None)
+        for connection, _, _ in idle:
+            self._close(connection)
+
+    def _usable(self, connection):
+        try:
+            return self.check(connection)
+        except Exception:
+            return False
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        with self._cond:
+            waits = list(self.waits)
+            return {
+                "size": self.size,
+                "max_overflow": self.max_overflow,
+                "open": self.open,
+                "idle": len(self._idle),
+                "in_use": self.in_use,
+                "in_use_peak": self.in_use_peak,
+                "created": self.created,
+                "overflow": self.overflow,
+                "timeouts": self.timeouts,
+                "failed_checks": self.failed_checks,
+                "wait_ms_p50": round(percentile(waits, 50), 3),
+                "wait_ms_p95": round(percentile(waits, 95), 3),
+                "wait_ms_max": round(max(waits, default=0), 3),
+            }
@@ -0,0 +1,81 @@
+"""
+PostgreSQL-бэкенд Django с пулом соединений процесса (core.db.pool).
+
+ENGINE = "core.db.postgresql", параметры пула — в ключе POOL настройки базы
+(SIZE, MAX_OVERFLOW, TIMEOUT, RECYCLE, CHECK_AFTER). Django по-прежнему
+«открывает» соединение на запрос и «закрывает» его в конце (CONN_MAX_AGE = 0),
+но вместо connect/close соединение берётся из пула и возвращается в него.
+Работает и с psycopg2, и с psycopg 3 (встроенный пул Django требует psycopg 3).
+"""
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+
+from core.db.pool import ConnectionPool, PoolTimeout
+from core.metrics import register_stats
+
+_pools = {}
+_lock = threading.Lock()
+
+
+def _check(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1")
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    @property
+    def connection_pool(self):
+        # служебные соединения (создание тестовой БД и т.п.) пул не используют
+        if self.alias == NO_DB_ALIAS:
+            return None
+        if self.settings_dict.get("CONN_MAX_AGE", 0) != 0:
+            raise ImproperlyConfigured("Пул соединений не совместим с CONN_MAX_AGE != 0.")
+        # тестовая БД получает свой пул: у неё другое имя
+        key = (self.alias, self.settings_dict["NAME"])
+        with _lock:
+            if key not in _pools:
+                options = self.settings_dict.get("POOL", {})
+                _pools[key] = ConnectionPool(
+                    size=options.get("SIZE", 10),
+                    max_overflow=options.get("MAX_OVERFLOW", 10),
+                    timeout=options.get("TIMEOUT", 5.0),
+                    recycle=options.get("RECYCLE", 1800),
+                    check_after=options.get("CHECK_AFTER", 30),
+                    check=_check if self.settings_dict["CONN_HEALTH_CHECKS"] else None,
+                )
+                register_stats(f"db_pool_{self.alias}", _pools[key].stats)
+            return _pools[key]
+
+    def get_new_connection(self, conn_params):
+        pool = self.connection_pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        # родительский get_new_connection() (он задаёт и isolation_level) вызывается
+        # только для нового соединения, для взятого из пула — уровень из OPTIONS
+        self.isolation_level = IsolationLevel(
+            self.settings_dict["OPTIONS"].get("isolation_level", IsolationLevel.READ_COMMITTED))
+        try:
+            return pool.acquire(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+        except PoolTimeout as e:
+            raise self.Database.OperationalError(str(e)) from e
+
+    def _close(self):
+        pool = self.connection_pool
+        if self.connection is None or pool is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            pool.release(self.connection)
+            self.connection = None
+
+    def close_pool(self):
+        # Django закрывает пул перед удалением и клонированием тестовой БД
+        super().close_pool()
+        with _lock:
+            pools = [pool for (alias, _), pool in _pools.items() if alias == self.alias]
+        for pool in pools:
+            pool.close()
@@ -0,0 +1,99 @@
+"""
+Чтение с реплик для безопасных запросов (DATABASE_ROUTERS = ["core.db.routing.ReplicaRouter"]).
+
+Реплики — алиасы из DATABASE_REPLICAS. ReplicaRoutingMiddleware на время
+GET/HEAD/OPTIONS-запроса выбирает одну из них, и все чтения запроса идут туда.
+Остальные запросы, а также команды и фоновые задачи читают с основной базы.
+
+Первая запись в ходе запроса (db_for_write) переводит оставшиеся чтения на
+основную базу. После ответа пользователь, известный по identify(), ещё
+REPLICA_STICKY_SECONDS читает с основной: он сразу видит свои изменения, даже
+если реплика отстаёт. Отметка хранится в кэше по id пользователя, поэтому при
+нескольких процессах нужен общий бэкенд CACHES.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+_state = ContextVar("db_routing", default=None)
+
+
+class RoutingState:
+    def __init__(self, replica):
+        self.replica = replica  # алиас реплики или None — основная база
+        self.user_id = None
+        self.wrote = False
+
+
+def _sticky_key(user_id):
+    return f"db:primary:{user_id}"
+
+
+def replicas():
+    return getattr(settings, "DATABASE_REPLICAS", ())
+
+
+def begin(safe):
+    """Начало запроса: safe — можно ли читать с реплики. Возвращает токен для end()."""
+    choices = replicas()
+    return _state.set(RoutingState(random.choice(choices) if safe and choices else None))
+
+
+def end(token):
+    state = _state.get()
+    _state.reset(token)
+    if state is not None and state.wrote and state.user_id is not None:
+        cache.set(_sticky_key(state.user_id), True, timeout=settings.REPLICA_STICKY_SECONDS)
+
+
+def identify(user_id):
+    """Пользователь запроса известен: недавно писавший читает с основной базы."""
+    state = _state.get()
+    if state is None:
+        return
+    state.user_id = user_id
+    if state.replica is not None and cache.get(_sticky_key(user_id)):
+        state.replica = None
+
+
+async def aidentify(user_id):
+    state = _state.get()
+    if state is None:
+        return
+    state.user_id = user_id
+    if state.replica is not None and await cache.aget(_sticky_key(user_id)):
+        state.replica = None
+
+
+def current():
+    """Алиас, с которого читает текущий запрос (None вне запроса)."""
+    state = _state.get()
+    return None if state is None else (state.replica or DEFAULT_DB_ALIAS)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        return None if state is None else state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+            state.replica = None
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплики — копии основной базы: объекты с любой из них можно связывать
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, *replicas()}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # схему на реплики приносит репликация
+        if db in replicas():
+            return False
+        return None
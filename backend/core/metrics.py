@@ -0,0 +1,129 @@
+"""
+Метрики запросов по эндпоинтам (в памяти процесса).
+
+Заполняются QueryMetricsMiddleware, отдаются через /api/metrics. Другие
+приложения могут добавить свою статистику (кэши и т.п.) через register_stats().
+"""
+import threading
+from collections import deque
+
+LATENCY_WINDOW = 1000
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.db_ms = 0.0
+        self.serializer_ms = 0.0
+        self.render_ms = 0.0
+        self.total_ms = 0.0
+        self.bytes = 0
+        self.budget_exceeded = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.aliases = {}  # алиас БД -> [запросов, мс]
+
+    def add(self, sample):
+        self.requests += 1
+        self.queries += sample.queries
+        self.max_queries = max(self.max_queries, sample.queries)
+        self.db_ms += sample.db_ms
+        self.serializer_ms += sample.serializer_ms
+        self.render_ms += sample.render_ms
+        self.total_ms += sample.total_ms
+        self.bytes += sample.size or 0
+        self.latencies.append(sample.total_ms)
+        for alias, (queries, db_ms) in sample.aliases.items():
+            totals = self.aliases.setdefault(alias, [0, 0.0])
+            totals[0] += queries
+            totals[1] += db_ms
+
+    def as_dict(self):
+        n = self.requests or 1
+        return {
+            "requests": self.requests,
+            "queries_avg": round(self.queries / n, 2),
+            "queries_max": self.max_queries,
+            "db_ms_avg": round(self.db_ms / n, 2),
+            "serializer_ms_avg": round(self.serializer_ms / n, 2),
+            "render_ms_avg": round(self.render_ms / n, 2),
+            "total_ms_p50": round(percentile(self.latencies, 50), 2),
+            "total_ms_p95": round(percentile(self.latencies, 95), 2),
+            "bytes_avg": round(self.bytes / n),
+            "budget_exceeded": self.budget_exceeded,
+            "by_alias": {
+                alias: {"queries_avg": round(queries / n, 2), "db_ms_avg": round(db_ms / n, 2)}
+                for alias, (queries, db_ms) in sorted(self.aliases.items())
+            },
+        }
+
+
+class Sample:
+    """Замер одного запроса."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_ms = 0.0
+        self.view_db_ms = 0.0
+        self.serializer_ms = 0.0
+        self.render_ms = 0.0
+        self.total_ms = 0.0
+        self.size = None
+        self.aliases = {}
+
+    def add_query(self, alias, ms):
+        self.queries += 1
+        self.db_ms += ms
+        totals = self.aliases.setdefault(alias, [0, 0.0])
+        totals[0] += 1
+        totals[1] += ms
+
+    def server_timing(self):
+        return ", ".join([
+            f'db;dur={self.db_ms:.1f};desc="{self.queries} queries"',
+            f"serializer;dur={self.serializer_ms:.1f}",
+            f"render;dur={self.render_ms:.1f}",
+            f"total;dur={self.total_ms:.1f}",
+        ])
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._providers = {}
+
+    def record(self, endpoint, sample, budget_exceeded=False):
+        with self._lock:
+            stats = self._endpoints.setdefault(endpoint, EndpointStats())
+            stats.add(sample)
+            if budget_exceeded:
+                stats.budget_exceeded += 1
+
+    def register_stats(self, name, provider):
+        self._providers[name] = provider
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+    def snapshot(self):
+        with self._lock:
+            endpoints = {name: stats.as_dict() for name, stats in sorted(self._endpoints.items())}
+        return {
+            "endpoints": endpoints,
+            "stats": {name: provider() for name, provider in self._providers.items()},
+        }
+
+
+registry = Registry()
+register_stats = registry.register_stats
@@ -0,0 +1,169 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from .db import routing
+from .metrics import Sample, registry
+
+logger = logging.getLogger("core.metrics")
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def endpoint_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return f"{request.method} unresolved"
+    return f"{request.method} {match.url_name or match.route}"
+
+
+def query_budget(endpoint):
+    budgets = getattr(settings, "QUERY_BUDGETS", {})
+    return budgets.get(endpoint, getattr(settings, "QUERY_BUDGET_DEFAULT", None))
+
+
+class QueryMetricsMiddleware:
+    """
+    Считает SQL-запросы и время БД, время кода view без БД (в основном сериализаторы),
+    время рендеринга и размер ответа. Пишет их в заголовок Server-Timing и в
+    core.metrics.registry. Если задан бюджет запросов (QUERY_BUDGETS /
+    QUERY_BUDGET_DEFAULT) и он превышен — пишет в лог или, при
+    QUERY_BUDGET_MODE = "raise" (для тестов), бросает QueryBudgetExceeded.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Под ASGI цепочка остаётся асинхронной, иначе async-view (поиск, фасеты)
+        # снова выполнялись бы в отдельном потоке на весь запрос.
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            # иначе Django обернёт синхронный process_view в sync_to_async (лишний поток)
+            self.process_view = self._aprocess_view
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        sample, stack, started = self._start(request)
+        with stack:
+            response = self.get_response(request)
+        return self._finish(request, response, sample, started)
+
+    async def __acall__(self, request):
+        # Соединения с БД у каждого потока свои: счётчик ставится в том потоке,
+        # где async ORM этого запроса выполняет SQL (sync_to_async, thread_sensitive).
+        sample, stack, started = await sync_to_async(self._start)(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self._finish(request, response, sample, started)
+
+    def _start(self, request):
+        sample = Sample()
+        request._metrics = sample
+        request._metrics_view = None
+
+        def recorder(alias):
+            def record_query(execute, sql, params, many, context):
+                started = time.perf_counter()
+                try:
+                    return execute(sql, params, many, context)
+                finally:
+                    sample.add_query(alias, (time.perf_counter() - started) * 1000)
+            return record_query
+
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder(connection.alias)))
+        return sample, stack, time.perf_counter()
+
+    def _finish(self, request, response, sample, started):
+        finished = time.perf_counter()
+        sample.total_ms = (finished - started) * 1000
+        view = request._metrics_view
+        if view is not None:
+            view_started, view_db_ms, view_finished, view_db_end = view
+            view_finished = view_finished or finished
+            view_db_end = sample.db_ms if view_db_end is None else view_db_end
+            sample.serializer_ms = max(
+                0.0, (view_finished - view_started) * 1000 - (view_db_end - view_db_ms))
+            sample.render_ms = (finished - view_finished) * 1000
+        if not response.streaming:
+            sample.size = len(response.content)
+
+        response["Server-Timing"] = sample.server_timing()
+        self._check_budget(request, sample)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_view = [time.perf_counter(), request._metrics.db_ms, None, None]
+
+    async def _aprocess_view(self, request, view_func, view_args, view_kwargs):
+        type(self).process_view(self, request, view_func, view_args, view_kwargs)
+
+    def process_template_response(self, request, response):
+        # DRF Response рендерится после выхода из view — здесь граница view/render.
+        if request._metrics_view is not None:
+            request._metrics_view[2] = time.perf_counter()
+            request._metrics_view[3] = request._metrics.db_ms
+        return response
+
+    def _check_budget(self, request, sample):
+        endpoint = endpoint_name(request)
+        budget = query_budget(endpoint)
+        exceeded = budget is not None and sample.queries > budget
+        registry.record(endpoint, sample, budget_exceeded=exceeded)
+        if not exceeded:
+            return
+        message = f"{endpoint}: {sample.queries} SQL-запросов при бюджете {budget}"
+        if getattr(settings, "QUERY_BUDGET_MODE", "log") == "raise":
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    GET/HEAD/OPTIONS читают с реплики из DATABASE_REPLICAS (core.db.routing),
+    остальные запросы — с основной базы. Без реплик ничего не делает.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not routing.replicas():
+            return self.get_response(request)
+        token = routing.begin(safe=request.method in SAFE_METHODS)
+        try:
+            return self.get_response(request)
+        finally:
+            routing.end(token)
+
+    async def __acall__(self, request):
+        if not routing.replicas():
+            return await self.get_response(request)
+        token = routing.begin(safe=request.method in SAFE_METHODS)
+        try:
+            return await self.get_response(request)
+        finally:
+            routing.end(token)
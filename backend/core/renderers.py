@@ -0,0 +1,33 @@
+from rest_framework import renderers
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # необязательная зависимость
+    orjson = None
+
+_encoder = encoders.JSONEncoder()
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer на orjson с тем же результатом побайтно, что и у стандартного
+    (компактный JSON, UTF-8 без \\u-экранирования, экранированные U+2028/U+2029).
+    Отступы (?indent, Browsable API), нестрогий режим, отсутствие orjson и
+    неподдерживаемые им значения обрабатывает стандартный JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.ensure_ascii or not self.compact
+                or not self.strict
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            # даты/время отдаём кодировщику DRF: у orjson другой формат
+            ret = orjson.dumps(data, default=_encoder.default,
+                               option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except (orjson.JSONEncodeError, TypeError):
+            return super().render(data, accepted_media_type, renderer_context)
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace("\u2028".encode(), b"\\u2028").replace("\u2029".encode(), b"\\u2029")
+        return ret
@@ -0,0 +1,140 @@
+"""
+Объединение одинаковых одновременных вычислений (single-flight).
+
+SingleFlight.do(key, fn) выполняет fn() один раз на ключ: кто пришёл с тем же
+ключом, пока вычисление идёт, ждёт его и получает тот же результат (или ту же
+ошибку). После завершения результат ещё ttl секунд отдаётся без вычисления
+(хранится не больше max_size таких результатов).
+ado(key, afn) — то же для async-кода: ожидание не блокирует цикл событий, а
+синхронные и async-вызовы с одним ключом делят одно вычисление, в том числе
+из разных потоков и циклов событий.
+
+Результат общий для всех ожидавших: его нельзя менять на месте.
+"""
+import asyncio
+import threading
+import time
+
+_MISSING = object()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.futures = []  # (цикл событий, future) ожидающих async-вызовов
+        self.result = None
+        self.error = None
+        self.cancelled = False
+
+
+class SingleFlight:
+    def __init__(self, ttl=0.0, max_size=1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._results = {}  # ключ -> (результат, момент истечения)
+        self.computed = 0
+        self.shared = 0
+        self.hits = 0
+
+    def _join(self, key):
+        """(закэшированный результат или _MISSING, вызов, ведущий ли это вызов)."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None and entry[1] > now:
+                self.hits += 1
+                return entry[0], None, False
+            if entry is not None:
+                del self._results[key]
+            call = self._calls.get(key)
+            if call is not None:
+                self.shared += 1
+                return _MISSING, call, False
+            call = self._calls[key] = _Call()
+            self.computed += 1
+            return _MISSING, call, True
+
+    def _finish(self, key, call):
+        with self._lock:
+            del self._calls[key]
+            if call.error is None and not call.cancelled and self.ttl > 0:
+                now = time.monotonic()
+                if len(self._results) >= self.max_size:
+                    self._results = {k: v for k, v in self._results.items() if v[1] > now}
+                    while len(self._results) >= self.max_size:
+                        del self._results[next(iter(self._results))]  # самый старый
+                self._results[key] = (call.result, now + self.ttl)
+            futures, call.futures = call.futures, []
+            call.done.set()
+        for loop, future in futures:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def _outcome(self, call):
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def do(self, key, fn):
+        while True:
+            result, call, leader = self._join(key)
+            if call is None:
+                return result
+            if leader:
+                try:
+                    call.result = fn()
+                except BaseException as error:
+                    call.error = error
+                finally:
+                    self._finish(key, call)
+                return self._outcome(call)
+            call.done.wait()
+            if not call.cancelled:
+                return self._outcome(call)
+            # ведущий async-вызов отменён (клиент ушёл): вычисляет следующий
+
+    async def ado(self, key, afn):
+        while True:
+            result, call, leader = self._join(key)
+            if call is None:
+                return result
+            if leader:
+                try:
+                    call.result = await afn()
+                except asyncio.CancelledError:
+                    call.cancelled = True
+                    raise
+                except BaseException as error:
+                    call.error = error
+                finally:
+                    self._finish(key, call)
+                return self._outcome(call)
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            with self._lock:
+                if not call.done.is_set():
+                    call.futures.append((loop, future))
+                else:
+                    future.set_result(None)
+            await future
+            if not call.cancelled:
+                return self._outcome(call)
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "computed": self.computed,
+                "shared": self.shared,
+                "hits": self.hits,
+            }
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
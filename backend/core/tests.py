@@ -1,3 +1,248 @@
-from django.test import TestCase
+import asyncio
+import sqlite3
+import threading
+import time
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .db import routing
+from .db.pool import ConnectionPool, PoolTimeout
+from .metrics import percentile, registry
+from .singleflight import SingleFlight
+from .middleware import QueryBudgetExceeded
+
+
+class QueryMetricsMiddlewareTests(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.api = APIClient()
+
+    def test_server_timing_header(self):
+        response = self.api.get("/api/health")
+        timing = response["Server-Timing"]
+        for metric in ("db;", "serializer;", "render;", "total;"):
+            self.assertIn(metric, timing)
+        self.assertIn('desc="0 queries"', timing)
+
+    def test_metrics_endpoint(self):
+        self.api.get("/api/health")
+        self.api.get("/api/machines/")
+        self.assertEqual(self.api.get("/api/metrics").status_code, 401)
+
+        admin = User.objects.create_user("admin", is_staff=True)
+        self.api.force_authenticate(admin)
+        data = self.api.get("/api/metrics").json()
+        self.assertEqual(data["endpoints"]["GET api/health"]["requests"], 1)
+        self.assertGreaterEqual(data["endpoints"]["GET machines-list"]["queries_max"], 1)
+        self.assertIn("role_cache", data["stats"])
+
+    @override_settings(QUERY_BUDGETS={"GET machines-list": 0}, QUERY_BUDGET_MODE="raise")
+    def test_budget_raises_in_tests(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.api.get("/api/machines/")
+
+    @override_settings(QUERY_BUDGETS={"GET machines-list": 0}, QUERY_BUDGET_MODE="log")
+    def test_budget_logs(self):
+        with self.assertLogs("core.metrics", "WARNING"):
+            self.api.get("/api/machines/")
+
+    def test_percentile(self):
+        self.assertEqual(percentile([5, 1, 3, 2, 4], 50), 3)
+        self.assertEqual(percentile([], 95), 0.0)
+
+
+class ConnectionPoolTests(TestCase):
+    def connect(self):
+        return sqlite3.connect(":memory:", check_same_thread=False)
+
+    def test_reuses_connections(self):
+        pool = ConnectionPool(size=2, max_overflow=0)
+        first = pool.acquire(self.connect)
+        pool.release(first)
+        self.assertIs(pool.acquire(self.connect), first)
+        self.assertEqual(pool.stats()["created"], 1)
+
+    def test_overflow_closed_on_release(self):
+        pool = ConnectionPool(size=1, max_overflow=1)
+        a, b = pool.acquire(self.connect), pool.acquire(self.connect)
+        self.assertEqual((pool.stats()["in_use"], pool.stats()["overflow"]), (2, 1))
+        pool.release(a)
+        pool.release(b)
+        stats = pool.stats()
+        self.assertEqual((stats["open"], stats["idle"], stats["in_use_peak"]), (1, 1, 2))
+
+    def test_waits_for_release_then_times_out(self):
+        pool = ConnectionPool(size=1, max_overflow=0, timeout=0.05)
+        connection = pool.acquire(self.connect)
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(self.connect)
+        threading.Timer(0.02, pool.release, [connection]).start()
+        pool.timeout = 2
+        self.assertIs(pool.acquire(self.connect), connection)
+        stats = pool.stats()
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertGreaterEqual(stats["wait_ms_max"], 10)
+
+    def test_rolls_back_and_drops_broken_connections(self):
+        pool = ConnectionPool(size=1, max_overflow=0)
+        connection = pool.acquire(self.connect)
+        connection.execute("CREATE TABLE t (x)")
+        connection.commit()
+        connection.execute("INSERT INTO t VALUES (1)")
+        pool.release(connection)
+        self.assertEqual(connection.execute("SELECT count(*) FROM t").fetchone(), (0,))
+
+        connection = pool.acquire(self.connect)
+        connection.close()  # sqlite3: rollback() закрытого соединения падает
+        pool.release(connection)
+        self.assertIsNot(pool.acquire(self.connect), connection)
+
+    def test_health_check_after_idle(self):
+        pool = ConnectionPool(size=1, max_overflow=0, check_after=0, check=lambda connection: False)
+        connection = pool.acquire(self.connect)
+        pool.release(connection)
+        self.assertIsNot(pool.acquire(self.connect), connection)
+        self.assertEqual((pool.stats()["failed_checks"], pool.stats()["open"]), (1, 1))
+
+    def test_failed_connect_frees_slot(self):
+        pool = ConnectionPool(size=1, max_overflow=0, timeout=0)
+        with self.assertRaises(sqlite3.OperationalError):
+            pool.acquire(lambda: sqlite3.connect("/nonexistent/db.sqlite3"))
+        self.assertIsNotNone(pool.acquire(self.connect))
+
+
+@override_settings(DATABASE_REPLICAS=["replica_1"], REPLICA_STICKY_SECONDS=5)
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = routing.ReplicaRouter()
+        cache.delete(routing._sticky_key(7))
+
+    def request(self, safe, user_id=None):
+        token = routing.begin(safe)
+        if user_id is not None:
+            routing.identify(user_id)
+        read = self.router.db_for_read(None)
+        return token, read
+
+    def test_safe_requests_read_from_replica(self):
+        token, read = self.request(safe=True)
+        routing.end(token)
+        self.assertEqual(read, "replica_1")
+        token, read = self.request(safe=False)
+        routing.end(token)
+        self.assertIsNone(read)
+        self.assertIsNone(self.router.db_for_read(None))  # вне запроса — основная база
+
+    def test_write_pins_request_and_user_to_primary(self):
+        token, read = self.request(safe=True, user_id=7)
+        self.assertEqual(self.router.db_for_write(None), "default")
+        self.assertIsNone(self.router.db_for_read(None))
+        routing.end(token)
+
+        token, read = self.request(safe=True, user_id=7)
+        routing.end(token)
+        self.assertIsNone(read)
+        token, read = self.request(safe=True, user_id=8)
+        routing.end(token)
+        self.assertEqual(read, "replica_1")
+
+    def test_no_migrations_on_replicas(self):
+        self.assertFalse(self.router.allow_migrate("replica_1", "equipment"))
+        self.assertIsNone(self.router.allow_migrate("default", "equipment"))
+
+
+@override_settings(DATABASE_REPLICAS=settings.DATABASE_REPLICAS or ["replica_1"])
+class ReplicaRoutingTests(TransactionTestCase):
+    # TestCase держит данные в незакоммиченной транзакции: реплика (TEST MIRROR) их не видит
+    databases = "__all__"
+
+    def setUp(self):
+        registry.reset()
+        self.user = User.objects.create_superuser("writer")
+        cache.delete(routing._sticky_key(self.user.pk))
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+    def aliases(self, endpoint):
+        return registry.snapshot()["endpoints"][endpoint]["by_alias"]
+
+    def test_reads_go_to_replica_until_user_writes(self):
+        self.api.get("/api/machines/")
+        self.assertEqual(set(self.aliases("GET machines-list")), set(settings.DATABASE_REPLICAS))
+
+        payload = {"serial_number": "0042", "model_name": "ПД1,5"}
+        self.assertEqual(self.api.post("/api/machines/", payload, format="json").status_code, 201)
+        self.assertEqual(set(self.aliases("POST machines-list")), {"default"})
+
+        registry.reset()
+        self.api.get("/api/machines/")
+        self.assertEqual(set(self.aliases("GET machines-list")), {"default"})
+
+
+class SingleFlightTests(SimpleTestCase):
+    def wait_shared(self, flight, count):
+        deadline = time.monotonic() + 5
+        while flight.stats()["shared"] < count and time.monotonic() < deadline:
+            time.sleep(0.001)
+
+    def test_concurrent_threads_share_one_call(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        calls, results = [], []
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return object()
+
+        threads = [threading.Thread(target=lambda: results.append(flight.do("k", compute)))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        self.wait_shared(flight, 7)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len({id(result) for result in results}), 1)
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+    def test_async_and_sync_callers_share_one_call(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "facets"
+
+        async def main():
+            sync_caller = asyncio.to_thread(flight.do, "k", lambda: "sync")
+            return await asyncio.gather(*(flight.ado("k", compute) for _ in range(5)), sync_caller)
+
+        self.assertEqual(asyncio.run(main()), ["facets"] * 6)
+        self.assertEqual(len(calls), 1)
+
+    def test_errors_shared_but_not_kept(self):
+        flight = SingleFlight(ttl=60)
+
+        def fail():
+            raise ValueError("нет соединения")
+
+        with self.assertRaises(ValueError):
+            flight.do("k", fail)
+        self.assertEqual(flight.do("k", lambda: 1), 1)
+        self.assertEqual(flight.do("k", lambda: 2), 1)  # в пределах ttl
+        self.assertEqual(flight.stats()["hits"], 1)
+
+    def test_kept_results_bounded(self):
+        flight = SingleFlight(ttl=60, max_size=2)
+        for key in "abc":
+            flight.do(key, lambda: key)
+        self.assertEqual(flight.do("a", lambda: "новое"), "новое")
+        self.assertEqual(flight.do("c", lambda: "новое"), "c")
@@ -1,6 +1,15 @@
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 
+from .metrics import registry
+
 @api_view(['GET'])
 def health(request):
     return Response({'status': 'ok'})
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def metrics(request):
+    return Response(registry.snapshot())
@@ -0,0 +1,170 @@
+"""
+Аналитика надёжности парка (/api/analytics/).
+
+Всё считается агрегатами в БД, в Python только собирается ответ:
+
+* MTBF (наработка на отказ) — суммарная наработка машин группы / число отказов.
+  Наработка машины — максимум «Наработки, м/час» среди её ТО и рекламаций
+  (из сводки MachineSummary), число отказов — денормализованный claims_count
+  (оба за всё время).
+* Простой — сумма и среднее downtime_hours по рекламациям.
+* Отказы по узлам — число рекламаций по failure_node.
+* Соблюдение ТО — выполнено ТО / положено ТО, где положено = наработка //
+  ANALYTICS_MAINTENANCE_INTERVAL (выполненные сверх нормы не засчитываются).
+
+Группировка: ?group_by=model|engine|transmission|service_company. ?period=month|
+quarter|year добавляет ряд по периодам (отказы, простой, ТО), ?date_after= /
+?date_before= ограничивают рекламации и ТО по дате (MTBF и соблюдение ТО — за всё
+время). Результат кэшируется на версии машин/ТО/рекламаций (versions.py) и роль.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, F, Sum, Value
+from django.db.models.functions import Coalesce, Least, Trunc
+
+from . import versions
+from .models import Machine, Maintenance, Claim
+from .roles import get_user_role, restrict_by_role
+
+GROUPS = {
+    "model": "model_name",
+    "engine": "engine_model",
+    "transmission": "transmission_model",
+    "service_company": "service_company",
+}
+PERIODS = ("month", "quarter", "year")
+
+
+def _round(value, digits=1):
+    return None if value is None else round(value, digits)
+
+
+def machine_stats(machines, field, interval):
+    """Наработка, отказы и соблюдение ТО по группам — один запрос."""
+    hours = Coalesce(F("summary__operating_hours"), Value(0))
+    rows = (
+        machines.order_by()
+        .alias(hours=hours, expected=hours / Value(interval))
+        .values(field)
+        .annotate(
+            machines=Count("id"),
+            operating_hours=Sum("hours"),
+            failures_total=Sum("claims_count"),
+            maintenance_done=Sum(Least("maintenance_count", "expected")),
+            maintenance_expected=Sum("expected"),
+        )
+    )
+    return {row.pop(field): row for row in rows}
+
+
+def claim_stats(claims, field):
+    rows = claims.order_by().values(field).annotate(
+        failures=Count("id"),
+        downtime_total=Coalesce(Sum("downtime_hours"), 0),
+        downtime_mean=Avg("downtime_hours"),
+    )
+    return {row.pop(field): row for row in rows}
+
+
+def node_stats(claims, field):
+    nodes = {}
+    rows = claims.order_by().values_list(field, "failure_node").annotate(n=Count("id"))
+    for key, node, n in rows:
+        nodes.setdefault(key, {})[node or "—"] = n
+    return nodes
+
+
+def period_series(claims, maintenance, field, period):
+    series = {}
+    failures = (claims.order_by().annotate(period=Trunc("failure_date", period))
+                .values_list(field, "period")
+                .annotate(n=Count("id"), downtime=Coalesce(Sum("downtime_hours"), 0)))
+    for key, start, n, downtime in failures:
+        if start is None:
+            continue
+        point = series.setdefault(key, {}).setdefault(start, {"failures": 0, "downtime": 0, "maintenance": 0})
+        point.update(failures=n, downtime=downtime)
+    done = (maintenance.order_by().annotate(period=Trunc("date", period))
+            .values_list(field, "period").annotate(n=Count("id")))
+    for key, start, n in done:
+        if start is None:
+            continue
+        point = series.setdefault(key, {}).setdefault(start, {"failures": 0, "downtime": 0, "maintenance": 0})
+        point["maintenance"] = n
+    return {key: [{"period": start.isoformat(), **point} for start, point in sorted(points.items())]
+            for key, points in series.items()}
+
+
+def _group(key, machine, claims, nodes, series):
+    failures_total = machine.get("failures_total") or 0
+    hours = machine.get("operating_hours") or 0
+    expected = machine.get("maintenance_expected") or 0
+    group = {
+        "key": key,
+        "machines": machine.get("machines", 0),
+        "operating_hours": hours,
+        "mtbf_hours": _round(hours / failures_total) if failures_total else None,
+        "failures": claims.get("failures", 0),
+        "downtime_total": claims.get("downtime_total", 0),
+        "downtime_mean": _round(claims.get("downtime_mean")),
+        "failure_nodes": dict(sorted(nodes.items(), key=lambda item: -item[1])),
+        "maintenance_done": machine.get("maintenance_done") or 0,
+        "maintenance_expected": expected,
+        "maintenance_compliance": _round((machine.get("maintenance_done") or 0) / expected, 3)
+        if expected else None,
+    }
+    if series is not None:
+        group["series"] = series
+    return group
+
+
+def compute(user, group_by="model", period=None, date_after=None, date_before=None):
+    field = GROUPS[group_by]
+    interval = settings.ANALYTICS_MAINTENANCE_INTERVAL
+
+    machines = restrict_by_role(Machine.objects.all(), user)
+    claims = restrict_by_role(Claim.objects.all(), user, "machine__")
+    maintenance = restrict_by_role(Maintenance.objects.all(), user, "machine__")
+    if date_after:
+        claims = claims.filter(failure_date__gte=date_after)
+        maintenance = maintenance.filter(date__gte=date_after)
+    if date_before:
+        claims = claims.filter(failure_date__lte=date_before)
+        maintenance = maintenance.filter(date__lte=date_before)
+
+    related = f"machine__{field}"
+    by_machine = machine_stats(machines, field, interval)
+    by_claims = claim_stats(claims, related)
+    by_node = node_stats(claims, related)
+    by_period = period_series(claims, maintenance, related, period) if period else {}
+
+    keys = sorted(set(by_machine) | set(by_claims), key=lambda k: (k is None, k or ""))
+    groups = [
+        _group(key, by_machine.get(key, {}), by_claims.get(key, {}), by_node.get(key, {}),
+               by_period.get(key, []) if period else None)
+        for key in keys
+    ]
+    return {
+        "group_by": group_by,
+        "period": period,
+        "maintenance_interval": interval,
+        "groups": groups,
+    }
+
+
+def _scope(user):
+    role = get_user_role(user)
+    return "manager:*" if role == "manager" else f"{role}:{user.pk}"
+
+
+def get_analytics(user, **params):
+    current, _ = versions.get([versions.MACHINE, versions.MAINTENANCE, versions.CLAIM])
+    raw = repr((current, _scope(user), sorted(params.items()), settings.ANALYTICS_MAINTENANCE_INTERVAL))
+    key = "analytics:" + hashlib.md5(raw.encode("utf-8"), usedforsecurity=False).hexdigest()
+    result = cache.get(key)
+    if result is None:
+        result = compute(user, **params)
+        cache.set(key, result, timeout=settings.ANALYTICS_CACHE_TTL)
+    return result
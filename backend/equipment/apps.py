@@ -4,3 +4,18 @@ from django.apps import AppConfig
 class EquipmentConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'equipment'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from core.metrics import register_stats
+        from . import authentication, facets, search
+        from .detail_cache import detail_cache
+        from .events import broker
+        from .roles import role_cache
+
+        register_stats("role_cache", role_cache.stats)
+        register_stats("detail_cache", detail_cache.stats)
+        register_stats("events", broker.stats)
+        register_stats("auth", authentication.stats)
+        register_stats("single_flight", lambda: {"facets": facets.flight.stats(),
+                                                 "search": search.flight.stats()})
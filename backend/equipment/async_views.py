@@ -0,0 +1,178 @@
+"""
+Async-версии частых read-эндпоинтов: /api/search, фасеты и /api/me/.
+
+Под ASGI такой view не держит поток на всё время запроса: JWT проверяется без
+БД, пользователь, роль и данные читаются через async ORM. Ответ совпадает
+байт в байт с DRF-версией. Всё, что выходит за обычный JSON-запрос (другой
+формат или Accept, ?fields=/?cursor=, ошибки токена и параметров), передаётся
+синхронному DRF-view через sync_to_async — там и ответы об ошибках, и
+браузерный API остаются прежними.
+
+Какой вариант подключён в urls.py, задаёт ASYNC_READ_VIEWS (для сравнения
+развёртываний командой benchmark_concurrency).
+"""
+import math
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+
+from core.renderers import FastJSONRenderer
+from .authentication import ClaimsJWTAuthentication, amaterialize
+from .facets import aget_all_facets
+from .fieldsets import EXCLUDE_PARAM, EXPAND_PARAM, FIELDS_PARAM
+from .roles import aget_user_role, role_scope
+from .search import flight as search_flight
+from .views import (ClaimViewSet, MachineSearchView, MachineViewSet, MaintenanceViewSet,
+                    facets as sync_facets, me as sync_me)
+
+JSON_MEDIA_RANGES = {"*/*", "application/*", "application/json"}
+
+
+class Fallback(Exception):
+    """Запрос обслуживает синхронный DRF-view."""
+
+
+def _wants_plain_json(request):
+    if request.GET.get(api_settings.URL_FORMAT_OVERRIDE, "json") != "json":
+        return False
+    for media_range in request.headers.get("Accept", "*/*").split(","):
+        media_type, _, params = media_range.strip().partition(";")
+        # indent=, version= и т.п. обрабатывает только DRF-рендерер
+        if media_type.strip() not in JSON_MEDIA_RANGES or (params and "q=" not in params):
+            return False
+    return True
+
+
+async def authenticate(request):
+    """Пользователь по JWT (как ClaimsJWTAuthentication); при любой ошибке — Fallback."""
+    if getattr(request, "_force_auth_user", None) is not None:
+        raise Fallback  # APIClient.force_authenticate() в тестах действует только на DRF
+    auth = ClaimsJWTAuthentication()
+    header = auth.get_header(request)
+    if header is None:
+        return AnonymousUser()
+    raw = auth.get_raw_token(header)
+    if raw is None:
+        raise Fallback
+    try:
+        return await auth.aget_user(auth.get_validated_token(raw))
+    except AuthenticationFailed:  # в т.ч. InvalidToken
+        raise Fallback
+
+
+def _json(data):
+    response = HttpResponse(FastJSONRenderer().render(data, "application/json"),
+                            content_type="application/json")
+    # те же заголовки, что у DRF-ответа
+    response["Vary"] = "Accept"
+    response["Allow"] = "GET, HEAD, OPTIONS"
+    return response
+
+
+def read_view(sync_view, require_auth=False):
+    """async-view: handler(request, user) или sync_view для всего необычного."""
+    def decorator(handler):
+        async def view(request, *args, **kwargs):
+            try:
+                if request.method != "GET" or not _wants_plain_json(request):
+                    raise Fallback
+                user = await authenticate(request)
+                if require_auth and not user.is_authenticated:
+                    raise Fallback
+                await aget_user_role(user)
+                request.user = user
+                return _json(await handler(request, user))
+            except Fallback:
+                return await sync_to_async(sync_view)(request, *args, **kwargs)
+        view.__name__ = view.__qualname__ = handler.__name__
+        view.__doc__ = handler.__doc__
+        return view
+    return decorator
+
+
+def _page_links(request, number, num_pages):
+    url = request.build_absolute_uri()
+    param = PageNumberPagination.page_query_param
+    next_link = replace_query_param(url, param, number + 1) if number < num_pages else None
+    if number <= 1:
+        previous_link = None
+    elif number == 2:
+        previous_link = remove_query_param(url, param)
+    else:
+        previous_link = replace_query_param(url, param, number - 1)
+    return next_link, previous_link
+
+
+@read_view(MachineSearchView.as_view())
+async def search(request, user):
+    """GET /api/search?q=... — как MachineSearchView (PageNumberPagination + ValuesReader)."""
+    params = request.GET
+    q = params.get("q", "").strip()
+    if not q or not getattr(settings, "FAST_READ", True) \
+            or {FIELDS_PARAM, EXCLUDE_PARAM, EXPAND_PARAM, "cursor"} & set(params):
+        raise Fallback
+    page = params.get(PageNumberPagination.page_query_param, "1")
+    if not page.isdigit() or int(page) < 1:
+        raise Fallback
+    number = int(page)
+    key = ("search", role_scope(user), request.build_absolute_uri())  # как в MachineSearchView.list
+    return await search_flight.ado(key, lambda: _search_page(request, user, number))
+
+
+async def _search_page(request, user, number):
+    view = MachineSearchView()
+    view.request = Request(request)
+    view.request.user = user
+    serializer_class = view.get_serializer_class()
+    reader = view.fast_readers[serializer_class]
+    qs = view.get_queryset()  # без запросов: роль уже известна
+
+    page_size = api_settings.PAGE_SIZE
+    count = await qs.acount()
+    num_pages = max(1, math.ceil(count / page_size))
+    if number > num_pages:
+        raise Fallback  # 404 «Неверная страница» — как у DRF
+    offset = (number - 1) * page_size
+    rows = [row async for row in reader.values(qs)[offset:offset + page_size]]
+    next_link, previous_link = _page_links(request, number, num_pages)
+    return {"count": count, "next": next_link, "previous": previous_link,
+            "results": reader.rows(rows)}
+
+
+@read_view(sync_me, require_auth=True)
+async def me(request, user):
+    """GET /api/me/"""
+    user = await amaterialize(user)
+    return {
+        "id": user.id,
+        "username": user.username,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "is_staff": user.is_staff,
+        "groups": [name async for name in user.groups.values_list("name", flat=True)],
+    }
+
+
+@read_view(sync_facets)
+async def facets(request, user):
+    """GET /api/facets/"""
+    return await aget_all_facets(user)
+
+
+def _section_view(section, viewset):
+    @read_view(viewset.as_view({"get": "facets"}))
+    async def section_facets(request, user):
+        return (await aget_all_facets(user, sections=(section,)))[section]
+    return section_facets
+
+
+machine_facets = _section_view("machines", MachineViewSet)
+maintenance_facets = _section_view("maintenance", MaintenanceViewSet)
+claim_facets = _section_view("claims", ClaimViewSet)
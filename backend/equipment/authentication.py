@@ -0,0 +1,290 @@
+"""
+JWT-аутентификация без чтения пользователя из БД на каждый запрос.
+
+При выдаче токена (/api/auth/token/, /api/auth/token/refresh/) в него подписанными
+claims кладутся имя, роль, id групп, is_staff/is_superuser и две версии
+пользователя из ChangeVersion: claims_version меняется при изменении учётной
+записи, её групп или прав (signals.py), tokens_version — при отзыве токенов
+(revoke(), команда revoke_tokens).
+
+ClaimsJWTAuthentication проверяет подпись и сверяет версии через процессный кэш
+(JWT_REVOCATION_WINDOW секунд, промах — один запрос). request.user — ClaimsUser:
+id, роль (roles.get_user_role()) и права моделей (кэш прав групп на
+PERMISSION_CACHE_TTL секунд) есть сразу, строка User читается только при
+обращении к остальным полям (first_name, groups, ...).
+
+Токен с устаревшими claims отклоняется (401 token_not_valid): клиент обновляет
+access-токен и получает новые claims, а отозванный refresh-токен не обновляется.
+Другие процессы видят изменение не позже чем через JWT_REVOCATION_WINDOW, права
+групп — через PERMISSION_CACHE_TTL. Токены без claims (выданные до их появления)
+проверяются как раньше, с чтением пользователя.
+"""
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.utils.functional import SimpleLazyObject, empty
+from rest_framework_simplejwt import serializers
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import Token
+
+from core.db import routing
+
+from . import versions
+from .models import ChangeVersion
+from .roles import _MISSING, _USER_ATTR, TTLCache, role_from_groups
+
+CLAIMS_VERSION = "claims_version"
+TOKENS_VERSION = "tokens_version"
+STREAM_EXP = "stream_exp"
+
+version_cache = TTLCache("JWT_REVOCATION_WINDOW", 30)
+permission_cache = TTLCache("PERMISSION_CACHE_TTL", 300)
+_counts = {"claims": 0, "legacy": 0, "rejected": 0, "materialized": 0}
+
+
+def _keys(user_id):
+    return [versions.user_claims_key(user_id), versions.user_tokens_key(user_id)]
+
+
+def user_versions(user_id):
+    """(claims_version, tokens_version) пользователя через процессный кэш."""
+    current = version_cache.get(user_id)
+    if current is _MISSING:
+        current, _ = versions.get(_keys(user_id))
+        version_cache.set(user_id, current)
+    return current
+
+
+async def auser_versions(user_id):
+    current = version_cache.get(user_id)
+    if current is _MISSING:
+        keys = _keys(user_id)
+        rows = {key: version async for key, version in
+                ChangeVersion.objects.filter(key__in=keys).values_list("key", "version")}
+        current = tuple(rows.get(key, 0) for key in keys)
+        version_cache.set(user_id, current)
+    return current
+
+
+def changed(user_ids):
+    """Claims пользователей устарели: группы, права или учётная запись изменились."""
+    user_ids = list(user_ids)
+    if user_ids:
+        versions.bump(versions.user_claims_key(pk) for pk in user_ids)
+        version_cache.invalidate(user_ids)
+
+
+def revoke(user_ids):
+    """Отзывает все выданные пользователям токены, включая refresh."""
+    user_ids = list(user_ids)
+    if user_ids:
+        versions.bump(versions.user_tokens_key(pk) for pk in user_ids)
+        version_cache.invalidate(user_ids)
+
+
+def group_permissions(group_ids):
+    """Права групп ("app_label.codename") через процессный кэш."""
+    key = tuple(group_ids)
+    if not key:
+        return frozenset()
+    perms = permission_cache.get(key)
+    if perms is _MISSING:
+        perms = frozenset(
+            f"{app_label}.{codename}" for app_label, codename in
+            Permission.objects.filter(group__in=key).values_list("content_type__app_label", "codename"))
+        permission_cache.set(key, perms)
+    return perms
+
+
+def add_claims(token, user):
+    # версии читаются раньше групп: если группы изменятся между запросами,
+    # токен получит старую версию и будет отклонён, а не наоборот
+    token[CLAIMS_VERSION], token[TOKENS_VERSION] = versions.get(_keys(user.pk))[0]
+    groups = list(user.groups.values_list("id", "name"))
+    token["username"] = user.get_username()
+    token["role"] = role_from_groups({name for _, name in groups}, user.is_superuser)
+    token["groups"] = sorted(pk for pk, _ in groups)
+    token["is_staff"] = user.is_staff
+    token["is_superuser"] = user.is_superuser
+    token["own_perms"] = user.user_permissions.exists()
+    return token
+
+
+def _load_user(user_id):
+    _counts["materialized"] += 1
+    return get_user_model().objects.get(pk=user_id)
+
+
+class ClaimsUser(SimpleLazyObject):
+    """request.user из claims токена; строка User читается при обращении к остальным полям."""
+    is_active = True
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, token):
+        user_id = token[api_settings.USER_ID_CLAIM]
+        super().__init__(lambda: _load_user(user_id))
+        # мимо __setattr__ ленивого объекта, чтобы не читать пользователя
+        self.__dict__.update({
+            "pk": user_id,
+            "id": user_id,
+            "username": token["username"],
+            "is_staff": token["is_staff"],
+            "is_superuser": token["is_superuser"],
+            "group_ids": token["groups"],
+            "own_perms": token["own_perms"],
+            _USER_ATTR: token["role"],
+        })
+
+    # без чтения строки: DRF проверяет `not request.user`, кэши сравнивают пользователей
+    def __bool__(self):
+        return True
+
+    def __eq__(self, other):
+        if type(other) is ClaimsUser or isinstance(other, get_user_model()):
+            return other.pk == self.pk
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    def get_username(self):
+        return self.username
+
+    def has_perm(self, perm, obj=None):
+        if self.is_superuser:
+            return True
+        if obj is not None or self.own_perms:
+            return self._user().has_perm(perm, obj)
+        return perm in group_permissions(self.group_ids)
+
+    def has_perms(self, perm_list, obj=None):
+        return all(self.has_perm(perm, obj) for perm in perm_list)
+
+    def _user(self):
+        if self._wrapped is empty:
+            self._setup()
+        return self._wrapped
+
+
+def _user_id(token):
+    try:
+        return token[api_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken("В токене нет идентификатора пользователя.")
+
+
+async def amaterialize(user):
+    """Полный User для async-кода: ClaimsUser читает свою строку лениво и только синхронно."""
+    if type(user) is ClaimsUser and user._wrapped is empty:
+        _counts["materialized"] += 1
+        user._wrapped = await get_user_model().objects.aget(pk=user.pk)
+    return user
+
+
+async def atoken_current(token):
+    """
+    Принимается ли токен по-прежнему (для долгих соединений, /api/events/): не отозван
+    и claims не устарели. У токена без claims сверять нечего — его ограничивает срок.
+    """
+    if CLAIMS_VERSION not in token:
+        return True
+    current = await auser_versions(_user_id(token))
+    return (token[CLAIMS_VERSION], token.get(TOKENS_VERSION)) == tuple(current)
+
+
+class EventsTicket(Token):
+    """
+    Билет на поток /api/events/?ticket=...: EventSource не передаёт заголовки, а
+    access-токен в URL остался бы в журналах прокси и сервера. Билет живёт
+    EVENTS_TICKET_LIFETIME секунд, годится только для открытия потока (не
+    access-токен) и несёт claims access-токена, из которого выдан; поток живёт
+    до срока этого токена (STREAM_EXP).
+    """
+    token_type = "events_ticket"
+    _copied = (api_settings.TOKEN_TYPE_CLAIM, "exp", "iat", api_settings.JTI_CLAIM)
+
+    @property
+    def lifetime(self):
+        return timedelta(seconds=settings.EVENTS_TICKET_LIFETIME)
+
+    @classmethod
+    def for_access(cls, access):
+        ticket = cls()
+        for claim, value in access.payload.items():
+            if claim not in cls._copied:
+                ticket[claim] = value
+        ticket[STREAM_EXP] = access["exp"]
+        return ticket
+
+
+def _check(token, current):
+    if (token[CLAIMS_VERSION], token.get(TOKENS_VERSION)) != tuple(current):
+        _counts["rejected"] += 1
+        raise InvalidToken("Токен устарел или отозван, обновите его.")
+    _counts["claims"] += 1
+    return ClaimsUser(token)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication, которому для токена с claims не нужна строка User."""
+
+    def get_user(self, validated_token):
+        # пользователь известен до первого чтения: недавно писавший читает с основной базы
+        routing.identify(_user_id(validated_token))
+        if CLAIMS_VERSION not in validated_token:
+            _counts["legacy"] += 1
+            return super().get_user(validated_token)
+        return _check(validated_token, user_versions(_user_id(validated_token)))
+
+    async def aget_user(self, validated_token):
+        await routing.aidentify(_user_id(validated_token))
+        if CLAIMS_VERSION not in validated_token:
+            _counts["legacy"] += 1
+            return await sync_to_async(super().get_user)(validated_token)
+        return _check(validated_token, await auser_versions(_user_id(validated_token)))
+
+
+class TokenObtainPairSerializer(serializers.TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        # access-токен копирует claims из refresh-токена
+        return add_claims(super().get_token(user), user)
+
+
+class TokenRefreshSerializer(serializers.TokenRefreshSerializer):
+    """Новый access-токен со свежими claims; отозванный refresh-токен не принимается."""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        user = get_user_model().objects.filter(
+            **{api_settings.USER_ID_FIELD: refresh.payload.get(api_settings.USER_ID_CLAIM)}).first()
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages["no_active_account"], "no_active_account")
+        access = add_claims(refresh.access_token, user)
+        if refresh.get(TOKENS_VERSION, access[TOKENS_VERSION]) != access[TOKENS_VERSION]:
+            raise InvalidToken("Токен отозван.")
+        data = {"access": str(access)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            add_claims(refresh, user)
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data["refresh"] = str(refresh)
+        return data
+
+
+def stats():
+    return {**_counts, "versions": version_cache.stats(), "permissions": permission_cache.stats()}
+
+
+def reset_stats():
+    for key in _counts:
+        _counts[key] = 0
+    version_cache.reset_stats()
+    permission_cache.reset_stats()
@@ -0,0 +1,274 @@
+"""
+Воспроизводимый бенчмарк API (команда benchmark_api).
+
+Прогоняет эндпоинты из config/urls.py через тестовый клиент DRF под каждой
+ролью (с access-токеном роли, как настоящий клиент) и для каждой пары
+«сценарий / роль» считает p50/p95 времени ответа, число SQL-запросов на всех
+базах (основная и реплики), пиковую память (tracemalloc) и размер ответа.
+Результат сохраняется в JSON и сравнивается с ранее сохранённым базовым замером.
+
+Импорт прогоняется с dry_run=1 на файле из выгрузки тех же данных, поэтому
+данные не меняются. Не прогоняются: создание и изменение записей (меняют данные),
+выдача токена по паролю (меряет хэширование пароля), поток /api/events/ (не
+заканчивается, для него — loadtest_events), админка и документация API. Данные для замера
+готовит generate_fleet.
+"""
+import json
+import logging
+import time
+import tracemalloc
+from contextlib import ExitStack
+from datetime import datetime
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core.db import routing
+from core.metrics import percentile
+
+from . import authentication, export, facets, search
+from .detail_cache import detail_cache
+from .models import Machine, Maintenance, Claim
+from .roles import CLIENT_GROUP, MANAGER_GROUP, SERVICE_GROUP, restrict_by_role, role_cache
+
+ROLES = ("anonymous", "client", "service", "manager")
+ROLE_GROUPS = {"client": CLIENT_GROUP, "service": SERVICE_GROUP, "manager": MANAGER_GROUP}
+
+# Строк в файле импорта (из выгрузки видимых роли данных)
+IMPORT_ROWS = 200
+
+# имя сценария -> шаблон пути GET-запроса или (метод, шаблон пути, тело из payload());
+# {machine}, {maintenance}, {claim}, {serial} берутся из fixtures()
+SCENARIOS = {
+    "health": "/api/health",
+    "metrics": "/api/metrics",
+    "me": "/api/me/",
+    "token-refresh": ("POST", "/api/auth/token/refresh/", "refresh"),
+    "token-verify": ("POST", "/api/auth/token/verify/", "access"),
+    "events-ticket": ("POST", "/api/events/ticket/", None),
+    "sync-full": "/api/sync/?since=0",
+    "facets": "/api/facets/",
+    "analytics": "/api/analytics/?period=quarter",
+    "machines-list": "/api/machines/",
+    "machines-cursor": "/api/machines/?cursor=",
+    "machines-detail": "/api/machines/{machine}/",
+    "machines-maintenance": "/api/machines/{machine}/maintenance/",
+    "machines-claims": "/api/machines/{machine}/claims/",
+    "machines-facets": "/api/machines/facets/",
+    "machines-export": "/api/machines/export/?file_format=csv",
+    "machines-export-xlsx": "/api/machines/export/?file_format=xlsx",
+    "machines-import": ("POST", "/api/machines/import/?dry_run=1", "import:machines"),
+    "maintenance-types": "/api/maintenance-types/",
+    "maintenance-list": "/api/maintenance/",
+    "maintenance-detail": "/api/maintenance/{maintenance}/",
+    "maintenance-facets": "/api/maintenance/facets/",
+    "maintenance-export": "/api/maintenance/export/?file_format=csv",
+    "maintenance-export-xlsx": "/api/maintenance/export/?file_format=xlsx",
+    "maintenance-import": ("POST", "/api/maintenance/import/?dry_run=1", "import:maintenance"),
+    "claims-list": "/api/claims/",
+    "claims-detail": "/api/claims/{claim}/",
+    "claims-facets": "/api/claims/facets/",
+    "claims-export": "/api/claims/export/?file_format=csv",
+    "claims-export-xlsx": "/api/claims/export/?file_format=xlsx",
+    "claims-import": ("POST", "/api/claims/import/?dry_run=1", "import:claims"),
+    "search-serial": "/api/search?q={serial}",
+    "search-text": "/api/search?q=Москва",
+}
+
+
+def bench_user(role):
+    """Пользователь роли: bench_* из generate_fleet, иначе первый пользователь группы."""
+    if role == "anonymous":
+        return AnonymousUser()
+    users = User.objects.filter(groups__name=ROLE_GROUPS[role]).order_by("pk")
+    return users.filter(username__startswith="bench_").first() or users.first()
+
+
+def fixtures(user):
+    """Id объектов, видимых пользователю, для подстановки в пути сценариев."""
+    if user.is_anonymous:
+        # аноним видит только поиск по серийному номеру
+        serial = Machine.objects.order_by("pk").values_list("serial_number", flat=True).first()
+        return {"serial": serial[:4]} if serial else None
+    machine = (restrict_by_role(Machine.objects.all(), user)
+               .order_by("pk").values_list("pk", "serial_number").first())
+    if machine is None:
+        return None
+    return {
+        "machine": machine[0],
+        "serial": machine[1][:4],
+        "maintenance": Maintenance.objects.filter(machine_id=machine[0]).values_list("pk", flat=True).first(),
+        "claim": Claim.objects.filter(machine_id=machine[0]).values_list("pk", flat=True).first(),
+    }
+
+
+IMPORTS = {
+    "machines": (Machine, export.MACHINE_COLUMNS, ""),
+    "maintenance": (Maintenance, export.MAINTENANCE_COLUMNS, "machine__"),
+    "claims": (Claim, export.CLAIM_COLUMNS, "machine__"),
+}
+
+
+def payloads(user):
+    """Тела POST-запросов: токены пользователя и файлы импорта из выгрузки его данных."""
+    if user.is_anonymous:
+        return {}
+    refresh = authentication.add_claims(RefreshToken.for_user(user), user)
+    result = {"refresh": {"refresh": str(refresh)},
+              "access": {"token": str(authentication.add_claims(refresh.access_token, user))}}
+    for kind, (model, columns, prefix) in IMPORTS.items():
+        queryset = restrict_by_role(model.objects.order_by("pk"), user, prefix)[:IMPORT_ROWS]
+        result[f"import:{kind}"] = b"".join(export.iter_csv(queryset, columns))
+    return result
+
+
+def reset_caches():
+    """Все кэши процесса и общий кэш: каждый запрос --cold начинается с нуля."""
+    cache.clear()
+    detail_cache.clear()
+    role_cache.invalidate()
+    authentication.version_cache.invalidate()
+    authentication.permission_cache.invalidate()
+    search.flight.clear()
+    facets.flight.clear()
+    facets.version_flight.clear()
+
+
+def _request(client, path, method="GET", body=None):
+    if method == "GET":
+        response = client.get(path)
+    elif isinstance(body, bytes):
+        response = client.post(path, {"file": SimpleUploadedFile("rows.csv", body)}, format="multipart")
+    else:
+        response = client.post(path, body, format="json")
+    if response.streaming:
+        size = sum(len(chunk) for chunk in response.streaming_content)
+    else:
+        size = len(response.content)
+    return response.status_code, size
+
+
+def _count_queries():
+    """Контекст, считающий SQL-запросы на основной базе и всех репликах."""
+    stack = ExitStack()
+    aliases = [DEFAULT_DB_ALIAS, *routing.replicas()]
+    captured = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in aliases]
+    return stack, captured
+
+
+def measure(client, path, repeat=20, warmup=2, cold=False, method="GET", body=None):
+    for _ in range(warmup):
+        _request(client, path, method, body)
+
+    timings, queries = [], []
+    status = size = None
+    for _ in range(repeat):
+        if cold:
+            reset_caches()
+        stack, captured = _count_queries()
+        with stack:
+            started = time.perf_counter()
+            status, size = _request(client, path, method, body)
+            timings.append((time.perf_counter() - started) * 1000)
+        queries.append(sum(len(c.captured_queries) for c in captured))
+
+    if cold:
+        reset_caches()
+    tracemalloc.start()
+    try:
+        _request(client, path, method, body)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "status": status,
+        "p50_ms": round(percentile(timings, 50), 2),
+        "p95_ms": round(percentile(timings, 95), 2),
+        "queries": max(queries),
+        "peak_kb": round(peak / 1024, 1),
+        "bytes": size,
+    }
+
+
+def run(roles=ROLES, scenarios=None, repeat=20, warmup=2, cold=False):
+    """Прогон сценариев; ключ результата — «сценарий [роль]»."""
+    names = scenarios or list(SCENARIOS)
+    results = {}
+    # 401/404 ожидаемы для части ролей — не засоряем вывод предупреждениями
+    request_logger = logging.getLogger("django.request")
+    level = request_logger.level
+    request_logger.setLevel(logging.ERROR)
+    try:
+        for role in roles:
+            _run_role(role, names, results, repeat, warmup, cold)
+    finally:
+        request_logger.setLevel(level)
+    return results
+
+
+def _run_role(role, names, results, repeat, warmup, cold):
+    user = bench_user(role)
+    if user is None:
+        return
+    ids = fixtures(user) or {}
+    bodies = payloads(user)
+    client = APIClient(SERVER_NAME="localhost")
+    if not user.is_anonymous:
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {bodies['access']['token']}")
+    for name in names:
+        scenario = SCENARIOS[name]
+        method, template, body = ("GET", scenario, None) if isinstance(scenario, str) else scenario
+        try:
+            path = template.format(**ids)
+        except KeyError:
+            continue  # у роли нет подходящих объектов
+        if "None" in path or (body is not None and body not in bodies):
+            continue
+        results[f"{name} [{role}]"] = measure(
+            client, path, repeat, warmup, cold, method, bodies.get(body))
+
+
+def dataset():
+    return {
+        "machines": Machine.objects.count(),
+        "maintenance": Maintenance.objects.count(),
+        "claims": Claim.objects.count(),
+        "vendor": connection.vendor,
+    }
+
+
+def save(path, results, **meta):
+    payload = {
+        "meta": {"created": datetime.now().isoformat(timespec="seconds"), **dataset(), **meta},
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(baseline, results, tolerance=0.2):
+    """
+    Сравнение с базовым замером. Регрессия — рост p95 больше чем на tolerance
+    (доля) или любой рост числа запросов. Возвращает список строк-отчётов
+    (ключ, было, стало, регрессия).
+    """
+    rows = []
+    for key, current in results.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        slower = current["p95_ms"] > before["p95_ms"] * (1 + tolerance)
+        more_queries = current["queries"] > before["queries"]
+        rows.append((key, before, current, slower or more_queries))
+    return rows
@@ -0,0 +1,78 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from rest_framework import status
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.response import Response
+
+from .signals import bulk_created
+
+
+class BulkCreateMixin:
+    """
+    POST со списком объектов вместо одного объекта — пакетное создание:
+    все связанные машины (и справочники из bulk_prefetch) загружаются одним
+    запросом на поле, права проверяются по уже загруженным машинам, корректные
+    записи вставляются одним bulk_create в одной транзакции. В ответе — результат
+    по каждому элементу в исходном порядке.
+    """
+    bulk_max_items = 1000
+    # поле сериализатора -> queryset, из которого объекты берутся через in_bulk()
+    bulk_prefetch = {}
+    # обязательно: имя метода view, который проверяет право создать запись для
+    # машины и бросает PermissionDenied (тот же, что вызывает perform_create)
+    bulk_machine_check = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if not callable(getattr(cls, cls.bulk_machine_check or "", None)):
+            raise ImproperlyConfigured(
+                f"{cls.__name__}: bulk_machine_check должен называть метод проверки прав")
+
+    def create(self, request, *args, **kwargs):
+        if isinstance(request.data, list):
+            return self.bulk_create(request.data)
+        return super().create(request, *args, **kwargs)
+
+    def _prefetch(self, items):
+        prefetched = {}
+        for field, queryset in self.bulk_prefetch.items():
+            ids = set()
+            for item in items:
+                value = item.get(field) if isinstance(item, dict) else None
+                if isinstance(value, (int, str)) and not isinstance(value, bool) and str(value).isdigit():
+                    ids.add(int(value))
+            prefetched[field] = queryset.in_bulk(ids)
+        return prefetched
+
+    def bulk_create(self, items):
+        if not items:
+            raise ValidationError("Пустой список.")
+        if len(items) > self.bulk_max_items:
+            raise ValidationError(f"Не больше {self.bulk_max_items} записей за запрос.")
+
+        context = {**self.get_serializer_context(), "prefetched": self._prefetch(items)}
+        results, valid = [None] * len(items), []
+        for index, item in enumerate(items):
+            serializer = self.get_serializer(data=item, context=context)
+            if not serializer.is_valid():
+                results[index] = {"index": index, "status": 400, "errors": serializer.errors}
+                continue
+            try:
+                getattr(self, self.bulk_machine_check)(serializer.validated_data["machine"])
+            except PermissionDenied as e:
+                results[index] = {"index": index, "status": 403, "errors": {"detail": e.detail}}
+                continue
+            valid.append((index, serializer))
+
+        if valid:
+            model = self.get_serializer_class().Meta.model
+            objects = [model(**serializer.validated_data) for _, serializer in valid]
+            with transaction.atomic():
+                model.objects.bulk_create(objects)
+                bulk_created.send(sender=model, objects=objects)
+            for (index, serializer), obj in zip(valid, objects):
+                serializer.instance = obj
+                results[index] = {"index": index, "status": 201, "data": serializer.data}
+
+        code = status.HTTP_201_CREATED if len(valid) == len(items) else status.HTTP_207_MULTI_STATUS
+        return Response(results, status=code)
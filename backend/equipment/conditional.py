@@ -0,0 +1,59 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+from . import versions
+from .roles import get_user_role
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified для list и retrieve по версиям из versions.py.
+
+    Валидатор считается до get_queryset(): если версии не изменились, ответ 304
+    отдаётся без запросов к данным, Prefetch-ей и сериализаторов. В ETag входят
+    версии, роль и пользователь, полный URL с параметрами и формат ответа.
+    """
+    # action -> ключи таблиц, от которых зависит ответ
+    version_keys = {}
+
+    def get_version_keys(self):
+        return list(self.version_keys.get(self.action, ()))
+
+    def _validators(self, request):
+        keys = self.get_version_keys()
+        if not keys:
+            return None, None
+        current, last_modified = versions.get_for_view(self, keys)
+        user = request.user
+        role = get_user_role(user)
+        scope = "*" if role == "manager" else user.pk
+        raw = repr((keys, current, role, scope, request.get_full_path(),
+                    request.accepted_renderer.format))
+        etag = '"%s"' % hashlib.md5(raw.encode("utf-8"), usedforsecurity=False).hexdigest()
+        return etag, last_modified
+
+    def _conditional(self, handler, request, *args, **kwargs):
+        etag, last_modified = self._validators(request)
+        if etag is None:
+            return handler(request, *args, **kwargs)
+        timestamp = last_modified.timestamp() if last_modified else None
+
+        response = get_conditional_response(request._request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response["ETag"] = etag
+        if timestamp is not None:
+            response["Last-Modified"] = http_date(timestamp)
+        response["Cache-Control"] = "private, no-cache"
+        patch_vary_headers(response, ["Authorization"])
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional(super().retrieve, request, *args, **kwargs)
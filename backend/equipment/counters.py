@@ -0,0 +1,64 @@
+"""
+Денормализованные счётчики ТО и рекламаций на машине.
+
+Machine.maintenance_count / Machine.claims_count увеличиваются в той же транзакции,
+что и вставка записи (Maintenance.save / Claim.save), и уменьшаются в post_delete,
+который Django отправляет внутри транзакции удаления. Если счётчики разошлись
+с данными (raw SQL, ручные правки в БД), их пересчитывает команда
+rebuild_machine_counters.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTER_FIELDS = {
+    "maintenance": "maintenance_count",
+    "claim": "claims_count",
+}
+
+
+def _machine_model():
+    from .models import Machine
+    return Machine
+
+
+def adjust(machine_id, counter, delta):
+    """Атомарно прибавляет delta к счётчику одной машины."""
+    _machine_model().objects.filter(pk=machine_id).update(**{counter: F(counter) + delta})
+
+
+def adjust_many(counter, deltas):
+    """deltas: {machine_id: delta}; одна UPDATE на каждое уникальное значение delta."""
+    by_delta = {}
+    for machine_id, delta in deltas.items():
+        if delta:
+            by_delta.setdefault(delta, []).append(machine_id)
+    Machine = _machine_model()
+    for delta, ids in by_delta.items():
+        Machine.objects.filter(pk__in=ids).update(**{counter: F(counter) + delta})
+
+
+def count_subquery(model, field="machine"):
+    """Коррелированный подзапрос COUNT(*) по машине — без JOIN-а и размножения строк."""
+    counts = (model.objects.filter(**{field: OuterRef("pk")})
+              .order_by().values(field).annotate(n=Count("*")).values("n"))
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def rebuild(queryset=None):
+    """Пересчитывает счётчики (по всем машинам или по queryset); возвращает число исправленных."""
+    from .models import Maintenance, Claim
+
+    Machine = _machine_model()
+    queryset = Machine.objects.all() if queryset is None else queryset
+    stale = queryset.annotate(
+        actual_maintenance=count_subquery(Maintenance),
+        actual_claims=count_subquery(Claim),
+    ).exclude(
+        maintenance_count=F("actual_maintenance"), claims_count=F("actual_claims"),
+    ).values_list("pk", "actual_maintenance", "actual_claims")
+
+    fixed = 0
+    for pk, maintenance, claims in stale.iterator(chunk_size=2000):
+        Machine.objects.filter(pk=pk).update(maintenance_count=maintenance, claims_count=claims)
+        fixed += 1
+    return fixed
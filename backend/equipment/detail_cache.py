@@ -0,0 +1,149 @@
+"""
+Кэш готовых ответов карточки машины (MachineViewSet.retrieve).
+
+Ключ: id машины + класс сериализатора + версия машины + версия справочника видов ТО
+(versions.py) + набор полей (?fields= / ?exclude= / ?expand=, fieldsets.py). Любая запись машины, её ТО или рекламаций меняет версию, поэтому
+старые записи не удаляются явно, а просто перестают запрашиваться и вытесняются
+по LRU. Первый уровень — LRU в памяти процесса, второй (необязательный) — общий
+бэкенд Django cache (DETAIL_CACHE_ALIAS), общий для всех воркеров.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.http import Http404
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from . import versions
+from .models import Machine
+
+_MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is not _MISSING:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DetailCache:
+    def __init__(self, maxsize, alias=None, timeout=None):
+        self.local = LRUCache(maxsize)
+        self.alias = alias
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @property
+    def shared(self):
+        return caches[self.alias] if self.alias else None
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not _MISSING:
+            self._count("local_hits")
+            return value
+        if self.shared is not None:
+            value = self.shared.get(key, _MISSING)
+            if value is not _MISSING:
+                self.local.set(key, value)
+                self._count("shared_hits")
+                return value
+        self._count("misses")
+        return _MISSING
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value, timeout=self.timeout)
+
+    def clear(self):
+        self.local.clear()
+        with self._lock:
+            self.local_hits = self.shared_hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            hits = self.local_hits + self.shared_hits
+            total = hits + self.misses
+            return {
+                "size": len(self.local),
+                "local_hits": self.local_hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+            }
+
+
+detail_cache = DetailCache(
+    maxsize=getattr(settings, "DETAIL_CACHE_SIZE", 512),
+    alias=getattr(settings, "DETAIL_CACHE_ALIAS", None) or None,
+    timeout=getattr(settings, "DETAIL_CACHE_TTL", 3600),
+)
+
+
+class DetailCacheMixin:
+    """
+    retrieve() карточки машины из кэша detail_cache. Доступ к машине проверяется
+    отдельным дешёвым exists() с тем же ограничением по роли, что и в get_queryset().
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        # одна запись pk на машину: иначе у "01" и "1" были бы разные ключи кэша,
+        # а версия сбрасывается только у machine:<int pk>
+        try:
+            pk = int(self.kwargs[self.lookup_field])
+        except ValueError:
+            raise Http404
+        serializer_class = self.get_serializer_class()
+        # Версии читаются до построения ответа: более свежие данные под старым ключом
+        # безвредны, а старые под новым — нет.
+        current, _ = versions.get_for_view(
+            self, [versions.machine_key(pk), versions.MAINTENANCE_TYPE])
+        key = f"machine-detail:{pk}:{serializer_class.__name__}:{current[0]}:{current[1]}"
+        if hasattr(self, "get_fieldset") and not self.get_fieldset().is_default:
+            key += ":" + hashlib.md5(self.get_fieldset().cache_key.encode("utf-8"),
+                                     usedforsecurity=False).hexdigest()
+
+        data = detail_cache.get(key)
+        if data is not _MISSING:
+            if not self._restrict_by_role(Machine.objects.filter(pk=pk)).exists():
+                return super().retrieve(request, *args, **kwargs)  # отдаст 404
+            return Response(data)
+
+        response = super().retrieve(request, *args, **kwargs)
+        if response.status_code == 200:
+            detail_cache.set(key, dict(response.data))
+        return response
@@ -0,0 +1,229 @@
+"""
+Поток изменений для дашборда: GET /api/events/ (server-sent events).
+
+Записи машин, ТО и рекламаций после коммита транзакции (transaction.on_commit
+в signals.py) публикуются в брокер этого процесса, брокер раскладывает событие
+по очередям подписчиков, которым оно видно по роли. Событие несёт только тип
+записи, id, машину и номер изменения (change_seq, см. sync.py) — данные клиент
+запрашивает сам. Номер уходит в поле id: после переподключения клиент может
+догнать пропущенное через /api/sync/?since=<Last-Event-ID>.
+
+Брокер живёт в памяти процесса: поток работает только под ASGI (config/asgi.py)
+и видит записи, сделанные этим же процессом. Медленный подписчик, очередь
+которого переполнилась, получает событие reset и отключается — ему нужно
+перечитать данные. Статистика (соединения, задержка раздачи) — в /api/metrics.
+
+Поток живёт не дольше access-токена, которым открыт, и раз в heartbeat
+проверяет, что токен не отозван и claims (роль, группы) не устарели. Иначе
+клиент получает событие expired, поток закрывается, и клиент переподключается
+с обновлённым токеном.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+from core.metrics import percentile
+
+LATENCY_WINDOW = 1000
+RESET = object()
+EXPIRED = "event: expired\ndata: {}\n\n"
+
+
+class Subscription:
+    def __init__(self, accepts, loop, queue_size):
+        self.accepts = accepts
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def offer(self, event):
+        # вызывается в цикле событий подписчика
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESET)
+
+    async def get(self, timeout):
+        """Следующее событие или None, если за timeout секунд ничего не пришло."""
+        try:
+            # без ожидания (и без задачи wait_for), если события уже в очереди
+            return self.queue.get_nowait()
+        except asyncio.QueueEmpty:
+            pass
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+def _offer_all(subscriptions, event):
+    for subscription in subscriptions:
+        subscription.offer(event)
+
+
+class Broker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self.peak = 0
+        self.published = 0
+        self.delivered = 0
+        self.overflows = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    @property
+    def connections(self):
+        return len(self._subscribers)
+
+    def subscribe(self, accepts, queue_size=None):
+        """Подписка в текущем цикле событий; accepts(event) — фильтр по роли."""
+        if queue_size is None:
+            queue_size = settings.EVENTS_QUEUE_SIZE
+        subscription = Subscription(accepts, asyncio.get_running_loop(), queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+            self.peak = max(self.peak, len(self._subscribers))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+            if subscription.overflowed:
+                self.overflows += 1
+
+    def publish(self, event):
+        """Из любого потока; event — словарь с ключами client/service_org для фильтра."""
+        event["published"] = time.perf_counter()
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self.published += 1
+        # одно пробуждение на цикл событий, а не на каждого подписчика
+        by_loop = {}
+        for subscription in subscribers:
+            if subscription.accepts(event):
+                by_loop.setdefault(subscription.loop, []).append(subscription)
+        for loop, targets in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_offer_all, targets, event)
+            except RuntimeError:
+                # цикл уже закрыт, подписки снимутся в finally потоков
+                pass
+
+    def delivered_one(self, event):
+        self.delivered += 1
+        self.latencies.append((time.perf_counter() - event["published"]) * 1000)
+
+    def stats(self):
+        return {
+            "connections": self.connections,
+            "connections_peak": self.peak,
+            "published": self.published,
+            "delivered": self.delivered,
+            "overflows": self.overflows,
+            "fanout_ms_p50": round(percentile(self.latencies, 50), 3),
+            "fanout_ms_p95": round(percentile(self.latencies, 95), 3),
+        }
+
+    def reset_stats(self):
+        with self._lock:
+            self.peak = len(self._subscribers)
+            self.published = self.delivered = self.overflows = 0
+            self.latencies.clear()
+
+
+broker = Broker()
+
+
+def event_for(kind, instance, machine, deleted=False):
+    return {
+        "model": kind,
+        "id": instance.pk,
+        "op": "delete" if deleted else "upsert",
+        "machine": machine.pk,
+        "seq": None if deleted else instance.change_seq,
+        "client": machine.client_id,
+        "service_org": machine.service_org_id,
+    }
+
+
+def lost_access_event(kind, pk, machine_id, client_id, service_org_id):
+    """
+    Удаление для прежних владельцев машины, сменившей клиента или сервисную
+    организацию: запись у них осталась, но больше им не видна (как надгробия
+    sync.machine_owners_changed). Менеджер такие события не получает.
+    """
+    return {
+        "model": kind,
+        "id": pk,
+        "op": "delete",
+        "machine": machine_id,
+        "seq": None,
+        "client": client_id,
+        "service_org": service_org_id,
+        "lost_access": True,
+    }
+
+
+def accepts_for(role, user_id):
+    """Фильтр событий по роли — то же правило, что restrict_by_role()."""
+    if role == "manager":
+        return lambda event: not event.get("lost_access")
+    if role == "service":
+        return lambda event: event["service_org"] == user_id
+    if role == "client":
+        return lambda event: event["client"] == user_id
+    return None
+
+
+def format_event(event):
+    data = {key: event[key] for key in ("model", "id", "op", "machine", "seq")}
+    lines = [] if event["seq"] is None else [f"id: {event['seq']}"]
+    lines += ["event: change", f"data: {json.dumps(data)}", "", ""]
+    return "\n".join(lines)
+
+
+async def stream(accepts, heartbeat=None, expires_at=None, still_valid=None):
+    """
+    SSE-поток подписчика: события, пинги раз в heartbeat секунд, reset при переполнении.
+    expires_at — срок токена (unix time), still_valid() — проверка токена раз в heartbeat;
+    по любой из них поток заканчивается событием expired.
+    """
+    heartbeat = settings.EVENTS_HEARTBEAT if heartbeat is None else heartbeat
+    subscription = broker.subscribe(accepts)
+    checked = time.monotonic()
+    try:
+        yield f"retry: {settings.EVENTS_RETRY_MS}\n\n"
+        while True:
+            timeout = heartbeat
+            if expires_at is not None:
+                timeout = expires_at - time.time()
+                if timeout <= 0:
+                    yield EXPIRED
+                    return
+                timeout = min(timeout, heartbeat)
+            if still_valid is not None and time.monotonic() - checked >= heartbeat:
+                checked = time.monotonic()
+                if not await still_valid():
+                    yield EXPIRED
+                    return
+            event = await subscription.get(timeout)
+            if event is None:
+                if expires_at is None or time.time() < expires_at:
+                    yield ": ping\n\n"
+                continue
+            if event is RESET:
+                yield "event: reset\ndata: {}\n\n"
+                return
+            broker.delivered_one(event)
+            yield format_event(event)
+    finally:
+        broker.unsubscribe(subscription)
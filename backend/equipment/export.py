@@ -0,0 +1,206 @@
+"""
+Потоковая выгрузка машин, ТО и рекламаций в CSV и XLSX.
+
+Строки читаются через .values_list(...).iterator(chunk_size=...) (серверный курсор
+на PostgreSQL) и сразу отдаются клиенту через StreamingHttpResponse, поэтому
+расход памяти не зависит от числа строк. XLSX собирается стандартным zipfile
+в режиме записи в поток, без сторонних библиотек.
+"""
+import csv
+import re
+import zipfile
+from datetime import date, datetime
+from xml.sax.saxutils import escape
+
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ValidationError
+
+CHUNK_SIZE = 2000
+
+# Текст, который Excel выполнит как формулу; в CSV такие ячейки получают префикс "'"
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+# Символы, недопустимые в XML 1.0: один такой символ делает всю книгу XLSX битой
+_XML_ILLEGAL = re.compile("[^\t\n\r\x20-\ud7ff\ue000-\ufffd\U00010000-\U0010ffff]")
+
+# (заголовок, путь для values_list)
+MACHINE_COLUMNS = (
+    ("Зав. № машины", "serial_number"),
+    ("Модель техники", "model_name"),
+    ("Модель двигателя", "engine_model"),
+    ("Зав. № двигателя", "engine_serial"),
+    ("Модель трансмиссии", "transmission_model"),
+    ("Зав. № трансмиссии", "transmission_serial"),
+    ("Модель ведущего моста", "drive_axle_model"),
+    ("Зав. № ведущего моста", "drive_axle_serial"),
+    ("Модель управляемого моста", "steer_axle_model"),
+    ("Зав. № управляемого моста", "steer_axle_serial"),
+    ("Дата отгрузки с завода", "shipment_date"),
+    ("Покупатель", "buyer"),
+    ("Грузополучатель", "recipient"),
+    ("Адрес поставки", "delivery_address"),
+    ("Комплектация", "options"),
+    ("Сервисная компания", "service_company"),
+    ("Количество ТО", "maintenance_count"),
+    ("Количество рекламаций", "claims_count"),
+)
+
+MAINTENANCE_COLUMNS = (
+    ("Зав. № машины", "machine__serial_number"),
+    ("Вид ТО", "maintenance_type__name"),
+    ("Дата проведения ТО", "date"),
+    ("Наработка, м/час", "operating_hours"),
+    ("№ заказ-наряда", "order_number"),
+    ("Дата заказ-наряда", "order_date"),
+    ("Организация, проводившая ТО", "service_company"),
+)
+
+CLAIM_COLUMNS = (
+    ("Зав. № машины", "machine__serial_number"),
+    ("Дата отказа", "failure_date"),
+    ("Наработка, м/час", "operating_hours"),
+    ("Узел отказа", "failure_node"),
+    ("Описание отказа", "failure_description"),
+    ("Способ восстановления", "recovery_method"),
+    ("Использованные запчасти", "used_spare"),
+    ("Дата восстановления", "restored_date"),
+    ("Время простоя (часов)", "downtime_hours"),
+)
+
+
+class _Buffer:
+    """Файлоподобный объект, из которого генератор забирает уже записанные байты."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data if isinstance(data, bytes) else data.encode("utf-8"))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _rows(queryset, columns):
+    return queryset.values_list(*(path for _, path in columns)).iterator(chunk_size=CHUNK_SIZE)
+
+
+def _text(value):
+    if value is None:
+        return ""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def _csv_cell(value):
+    text = _text(value)
+    if isinstance(value, str) and text.startswith(FORMULA_PREFIXES):
+        return "'" + text
+    return text
+
+
+def unescape_csv_cell(text):
+    """Обратное к _csv_cell(): импорт выгруженного CSV получает исходный текст."""
+    if text.startswith("'") and text[1:].startswith(FORMULA_PREFIXES):
+        return text[1:]
+    return text
+
+
+def iter_csv(queryset, columns):
+    buffer = _Buffer()
+    writer = csv.writer(buffer)
+    buffer.write("\ufeff")  # BOM, чтобы Excel открыл UTF-8 корректно
+    writer.writerow([title for title, _ in columns])
+    for i, row in enumerate(_rows(queryset, columns), 1):
+        writer.writerow([_csv_cell(v) for v in row])
+        if i % CHUNK_SIZE == 0:
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+_XLSX_STATIC = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _xlsx_row(values):
+    cells = []
+    for value in values:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            cells.append(f"<c><v>{value}</v></c>")
+        else:
+            cells.append(f'<c t="inlineStr"><is><t xml:space="preserve">{escape(_XML_ILLEGAL.sub("", _text(value)))}</t></is></c>')
+    return f"<row>{''.join(cells)}</row>"
+
+
+def iter_xlsx(queryset, columns):
+    buffer = _Buffer()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_STATIC.items():
+            archive.writestr(name, content)
+        with archive.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(_xlsx_row([title for title, _ in columns]).encode("utf-8"))
+            for i, row in enumerate(_rows(queryset, columns), 1):
+                sheet.write(_xlsx_row(row).encode("utf-8"))
+                if i % CHUNK_SIZE == 0:
+                    yield buffer.drain()
+            sheet.write(b"</sheetData></worksheet>")
+    yield buffer.drain()
+
+
+FORMATS = {
+    "csv": (iter_csv, "text/csv; charset=utf-8"),
+    "xlsx": (iter_xlsx, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+
+def export_response(queryset, columns, filename, file_format):
+    if file_format not in FORMATS:
+        raise ValidationError({"file_format": f"Допустимые значения: {', '.join(FORMATS)}"})
+    generate, content_type = FORMATS[file_format]
+    response = StreamingHttpResponse(generate(queryset, columns), content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{file_format}"'
+    return response
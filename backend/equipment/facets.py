@@ -0,0 +1,183 @@
+"""
+Фасеты (списки уникальных значений для фильтров дашборда).
+
+Каждый раздел считается одним запросом: UNION ALL из DISTINCT по каждой
+колонке, отсортированный в БД (_facet_rows). Результат кэшируется
+на (раздел, роль, пользователь) под версиями таблиц раздела из ChangeVersion
+(versions.py): они увеличиваются в транзакции записи, поэтому кэш сменяется
+только после коммита и одинаково во всех процессах. Одновременные промахи по
+одному ключу (после записи, при открытии дашборда многими) считаются один раз
+на процесс (flight).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, IntegerField, Value
+
+from core.singleflight import SingleFlight
+from . import versions
+from .models import Machine, Maintenance, Claim
+from .roles import restrict_by_role, role_scope
+
+# без TTL: готовый результат и так лежит в кэше до следующей записи
+flight = SingleFlight()
+# одновременные async-запросы фасетов (только чтение) читают версии одним запросом
+version_flight = SingleFlight()
+
+
+def _facet_rows(qs, columns):
+    """
+    UNION ALL из SELECT DISTINCT по каждой колонке с её именем: строк столько, сколько
+    разных значений, а не их сочетаний. Порядок значений — по сортировке самой БД.
+    columns: имя фасета -> (поле значения, поле id или None).
+    """
+    parts = [
+        qs.order_by().annotate(
+            facet=Value(name),
+            facet_value=F(path),
+            facet_id=F(id_path) if id_path else Value(None, output_field=IntegerField()),
+        ).values_list("facet", "facet_value", "facet_id").distinct()
+        for name, (path, id_path) in columns.items()
+    ]
+    return parts[0].union(*parts[1:], all=True).order_by("facet", "facet_value", "facet_id")
+
+
+def _build(rows, columns):
+    result = {name: [] for name in columns}
+    for facet, value, facet_id in rows:
+        if value in ("", None):
+            continue
+        result[facet].append(value if facet_id is None else (facet_id, value))
+    return result
+
+
+MACHINE_FIELDS = ("model_name", "engine_model", "transmission_model",
+                  "steer_axle_model", "drive_axle_model", "service_company")
+MACHINE_COLUMNS = {field: (field, None) for field in MACHINE_FIELDS}
+MAINTENANCE_COLUMNS = {
+    "maintenance_type": ("maintenance_type__name", "maintenance_type_id"),
+    "machine_serial": ("machine_serial", None),
+    "service_company": ("service_company", None),
+}
+CLAIM_COLUMNS = {
+    "failure_node": ("failure_node", None),
+    "machine_serial": ("machine_serial", None),
+    "service_company": ("machine__service_company", None),
+}
+
+
+# Каждый раздел — запрос (rows) и сборка ответа из его строк (build): синхронные
+# функции ниже и async-view (async_views.py) выполняют один и тот же запрос.
+def machine_rows(user):
+    return _facet_rows(restrict_by_role(Machine.objects.all(), user), MACHINE_COLUMNS)
+
+
+def build_machine_facets(rows):
+    return _build(rows, MACHINE_COLUMNS)
+
+
+def maintenance_rows(user):
+    qs = restrict_by_role(Maintenance.objects.all(), user, "machine__")
+    return _facet_rows(qs, MAINTENANCE_COLUMNS)
+
+
+def build_maintenance_facets(rows):
+    return _build(rows, MAINTENANCE_COLUMNS)
+
+
+def claim_rows(user):
+    qs = restrict_by_role(Claim.objects.all(), user, "machine__")
+    return _facet_rows(qs, CLAIM_COLUMNS)
+
+
+def build_claim_facets(rows):
+    return _build(rows, CLAIM_COLUMNS)
+
+
+def machine_facets(user):
+    return build_machine_facets(machine_rows(user))
+
+
+def maintenance_facets(user):
+    return build_maintenance_facets(maintenance_rows(user))
+
+
+def claim_facets(user):
+    return build_claim_facets(claim_rows(user))
+
+
+SECTIONS = {
+    "machines": machine_facets,
+    "maintenance": maintenance_facets,
+    "claims": claim_facets,
+}
+ASYNC_SECTIONS = {
+    "machines": (machine_rows, build_machine_facets),
+    "maintenance": (maintenance_rows, build_maintenance_facets),
+    "claims": (claim_rows, build_claim_facets),
+}
+
+
+# Таблицы, от которых зависит раздел: номер и сервисная компания машины есть
+# во всех разделах, название вида ТО — в фасетах ТО.
+SECTION_VERSIONS = {
+    "machines": (versions.MACHINE,),
+    "maintenance": (versions.MACHINE, versions.MAINTENANCE, versions.MAINTENANCE_TYPE),
+    "claims": (versions.MACHINE, versions.CLAIM),
+}
+
+
+def _version_keys(sections):
+    return tuple(sorted({key for section in sections for key in SECTION_VERSIONS[section]}))
+
+
+def _keys(sections, version_keys, current, scope):
+    current = dict(zip(version_keys, current))
+    return {
+        section: "facets:{}:{}:{}".format(
+            section, ".".join(str(current[key]) for key in SECTION_VERSIONS[section]), scope)
+        for section in sections
+    }
+
+
+def get_facets(section, user):
+    return get_all_facets(user, sections=(section,))[section]
+
+
+async def _abuild(section, user):
+    rows, build = ASYNC_SECTIONS[section]
+    return build([row async for row in rows(user)])
+
+
+async def aget_all_facets(user, sections=tuple(SECTIONS)):
+    """get_all_facets() на async ORM и async-API кэша; роль пользователя уже должна быть известна."""
+    version_keys = _version_keys(sections)
+    current, _ = await version_flight.ado(version_keys, lambda: versions.aget(version_keys))
+    keys = _keys(sections, version_keys, current, role_scope(user))
+    cached = await cache.aget_many(keys.values())
+
+    result, missing = {}, {}
+    for section, key in keys.items():
+        if key in cached:
+            result[section] = cached[key]
+        else:
+            result[section] = missing[key] = await flight.ado(key, lambda section=section: _abuild(section, user))
+    if missing:
+        await cache.aset_many(missing, timeout=getattr(settings, "FACETS_CACHE_TTL", 300))
+    return result
+
+
+def get_all_facets(user, sections=tuple(SECTIONS)):
+    version_keys = _version_keys(sections)
+    current, _ = versions.get(version_keys)
+    keys = _keys(sections, version_keys, current, role_scope(user))
+    cached = cache.get_many(keys.values())
+
+    result, missing = {}, {}
+    for section, key in keys.items():
+        if key in cached:
+            result[section] = cached[key]
+        else:
+            result[section] = missing[key] = flight.do(key, lambda section=section: SECTIONS[section](user))
+    if missing:
+        cache.set_many(missing, timeout=getattr(settings, "FACETS_CACHE_TTL", 300))
+    return result
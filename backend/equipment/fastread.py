@@ -0,0 +1,162 @@
+"""
+Быстрый путь чтения для read-only сериализаторов.
+
+ValuesReader по полям сериализатора строит список путей для .values() и собирает
+из полученных словарей тот же JSON, что и сериализатор, но без создания моделей
+и вызова to_representation на каждое поле. Поддерживаются простые поля
+(целые, строки, даты, bool) и вложенные сериализаторы по FK; на остальных
+поля ValuesReader падает при первом использовании, чтобы расхождение с
+сериализатором не прошло незамеченным.
+
+FastReadMixin включает этот путь в list/retrieve для JSON-ответов
+(настройка FAST_READ, по умолчанию включена).
+"""
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.functional import cached_property
+from rest_framework import ISO_8601, serializers
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+
+def _date(value):
+    return value.isoformat()
+
+
+def _pk(value):
+    return value
+
+
+# порядок важен: BooleanField и т.п. проверяются раньше более общих классов
+CONVERTERS = (
+    (serializers.BooleanField, bool),
+    (serializers.IntegerField, int),
+    (serializers.DateTimeField, None),  # часовые пояса и форматы — только через сериализатор
+    (serializers.DateField, _date),
+    (serializers.CharField, str),
+    (serializers.PrimaryKeyRelatedField, _pk),  # values() по FK уже отдаёт id
+)
+
+
+def _converter(field):
+    for field_class, convert in CONVERTERS:
+        if isinstance(field, field_class):
+            if field_class is serializers.DateField:
+                output_format = getattr(field, "format", api_settings.DATE_FORMAT)
+                if output_format is not None and output_format.lower() != ISO_8601:
+                    break
+            if convert is not None:
+                return convert
+            break
+    raise ImproperlyConfigured(
+        f"ValuesReader: поле {field.field_name} ({type(field).__name__}) не поддерживается")
+
+
+def _plan(serializer, prefix=""):
+    plan = []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if field.source == "*" or getattr(field, "many", False):
+            raise ImproperlyConfigured(f"ValuesReader: поле {name} не поддерживается")
+        path = prefix + "__".join(field.source_attrs)
+        if isinstance(field, serializers.BaseSerializer):
+            plan.append((name, path, _plan(field, path + "__")))
+        else:
+            plan.append((name, path, _converter(field)))
+    return plan
+
+
+def _paths(plan):
+    for _, path, rule in plan:
+        if isinstance(rule, list):
+            yield path  # сам FK: по нему понятно, что вложенный объект — None
+            yield from _paths(rule)
+        else:
+            yield path
+
+
+def _build(plan, values):
+    row = {}
+    for name, path, rule in plan:
+        if isinstance(rule, list):
+            row[name] = None if values[path] is None else _build(rule, values)
+        else:
+            value = values[path]
+            row[name] = None if value is None else rule(value)
+    return row
+
+
+class ValuesReader:
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+
+    @classmethod
+    def for_serializer(cls, serializer):
+        """Читатель по конкретному (например, урезанному ?fields=) экземпляру сериализатора."""
+        reader = cls(type(serializer))
+        reader.plan = _plan(serializer)
+        return reader
+
+    @cached_property
+    def plan(self):
+        return _plan(self.serializer_class())
+
+    @cached_property
+    def paths(self):
+        return list(dict.fromkeys(_paths(self.plan)))
+
+    def values(self, queryset, extra=()):
+        """queryset -> .values() с нужными полями (extra — например, поля keyset-курсора)."""
+        return queryset.prefetch_related(None).values(*dict.fromkeys([*self.paths, *extra]))
+
+    def row(self, values):
+        return _build(self.plan, values)
+
+    def rows(self, values):
+        plan = self.plan
+        return [_build(plan, v) for v in values]
+
+
+class FastReadMixin:
+    """
+    list/retrieve через ValuesReader, если для текущего сериализатора задан
+    читатель в fast_readers и ответ отдаётся в JSON. retrieve не вызывает
+    check_object_permissions, поэтому подходит только для view без
+    объектных прав (как здесь: доступ ограничивается в get_queryset()).
+    """
+    fast_readers = {}
+
+    def _fast_read_enabled(self):
+        return (getattr(settings, "FAST_READ", True)
+                and getattr(self.request.accepted_renderer, "format", None) == "json")
+
+    def _fast_reader(self):
+        if not self._fast_read_enabled():
+            return None
+        reader = self.fast_readers.get(self.get_serializer_class())
+        if reader is not None and hasattr(self, "get_fieldset") and not self.get_fieldset().is_default:
+            # ?fields= / ?expand=: план по урезанному сериализатору
+            reader = ValuesReader.for_serializer(self.get_serializer())
+        return reader
+
+    def list(self, request, *args, **kwargs):
+        reader = self._fast_reader()
+        if reader is None:
+            return super().list(request, *args, **kwargs)
+        keyset = [f.lstrip("-") for f in getattr(self, "keyset_ordering", ())]
+        queryset = reader.values(self.filter_queryset(self.get_queryset()), extra=keyset)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(reader.rows(page))
+        return Response(reader.rows(queryset))
+
+    def retrieve(self, request, *args, **kwargs):
+        reader = self._fast_reader()
+        if reader is None:
+            return super().retrieve(request, *args, **kwargs)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = reader.values(self.filter_queryset(self.get_queryset()))
+        values = get_object_or_404(queryset, **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        return Response(reader.row(values))
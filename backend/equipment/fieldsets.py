@@ -0,0 +1,177 @@
+"""
+Выборочные поля ответа: ?fields=, ?exclude=, ?expand=.
+
+    ?fields=id,serial_number   — только перечисленные поля верхнего уровня
+    ?exclude=options,buyer     — все поля, кроме перечисленных
+    ?expand=maintenance        — какие вложенные объекты раскрывать; без параметра
+                                 раскрываются все (как раньше), ?expand= — ни один
+
+Нераскрытый вложенный объект по FK отдаётся его id, нераскрытый вложенный список
+не отдаётся вовсе. Набор полей сужает и SQL: в list/retrieve queryset получает
+.only() по колонкам оставшихся полей и select_related только для нужных связей,
+а view может не делать Prefetch нераскрытых списков (FieldSet.includes()).
+"""
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+FIELDS_PARAM = "fields"
+EXCLUDE_PARAM = "exclude"
+EXPAND_PARAM = "expand"
+
+
+def _names(value):
+    return [name for name in (part.strip() for part in value.split(",")) if name]
+
+
+def _target(serializer):
+    return serializer.child if isinstance(serializer, serializers.ListSerializer) else serializer
+
+
+def _is_nested(field):
+    return isinstance(field, serializers.BaseSerializer)
+
+
+class FieldSet:
+    def __init__(self, fields=None, exclude=(), expand=None):
+        self.fields = None if fields is None else list(fields)
+        self.exclude = set(exclude)
+        self.expand = None if expand is None else set(expand)
+
+    @classmethod
+    def from_request(cls, request):
+        params = request.query_params
+        return cls(
+            fields=_names(params[FIELDS_PARAM]) if FIELDS_PARAM in params else None,
+            exclude=_names(params.get(EXCLUDE_PARAM, "")),
+            expand=_names(params[EXPAND_PARAM]) if EXPAND_PARAM in params else None,
+        )
+
+    @property
+    def is_default(self):
+        return self.fields is None and not self.exclude and self.expand is None
+
+    @property
+    def cache_key(self):
+        if self.is_default:
+            return ""
+        return repr((self.fields, sorted(self.exclude),
+                     None if self.expand is None else sorted(self.expand)))
+
+    def expanded(self, name):
+        return self.expand is None or name in self.expand
+
+    def includes(self, name):
+        """Попадёт ли поле name в ответ (для вложенных — только раскрытое)."""
+        if self.fields is not None and name not in self.fields:
+            return False
+        return name not in self.exclude and self.expanded(name)
+
+    def validate(self, serializer):
+        available = _target(serializer).fields
+        errors = {}
+        for param, names in ((FIELDS_PARAM, self.fields or ()), (EXCLUDE_PARAM, self.exclude)):
+            unknown = sorted(set(names) - set(available))
+            if unknown:
+                errors[param] = f"Неизвестные поля: {', '.join(unknown)}"
+        nested = {name for name, field in available.items() if _is_nested(field)}
+        unknown = sorted((self.expand or set()) - nested)
+        if unknown:
+            errors[EXPAND_PARAM] = f"Нельзя раскрыть: {', '.join(unknown)}"
+        if errors:
+            raise ValidationError(errors)
+
+    def apply(self, serializer):
+        """Убирает из сериализатора лишние поля и сворачивает нераскрытые вложенные."""
+        if self.is_default:
+            return serializer
+        self.validate(serializer)
+        fields = _target(serializer).fields
+        for name in list(fields):
+            field = fields[name]
+            if (self.fields is not None and name not in self.fields) or name in self.exclude:
+                del fields[name]
+            elif _is_nested(field) and not self.expanded(name):
+                if isinstance(field, serializers.ListSerializer):
+                    del fields[name]
+                else:
+                    source = {} if field.source == name else {"source": field.source}
+                    fields[name] = serializers.PrimaryKeyRelatedField(read_only=True, **source)
+        return serializer
+
+    def columns(self, serializer):
+        """
+        Пути полей модели для .only() по уже урезанному сериализатору или None,
+        если набор колонок вывести нельзя (source="*", вычисляемые поля и т.п.).
+        """
+        target = _target(serializer)
+        model = target.Meta.model
+        columns = {model._meta.pk.name}
+        for field in target.fields.values():
+            if field.write_only:
+                continue
+            if field.source == "*" or isinstance(field, serializers.SerializerMethodField):
+                return None
+            path = "__".join(field.source_attrs)
+            if isinstance(field, serializers.ListSerializer):
+                # вложенные записи ссылаются на родителя (obj.machine.serial_number):
+                # эти поля родителя тоже нужны
+                back = next((f.name for f in field.child.Meta.model._meta.get_fields()
+                             if f.many_to_one and f.related_model is model), None)
+                if back is None:
+                    return None
+                for child in field.child.fields.values():
+                    if child.source_attrs[:1] == [back] and len(child.source_attrs) > 1:
+                        columns.add("__".join(child.source_attrs[1:]))
+            elif _is_nested(field):
+                columns.update(f"{path}__{name}" for name in _nested_columns(field))
+            else:
+                columns.add(path)
+        return sorted(columns)
+
+
+def _nested_columns(serializer):
+    columns = set()
+    for field in serializer.fields.values():
+        if _is_nested(field):
+            columns.update(f"{field.source}__{name}" for name in _nested_columns(field))
+        elif not field.write_only:
+            columns.add("__".join(field.source_attrs))
+    return columns
+
+
+class SparseFieldsMixin:
+    """
+    ?fields= / ?exclude= / ?expand= для GET-ответов: урезает сериализатор и сужает
+    queryset в filter_queryset() (только list/retrieve; у ListAPIView нет action —
+    это list).
+    """
+    sparse_actions = ("list", "retrieve")
+
+    def get_fieldset(self):
+        if not hasattr(self, "_fieldset"):
+            self._fieldset = FieldSet()
+            if self.request is not None and self.request.method in ("GET", "HEAD"):
+                self._fieldset = FieldSet.from_request(self.request)
+        return self._fieldset
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if getattr(self, "action", "list") in self.sparse_actions:
+            self.get_fieldset().apply(serializer)
+        return serializer
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        fieldset = self.get_fieldset()
+        if fieldset.is_default or getattr(self, "action", "list") not in self.sparse_actions:
+            return queryset
+        columns = fieldset.columns(self.get_serializer())
+        if columns is None:
+            return queryset
+        keyset = [f.lstrip("-") for f in getattr(self, "keyset_ordering", ())]
+        columns = sorted(set(columns) | set(keyset))
+        relations = sorted({c.rsplit("__", 1)[0] for c in columns if "__" in c})
+        queryset = queryset.select_related(None)
+        if relations:
+            queryset = queryset.select_related(*relations)
+        return queryset.only(*columns)
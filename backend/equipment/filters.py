@@ -0,0 +1,21 @@
+import django_filters
+
+from .models import Maintenance, Claim
+
+
+class MaintenanceHistoryFilter(django_filters.FilterSet):
+    """История ТО машины: ?date_after=&date_before= (включительно)"""
+    date = django_filters.DateFromToRangeFilter()
+
+    class Meta:
+        model = Maintenance
+        fields = ["date", "maintenance_type"]
+
+
+class ClaimHistoryFilter(django_filters.FilterSet):
+    """Рекламации машины: ?failure_date_after=&failure_date_before= (включительно)"""
+    failure_date = django_filters.DateFromToRangeFilter()
+
+    class Meta:
+        model = Claim
+        fields = ["failure_date", "failure_node"]
@@ -0,0 +1,304 @@
+"""
+Массовая загрузка машин, ТО и рекламаций из CSV/XLSX.
+
+Файл читается построчно (csv.DictReader / openpyxl в режиме read_only) и
+обрабатывается пачками: для каждой пачки зав. номера и виды ТО разрешаются
+одним запросом, строки проверяются без full_clean() на каждый объект, а
+корректные записываются одним bulk_create в отдельной транзакции. Строки
+с ошибками пропускаются и попадают в отчёт. Если пачку не принимает БД
+(IntegrityError), её строки записываются по одной, чтобы в отчёт попали
+именно отклонённые.
+
+Файл, который не читается (не UTF-8, не книга Excel), даёт ValidationError;
+если такое обнаружилось посреди CSV, загрузка останавливается, а в отчёт
+попадает ошибка для этой строки.
+
+Заголовки столбцов — такие же, как в выгрузке (export.py), либо имена полей.
+"""
+import csv
+import io
+import time
+import zipfile
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from .export import CLAIM_COLUMNS, MACHINE_COLUMNS, MAINTENANCE_COLUMNS, unescape_csv_cell
+from .models import Machine, Maintenance, Claim, MaintenanceType
+from .signals import bulk_created
+
+BATCH_SIZE = 1000
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.seconds = 0.0
+
+    def error(self, row_number, errors):
+        self.errors.append({"row": row_number, "errors": errors})
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.started
+        return self
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def as_dict(self, max_errors=1000):
+        return {
+            "rows": self.rows,
+            "created": self.created,
+            "failed": len(self.errors),
+            "seconds": round(self.seconds, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+            "errors": self.errors[:max_errors],
+        }
+
+
+def _csv_error(error):
+    if isinstance(error, UnicodeDecodeError):
+        return ValidationError("Файл не в UTF-8: сохраните его как «CSV UTF-8».")
+    return ValidationError(f"Повреждённый CSV: {error}")
+
+
+def _iter_csv(fileobj):
+    reader = csv.DictReader(io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline=""))
+    try:
+        # заголовок читается сразу: файл в другой кодировке отклоняется до загрузки
+        reader.fieldnames
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise _csv_error(e)
+    return _csv_rows(reader)
+
+
+def _csv_rows(reader):
+    try:
+        yield from reader
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise _csv_error(e)
+
+
+def _iter_xlsx(fileobj):
+    try:
+        from openpyxl import load_workbook
+        from openpyxl.utils.exceptions import InvalidFileException
+    except ImportError:
+        raise ValidationError("Для загрузки XLSX нужен пакет openpyxl.")
+    try:
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException, KeyError):
+        raise ValidationError("Повреждённый XLSX: файл не открывается как книга Excel.")
+    return _xlsx_rows(workbook)
+
+
+def _xlsx_rows(workbook):
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(h).strip() if h is not None else "" for h in next(rows, ())]
+        for values in rows:
+            yield dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def read_rows(fileobj, filename):
+    if filename.lower().endswith(".xlsx"):
+        return _iter_xlsx(fileobj)
+    return _iter_csv(fileobj)
+
+
+class BaseImporter:
+    model = None
+    columns = ()
+    aliases = {}
+    # Столбцы выгрузки, которые при загрузке игнорируются (вычисляемые поля).
+    skip = ()
+
+    def __init__(self, batch_size=BATCH_SIZE, dry_run=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.headers = {}
+        for title, path in self.columns:
+            self.headers[title] = path
+            self.headers[path] = path
+        self.headers.update(self.aliases)
+        # Столбцы с "__" (зав. номер машины, вид ТО) разрешаются через resolve().
+        self.fields = {
+            path: self.model._meta.get_field(path)
+            for _, path in self.columns if "__" not in path and path not in self.skip
+        }
+
+    def normalize(self, raw):
+        row = {}
+        for header, value in raw.items():
+            path = self.headers.get((header or "").strip())
+            if path is not None:
+                row[path] = unescape_csv_cell(value).strip() if isinstance(value, str) else value
+        return row
+
+    def clean_fields(self, row):
+        values, errors = {}, {}
+        for name, field in self.fields.items():
+            value = row.get(name)
+            if value in (None, ""):
+                value = None if field.null else ""
+            try:
+                values[name] = field.clean(value, None)
+            except ValidationError as e:
+                errors[name] = e.messages
+        return values, errors
+
+    def resolve(self, rows):
+        """Справочники для пачки; по одному запросу на справочник."""
+        return {}
+
+    def build(self, row, values, errors, maps):
+        return self.model(**values)
+
+    def _save(self, objects):
+        with transaction.atomic():
+            self.model.objects.bulk_create(objects, batch_size=self.batch_size)
+            bulk_created.send(sender=self.model, objects=objects)
+
+    def save(self, numbered_objects, report):
+        objects = [obj for _, obj in numbered_objects]
+        try:
+            self._save(objects)
+            report.created += len(objects)
+            return
+        except IntegrityError:
+            pass
+        # пачку отклонила БД (например, параллельная загрузка тех же номеров):
+        # по одной строке, чтобы записать остальные и назвать отклонённые
+        for number, obj in numbered_objects:
+            obj.pk = None
+            try:
+                self._save([obj])
+            except IntegrityError as e:
+                report.error(number, {"__all__": [f"Строка не записана: {e}"]})
+            else:
+                report.created += 1
+
+    def run(self, raw_rows):
+        report = ImportReport()
+        numbered = enumerate((self.normalize(r) for r in raw_rows), start=2)
+        next_number = 2
+        while True:
+            batch, unreadable = [], None
+            try:
+                for item in islice(numbered, self.batch_size):
+                    batch.append(item)
+            except ValidationError as e:
+                unreadable = e
+            if batch:
+                report.rows += len(batch)
+                next_number = batch[-1][0] + 1
+                self.process(batch, report)
+            if unreadable is not None:
+                report.error(next_number, {"__all__": unreadable.messages + ["Дальше файл не прочитан."]})
+                break
+            if not batch:
+                break
+        return report.finish()
+
+    def process(self, batch, report):
+        maps = self.resolve([row for _, row in batch])
+        objects = []
+        for number, row in batch:
+            values, errors = self.clean_fields(row)
+            obj = self.build(row, values, errors, maps)
+            if errors:
+                report.error(number, errors)
+            else:
+                objects.append((number, obj))
+        if not objects:
+            return
+        if self.dry_run:
+            report.created += len(objects)
+        else:
+            self.save(objects, report)
+
+
+class MachineImporter(BaseImporter):
+    model = Machine
+    columns = MACHINE_COLUMNS
+    skip = ("maintenance_count", "claims_count")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.seen = set()
+
+    def resolve(self, rows):
+        serials = {str(row.get("serial_number") or "") for row in rows} - {""}
+        existing = set(Machine.objects.filter(serial_number__in=serials)
+                       .values_list("serial_number", flat=True))
+        return {"existing": existing}
+
+    def build(self, row, values, errors, maps):
+        serial = values.get("serial_number")
+        if serial and (serial in maps["existing"] or serial in self.seen):
+            errors["serial_number"] = ["Машина с таким зав. номером уже существует."]
+        if not errors:
+            self.seen.add(serial)
+        return Machine(**values)
+
+
+class MachineRecordImporter(BaseImporter):
+    """Общая часть для ТО и рекламаций: привязка к машине по зав. номеру."""
+
+    def resolve(self, rows):
+        serials = {str(row.get("machine__serial_number") or "") for row in rows} - {""}
+        return {"machines": dict(Machine.objects.filter(serial_number__in=serials)
+                                 .values_list("serial_number", "pk"))}
+
+    def build(self, row, values, errors, maps):
+        serial = str(row.get("machine__serial_number") or "")
+        machine_id = maps["machines"].get(serial)
+        if machine_id is None:
+            errors["machine_serial"] = [f"Машина с зав. номером «{serial}» не найдена."]
+        return self.model(machine_id=machine_id, **values)
+
+
+class MaintenanceImporter(MachineRecordImporter):
+    model = Maintenance
+    columns = MAINTENANCE_COLUMNS
+    aliases = {"machine_serial": "machine__serial_number",
+               "maintenance_type": "maintenance_type__name"}
+
+    def resolve(self, rows):
+        maps = super().resolve(rows)
+        names = {row.get("maintenance_type__name") for row in rows} - {None, ""}
+        maps["types"] = dict(MaintenanceType.objects.filter(name__in=names)
+                             .values_list("name", "pk"))
+        return maps
+
+    def build(self, row, values, errors, maps):
+        obj = super().build(row, values, errors, maps)
+        name = row.get("maintenance_type__name")
+        obj.maintenance_type_id = maps["types"].get(name)
+        if obj.maintenance_type_id is None:
+            errors["maintenance_type"] = [f"Неизвестный вид ТО «{name or ''}»."]
+        return obj
+
+
+class ClaimImporter(MachineRecordImporter):
+    model = Claim
+    columns = CLAIM_COLUMNS
+    aliases = {"machine_serial": "machine__serial_number"}
+
+
+IMPORTERS = {
+    "machines": MachineImporter,
+    "maintenance": MaintenanceImporter,
+    "claims": ClaimImporter,
+}
+
+
+def import_file(kind, fileobj, filename, **options):
+    return IMPORTERS[kind](**options).run(read_rows(fileobj, filename))
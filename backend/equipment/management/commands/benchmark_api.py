@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from equipment import benchmark
+
+
+class Command(BaseCommand):
+    help = ("Прогоняет эндпоинты API под каждой ролью: p50/p95, SQL-запросы, память. "
+            "--save сохраняет базовый замер, --compare сравнивает с ним.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--warmup", type=int, default=2)
+        parser.add_argument("--roles", nargs="+", choices=benchmark.ROLES, default=list(benchmark.ROLES))
+        parser.add_argument("--scenarios", nargs="+", choices=list(benchmark.SCENARIOS))
+        parser.add_argument("--cold", action="store_true", help="Сбрасывать кэши перед каждым запросом")
+        parser.add_argument("--save", metavar="PATH", help="Сохранить результат как базовый замер")
+        parser.add_argument("--compare", metavar="PATH", help="Сравнить с базовым замером")
+        parser.add_argument("--tolerance", type=float, default=0.2,
+                            help="Допустимый рост p95 (доля) при сравнении")
+        parser.add_argument("--fail-on-regression", action="store_true")
+
+    def handle(self, *args, **o):
+        try:
+            baseline = benchmark.load(o["compare"]) if o["compare"] else None
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Не удалось прочитать базовый замер: {e}")
+        results = benchmark.run(o["roles"], o["scenarios"], o["repeat"], o["warmup"], o["cold"])
+
+        data = benchmark.dataset()
+        self.stdout.write(
+            f"машин {data['machines']}, ТО {data['maintenance']}, рекламаций {data['claims']} "
+            f"({data['vendor']}), повторов {o['repeat']}{', холодный кэш' if o['cold'] else ''}")
+        self.stdout.write(f"{'сценарий':<34} {'код':>4} {'p50 ms':>9} {'p95 ms':>9} "
+                          f"{'SQL':>4} {'пик KB':>9} {'байт':>9}")
+        for key, r in results.items():
+            self.stdout.write(f"{key:<34} {r['status']:>4} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} "
+                              f"{r['queries']:>4} {r['peak_kb']:>9.1f} {r['bytes']:>9}")
+
+        if o["save"]:
+            benchmark.save(o["save"], results, repeat=o["repeat"], cold=o["cold"])
+            self.stdout.write(self.style.SUCCESS(f"Базовый замер сохранён: {o['save']}"))
+
+        if baseline is None:
+            return
+        regressions = 0
+        self.stdout.write(f"\nСравнение с {o['compare']} ({baseline['meta'].get('created', '?')}):")
+        for key, before, current, regressed in benchmark.compare(
+                baseline["results"], results, o["tolerance"]):
+            line = (f"{key:<34} p95 {before['p95_ms']:>8.2f} -> {current['p95_ms']:>8.2f} ms   "
+                    f"SQL {before['queries']:>3} -> {current['queries']:>3}")
+            if regressed:
+                regressions += 1
+                self.stdout.write(self.style.ERROR(line + "   РЕГРЕССИЯ"))
+            else:
+                self.stdout.write(line)
+        if regressions and o["fail_on_regression"]:
+            raise CommandError(f"Регрессий: {regressions}")
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.metrics import percentile
+from equipment.models import Machine
+
+MODES = ("sync", "async")
+
+
+class Command(BaseCommand):
+    help = ("Сравнивает синхронные и async read-эндпоинты (/api/search, /api/facets/, /api/me/) "
+            "при одинаковом бюджете: sync — пул из --workers потоков (как gunicorn --threads), "
+            "async — один цикл событий, в котором одновременно не больше --concurrency запросов. "
+            "Без --mode запускает оба варианта в отдельных процессах (ASYNC_READ_VIEWS=0/1).")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mode", choices=MODES)
+        parser.add_argument("--requests", type=int, default=600, help="Запросов на прогон")
+        parser.add_argument("--concurrency", type=int, default=50, help="Одновременных клиентов")
+        parser.add_argument("--workers", type=int, default=8,
+                            help="Потоков синхронного варианта")
+        parser.add_argument("--user", default="bench_manager",
+                            help="Пользователь для фасетов и /api/me/ (по умолчанию из generate_fleet)")
+        parser.add_argument("--json", action="store_true", help="Результат одной строкой JSON")
+
+    def handle(self, *args, **o):
+        if o["mode"] is None:
+            return self.compare(o)
+        if settings.ASYNC_READ_VIEWS != (o["mode"] == "async"):
+            raise CommandError(f"Для --mode {o['mode']} задайте "
+                               f"ASYNC_READ_VIEWS={int(o['mode'] == 'async')}")
+        # тестовые клиенты ходят с Host: testserver
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            result = self.run(o)
+        if o["json"]:
+            self.stdout.write(json.dumps(result))
+        else:
+            self.report({o["mode"]: result})
+
+    def compare(self, o):
+        results = {}
+        for mode in MODES:
+            env = {**os.environ, "ASYNC_READ_VIEWS": "1" if mode == "async" else "0"}
+            args = [sys.executable, sys.argv[0], "benchmark_concurrency", "--mode", mode, "--json"]
+            for name in ("requests", "concurrency", "workers", "user"):
+                args += [f"--{name}", str(o[name])]
+            done = subprocess.run(args, env=env, capture_output=True, text=True)
+            if done.returncode:
+                raise CommandError(done.stderr.strip() or f"{mode}: код {done.returncode}")
+            results[mode] = json.loads(done.stdout.strip().splitlines()[-1])
+        self.report(results)
+
+    def report(self, results):
+        for mode, result in results.items():
+            self.stdout.write(
+                f"{mode:<6} {result['rps']:8.1f} запр/с   p50 {result['p50']:7.2f} ms   "
+                f"p95 {result['p95']:7.2f} ms   потоков (пик) {result['threads']:>3}   "
+                f"ошибок {result['errors']}")
+        if set(results) == set(MODES) and results["sync"]["rps"]:
+            self.stdout.write(f"async/sync: x{results['async']['rps'] / results['sync']['rps']:.2f}")
+
+    def requests(self, o):
+        user = User.objects.filter(username=o["user"]).first()
+        serial = Machine.objects.order_by("pk").values_list("serial_number", flat=True).first()
+        if user is None or serial is None:
+            raise CommandError(f"Нет пользователя {o['user']} или машин: создайте парк командой generate_fleet.")
+        auth = {"Authorization": f"Bearer {AccessToken.for_user(user)}"}
+        paths = [(f"/api/search?q={serial[:3]}", {}), ("/api/facets/", auth), ("/api/me/", auth)]
+        return [paths[i % len(paths)] for i in range(o["requests"])]
+
+    def run(self, o):
+        requests = self.requests(o)
+        peak = [threading.active_count()]
+        stop = threading.Event()
+
+        def watch():
+            while not stop.wait(0.005):
+                peak[0] = max(peak[0], threading.active_count())
+
+        watcher = threading.Thread(target=watch, daemon=True)
+        watcher.start()
+        started = time.perf_counter()
+        if o["mode"] == "async":
+            timings = asyncio.run(self.run_async(requests, o["concurrency"]))
+        else:
+            timings = self.run_sync(requests, o["workers"])
+        elapsed = time.perf_counter() - started
+        stop.set()
+        watcher.join()
+        latencies = [ms for ms, ok in timings]
+        return {
+            "rps": len(timings) / elapsed if elapsed else 0,
+            "p50": statistics.median(latencies),
+            "p95": percentile(latencies, 95),
+            "threads": peak[0] - 1,  # без наблюдающего потока
+            "errors": sum(1 for ms, ok in timings if not ok),
+        }
+
+    def run_sync(self, requests, workers):
+        local = threading.local()
+
+        def call(item):
+            path, headers = item
+            client = getattr(local, "client", None) or Client()
+            local.client = client
+            started = time.perf_counter()
+            response = client.get(path, headers=headers)
+            return (time.perf_counter() - started) * 1000, response.status_code == 200
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(call, requests))
+
+    async def run_async(self, requests, concurrency):
+        client = AsyncClient()
+        limit = asyncio.Semaphore(concurrency)
+
+        async def call(path, headers):
+            async with limit:
+                started = time.perf_counter()
+                response = await client.get(path, headers=headers)
+                return (time.perf_counter() - started) * 1000, response.status_code == 200
+
+        return await asyncio.gather(*(call(path, headers) for path, headers in requests))
@@ -0,0 +1,63 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from equipment.counters import count_subquery
+from equipment.models import Machine, Maintenance, Claim
+
+
+def join_count(qs):
+    return qs.annotate(
+        maintenance_total=Count("maintenance", distinct=True),
+        claims_total=Count("claim", distinct=True),
+    ).values_list("id", "maintenance_total", "claims_total")
+
+
+def subquery_count(qs):
+    return qs.annotate(
+        maintenance_total=count_subquery(Maintenance),
+        claims_total=count_subquery(Claim),
+    ).values_list("id", "maintenance_total", "claims_total")
+
+
+def denormalized(qs):
+    return qs.values_list("id", "maintenance_count", "claims_count")
+
+
+STRATEGIES = {
+    "join": join_count,
+    "subquery": subquery_count,
+    "denormalized": denormalized,
+}
+
+
+class Command(BaseCommand):
+    help = "Сравнивает способы подсчёта ТО/рекламаций для списка машин на текущих данных."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--page-size", type=int, default=20,
+                            help="Размер страницы; 0 — весь парк")
+
+    def handle(self, *args, **options):
+        base = Machine.objects.order_by("-shipment_date", "id")
+        if options["page_size"]:
+            base = base[:options["page_size"]]
+
+        reference = None
+        for name, strategy in STRATEGIES.items():
+            timings = []
+            for _ in range(options["repeat"]):
+                started = time.perf_counter()
+                rows = list(strategy(base))
+                timings.append((time.perf_counter() - started) * 1000)
+            if reference is None:
+                reference = rows
+            elif rows != reference:
+                self.stderr.write(self.style.WARNING(f"{name}: результаты расходятся с join"))
+            self.stdout.write(
+                f"{name:<13} median {statistics.median(timings):8.2f} ms   "
+                f"max {max(timings):8.2f} ms   rows {len(rows)}"
+            )
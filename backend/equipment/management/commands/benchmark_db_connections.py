@@ -0,0 +1,110 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import RequestFactory
+
+from core.metrics import percentile, registry
+
+# режим -> переменные окружения config/settings.py
+MODES = {
+    "connect": {"DB_POOL": "0", "DB_CONN_MAX_AGE": "0"},
+    "persistent": {"DB_POOL": "0", "DB_CONN_MAX_AGE": "60"},
+    "pool": {"DB_POOL": "1"},
+}
+
+
+class Command(BaseCommand):
+    help = ("Запросов в секунду к API с разным управлением соединениями PostgreSQL: "
+            "connect — новое соединение на запрос (CONN_MAX_AGE=0), persistent — постоянные "
+            "соединения потоков, pool — пул процесса (DB_POOL=1). Запросы проходят полный цикл "
+            "WSGIHandler, включая закрытие соединений в конце запроса. Без --mode запускает "
+            "все режимы в отдельных процессах.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mode", choices=MODES)
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--threads", type=int, default=8, help="Потоков (как gunicorn --threads)")
+        parser.add_argument("--path", default="/api/machines/")
+        parser.add_argument("--json", action="store_true", help="Результат одной строкой JSON")
+
+    def handle(self, *args, **o):
+        if o["mode"] is None:
+            return self.compare(o)
+        if connection.vendor != "postgresql":
+            raise CommandError("Сравнение имеет смысл только для PostgreSQL.")
+        result = self.run(o)
+        if o["json"]:
+            self.stdout.write(json.dumps(result))
+        else:
+            self.report({o["mode"]: result})
+
+    def compare(self, o):
+        results = {}
+        for mode, env in MODES.items():
+            args = [sys.executable, sys.argv[0], "benchmark_db_connections", "--mode", mode, "--json",
+                    "--requests", str(o["requests"]), "--threads", str(o["threads"]), "--path", o["path"]]
+            done = subprocess.run(args, env={**os.environ, **env}, capture_output=True, text=True)
+            if done.returncode:
+                raise CommandError(done.stderr.strip() or f"{mode}: код {done.returncode}")
+            results[mode] = json.loads(done.stdout.strip().splitlines()[-1])
+        self.report(results)
+
+    def report(self, results):
+        for mode, r in results.items():
+            pool = f"   ожидание пула p95 {r['pool_wait_p95']:.2f} ms" if r["pool_wait_p95"] is not None else ""
+            self.stdout.write(
+                f"{mode:<11} {r['rps']:8.1f} запр/с   p50 {r['p50']:7.2f} ms   p95 {r['p95']:7.2f} ms   "
+                f"соединений открыто {r['connections']:>5}   ошибок {r['errors']}{pool}")
+        if "connect" in results and results["connect"]["rps"]:
+            base = results["connect"]["rps"]
+            self.stdout.write("   ".join(f"{mode}/connect: x{r['rps'] / base:.2f}"
+                                         for mode, r in results.items() if mode != "connect"))
+
+    def run(self, o):
+        handler = WSGIHandler()
+        factory = RequestFactory(SERVER_NAME="localhost")
+        path, _, query = o["path"].partition("?")
+        opened = []
+        lock = threading.Lock()
+
+        def count(sender, connection, **kwargs):
+            with lock:
+                opened.append(connection.alias)
+
+        def call(_):
+            environ = factory.get(path, QUERY_STRING=query).environ
+            status = []
+            started = time.perf_counter()
+            response = handler(environ, lambda s, headers, exc_info=None: status.append(s))
+            b"".join(response)
+            response.close()  # request_finished: здесь Django закрывает или сохраняет соединение
+            return (time.perf_counter() - started) * 1000, status[0].startswith("200")
+
+        connection_created.connect(count)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=o["threads"]) as executor:
+            timings = list(executor.map(call, range(o["requests"])))
+        elapsed = time.perf_counter() - started
+        connection_created.disconnect(count)
+
+        latencies = [ms for ms, ok in timings]
+        pool = registry.snapshot()["stats"].get(f"db_pool_{connection.alias}")
+        return {
+            "rps": len(timings) / elapsed if elapsed else 0,
+            "p50": statistics.median(latencies),
+            "p95": percentile(latencies, 95),
+            "errors": sum(1 for ms, ok in timings if not ok),
+            # из пула connection_created приходит на каждую выдачу: физических — pool["created"]
+            "connections": pool["created"] if pool else len(opened),
+            "pool_wait_p95": pool["wait_ms_p95"] if pool else None,
+        }
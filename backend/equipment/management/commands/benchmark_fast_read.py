@@ -0,0 +1,57 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from core.renderers import FastJSONRenderer
+from equipment.fastread import ValuesReader
+from equipment.models import Machine, Maintenance, Claim
+from equipment.serializers import ClaimSerializer, MachineListSerializer, MaintenanceSerializer
+
+CASES = {
+    "maintenance": (MaintenanceSerializer,
+                    lambda: Maintenance.objects.select_related("machine", "maintenance_type")),
+    "claims": (ClaimSerializer, lambda: Claim.objects.select_related("machine")),
+    "machines": (MachineListSerializer, lambda: Machine.objects.select_related("summary")),
+}
+
+
+class Command(BaseCommand):
+    help = ("Сравнивает сериализаторы DRF + JSONRenderer с ValuesReader + FastJSONRenderer "
+            "на текущих данных: строк в секунду и совпадение результата.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1000, help="Строк на прогон")
+        parser.add_argument("--repeat", type=int, default=10)
+
+    def handle(self, *args, **o):
+        for name, (serializer_class, queryset) in CASES.items():
+            qs = queryset().order_by("pk")[:o["rows"]]
+            reader = ValuesReader(serializer_class)
+
+            def drf():
+                return JSONRenderer().render(serializer_class(qs.all(), many=True).data)
+
+            def fast():
+                return FastJSONRenderer().render(reader.rows(reader.values(qs.all())))
+
+            slow_ms, fast_ms = self.measure(drf, o["repeat"]), self.measure(fast, o["repeat"])
+            same = drf() == fast()
+            rows = qs.count()
+            self.stdout.write(
+                f"{name:<12} строк {rows:>6}   DRF {slow_ms:8.2f} ms ({self.rate(rows, slow_ms)})   "
+                f"fast {fast_ms:8.2f} ms ({self.rate(rows, fast_ms)})   "
+                f"x{slow_ms / fast_ms if fast_ms else 0:.1f}   "
+                + ("совпадает" if same else self.style.ERROR("РАСХОЖДЕНИЕ")))
+
+    def measure(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def rate(self, rows, ms):
+        return f"{rows / ms * 1000:,.0f} строк/с" if ms else "-"
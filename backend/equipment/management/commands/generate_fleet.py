@@ -0,0 +1,141 @@
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from equipment.models import Machine, MaintenanceType, Maintenance, Claim
+from equipment.roles import CLIENT_GROUP, MANAGER_GROUP, SERVICE_GROUP
+from equipment.signals import bulk_created
+
+MODELS = ["ПД1,5", "ПД2,0", "ПД3,0", "ПГ1,5", "ПГ2,5", "ЭП1,6"]
+ENGINES = ["Kubota D1803", "ММЗ Д-245", "Nissan K25", "Toyota 4Y"]
+TRANSMISSIONS = ["10VB-00106", "HL-200", "Powershift 2F1R"]
+AXLES = ["20VB-00104", "АМ-2", "Dana 112"]
+NODES = ["Двигатель", "Трансмиссия", "Ведущий мост", "Управляемый мост", "Гидравлика", "Электрика"]
+RECOVERY = ["Замена узла", "Ремонт узла", "Регулировка"]
+MAINTENANCE_TYPES = ["ТО-0 (обкатка)", "ТО-1", "ТО-2", "ТО-3", "ТО-4"]
+CITIES = ["Москва", "Чебоксары", "Казань", "Новосибирск", "Екатеринбург", "Самара"]
+
+BENCH_PASSWORD = "bench-pass"
+
+
+class Command(BaseCommand):
+    help = ("Генерирует синтетический парк: машины, ТО и рекламации, клиентов и сервисные "
+            "организации в группах ролей. Пользователи: bench_manager, bench_client_<i>, "
+            f"bench_service_<i>, пароль {BENCH_PASSWORD}.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--machines", type=int, default=1000)
+        parser.add_argument("--maintenance", type=int, default=10, help="ТО на машину")
+        parser.add_argument("--claims", type=int, default=3, help="Рекламаций на машину")
+        parser.add_argument("--clients", type=int, default=50)
+        parser.add_argument("--services", type=int, default=10)
+        parser.add_argument("--serial-start", type=int, default=10_000_000)
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **o):
+        rnd = random.Random(o["seed"])
+        clients, services = self.users(o["clients"], o["services"])
+        types = [MaintenanceType.objects.get_or_create(name=name)[0] for name in MAINTENANCE_TYPES]
+
+        existing = set(Machine.objects.filter(
+            serial_number__gte=str(o["serial_start"])).values_list("serial_number", flat=True))
+        serial = o["serial_start"]
+        created = maintenance_total = claims_total = 0
+        while created < o["machines"]:
+            size = min(o["batch_size"], o["machines"] - created)
+            machines = []
+            while len(machines) < size:
+                serial += 1
+                if str(serial) in existing:
+                    continue
+                machines.append(self.machine(rnd, str(serial), clients, services))
+            with transaction.atomic():
+                Machine.objects.bulk_create(machines)
+                bulk_created.send(sender=Machine, objects=machines)
+                maintenance_total += self.history(
+                    Maintenance, [self.maintenance(rnd, m, types, o["maintenance"]) for m in machines])
+                claims_total += self.history(
+                    Claim, [self.claims(rnd, m, o["claims"]) for m in machines])
+            created += size
+            self.stdout.write(f"машин: {created}/{o['machines']}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано машин: {created}, ТО: {maintenance_total}, рекламаций: {claims_total}"))
+
+    def users(self, n_clients, n_services):
+        password = make_password(BENCH_PASSWORD)
+        groups = {name: Group.objects.get_or_create(name=name)[0]
+                  for name in (CLIENT_GROUP, SERVICE_GROUP, MANAGER_GROUP)}
+
+        def ensure(username, group):
+            user, _ = User.objects.get_or_create(username=username, defaults={"password": password})
+            user.groups.add(group)
+            return user
+
+        ensure("bench_manager", groups[MANAGER_GROUP])
+        clients = [ensure(f"bench_client_{i}", groups[CLIENT_GROUP]) for i in range(n_clients)]
+        services = [ensure(f"bench_service_{i}", groups[SERVICE_GROUP]) for i in range(n_services)]
+        return clients, services
+
+    def machine(self, rnd, serial, clients, services):
+        service = rnd.choice(services) if services else None
+        client = rnd.choice(clients) if clients else None
+        return Machine(
+            serial_number=serial,
+            model_name=rnd.choice(MODELS),
+            engine_model=rnd.choice(ENGINES),
+            engine_serial=str(rnd.randint(100000, 999999)),
+            transmission_model=rnd.choice(TRANSMISSIONS),
+            transmission_serial=str(rnd.randint(100000, 999999)),
+            drive_axle_model=rnd.choice(AXLES),
+            drive_axle_serial=str(rnd.randint(100000, 999999)),
+            steer_axle_model=rnd.choice(AXLES),
+            steer_axle_serial=str(rnd.randint(100000, 999999)),
+            shipment_date=date(2015, 1, 1) + timedelta(days=rnd.randint(0, 3650)),
+            buyer=f"ООО «{client.username if client else 'Покупатель'}»",
+            recipient=f"ООО «Получатель {rnd.randint(1, 500)}»",
+            delivery_address=f"г. {rnd.choice(CITIES)}",
+            options="Стандарт" if rnd.random() < 0.7 else "Стандарт, кондиционер",
+            service_company=service.username if service else "",
+            client=client,
+            service_org=service,
+        )
+
+    def maintenance(self, rnd, machine, types, count):
+        day, hours = machine.shipment_date, 0
+        rows = []
+        for i in range(count):
+            day += timedelta(days=rnd.randint(30, 120))
+            hours += rnd.randint(50, 300)
+            rows.append(Maintenance(
+                machine=machine, maintenance_type=types[min(i, len(types) - 1)],
+                date=day, operating_hours=hours,
+                order_number=f"{machine.serial_number}-{i + 1}", order_date=day,
+                service_company=machine.service_company,
+            ))
+        return rows
+
+    def claims(self, rnd, machine, count):
+        rows = []
+        for _ in range(count):
+            failure = machine.shipment_date + timedelta(days=rnd.randint(10, 2500))
+            downtime = rnd.randint(4, 240)
+            rows.append(Claim(
+                machine=machine, failure_date=failure, operating_hours=rnd.randint(10, 5000),
+                failure_node=rnd.choice(NODES), failure_description="Отказ при эксплуатации",
+                recovery_method=rnd.choice(RECOVERY), used_spare="",
+                restored_date=failure + timedelta(days=downtime // 24 + 1), downtime_hours=downtime,
+            ))
+        return rows
+
+    def history(self, model, per_machine):
+        objects = [obj for rows in per_machine for obj in rows]
+        if objects:
+            model.objects.bulk_create(objects, batch_size=2000)
+            bulk_created.send(sender=model, objects=objects)
+        return len(objects)
@@ -0,0 +1,35 @@
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from equipment.importers import BATCH_SIZE, IMPORTERS, import_file
+
+
+class Command(BaseCommand):
+    help = "Массовая загрузка машин, ТО или рекламаций из CSV/XLSX (заголовки как в выгрузке)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(IMPORTERS))
+        parser.add_argument("path")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Только проверить строки, ничего не записывать")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["path"], "rb") as f:
+                report = import_file(options["kind"], f, options["path"],
+                                     batch_size=options["batch_size"],
+                                     dry_run=options["dry_run"])
+        except OSError as e:
+            raise CommandError(str(e))
+        except ValidationError as e:
+            raise CommandError("; ".join(e.messages))
+
+        for error in report.errors:
+            self.stderr.write(f"строка {error['row']}: {json.dumps(error['errors'], ensure_ascii=False)}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Строк: {report.rows}, загружено: {report.created}, с ошибками: {len(report.errors)}, "
+            f"{report.seconds:.2f} с ({report.rows_per_second:.0f} строк/с)"
+        ))
@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from equipment.events import broker
+
+
+class Command(BaseCommand):
+    help = ("Нагрузочный тест /api/events/: открывает N SSE-подключений к ASGI-приложению "
+            "в этом процессе, публикует M событий и считает доставку, соединения и задержку "
+            "раздачи (от публикации до отправки в поток).")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--connections", type=int, default=200)
+        parser.add_argument("--events", type=int, default=100)
+        parser.add_argument("--rate", type=float, default=0,
+                            help="Событий в секунду (0 — без пауз)")
+        parser.add_argument("--user", default="bench_manager",
+                            help="Пользователь подписчиков (по умолчанию из generate_fleet)")
+        parser.add_argument("--timeout", type=float, default=30)
+
+    def handle(self, *args, **o):
+        user = User.objects.filter(username=o["user"]).first()
+        if user is None:
+            raise CommandError(f"Нет пользователя {o['user']}: создайте парк командой generate_fleet.")
+        token = str(AccessToken.for_user(user))
+        broker.reset_stats()
+        result = asyncio.run(self.run(token, o))
+        stats = broker.stats()
+        expected = o["connections"] * o["events"]
+        self.stdout.write(
+            f"подключений {stats['connections_peak']}/{o['connections']}   "
+            f"событий {o['events']}   доставлено {result['received']}/{expected}   "
+            f"переполнений {stats['overflows']}\n"
+            f"раздача p50 {stats['fanout_ms_p50']:.2f} ms   p95 {stats['fanout_ms_p95']:.2f} ms   "
+            f"подключение {result['connect_s']:.2f} s   раздача всего {result['publish_s']:.2f} s")
+        if result["received"] < expected:
+            self.stdout.write(self.style.WARNING("Доставлены не все события (таймаут или reset)."))
+
+    async def run(self, token, o):
+        app = get_asgi_application()
+        disconnect = asyncio.Event()
+        received = [0] * o["connections"]
+        done = asyncio.Event()
+
+        def client(index):
+            sent = False
+
+            async def receive():
+                nonlocal sent
+                if not sent:
+                    sent = True
+                    return {"type": "http.request", "body": b"", "more_body": False}
+                await disconnect.wait()
+                return {"type": "http.disconnect"}
+
+            async def send(message):
+                if message["type"] == "http.response.start" and message["status"] != 200:
+                    raise CommandError(f"/api/events/ ответил {message['status']}")
+                if message["type"] == "http.response.body":
+                    received[index] += message.get("body", b"").count(b"event: change")
+                    if sum(received) >= o["connections"] * o["events"]:
+                        done.set()
+
+            scope = {
+                "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+                "method": "GET", "scheme": "http", "path": "/api/events/",
+                "raw_path": b"/api/events/", "root_path": "",
+                "query_string": f"token={token}".encode(),
+                "headers": [(b"host", b"localhost")],
+                "client": ("127.0.0.1", 10000 + index), "server": ("localhost", 80),
+            }
+            return app(scope, receive, send)
+
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(client(i)) for i in range(o["connections"])]
+        while broker.connections < o["connections"]:
+            if time.perf_counter() - started > o["timeout"]:
+                raise CommandError(f"Подключилось только {broker.connections} клиентов")
+            await asyncio.sleep(0.01)
+        connect_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        # публикация из другого потока — как on_commit в потоке обработки записи
+        thread = threading.Thread(target=self.publish, args=(o["events"], o["rate"]))
+        thread.start()
+        try:
+            await asyncio.wait_for(done.wait(), timeout=o["timeout"])
+        except asyncio.TimeoutError:
+            pass
+        publish_s = time.perf_counter() - started
+        thread.join()
+
+        disconnect.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return {"received": sum(received), "connect_s": connect_s, "publish_s": publish_s}
+
+    def publish(self, count, rate):
+        for i in range(count):
+            broker.publish({"model": "claim", "id": i, "op": "upsert", "machine": 0, "seq": i + 1,
+                            "client": None, "service_org": None})
+            if rate:
+                time.sleep(1 / rate)
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from equipment import sync
+
+
+class Command(BaseCommand):
+    help = ("Удаляет надгробия /api/sync/ старше SYNC_TOMBSTONE_DAYS дней. Клиенты с более "
+            "старым токеном получат reset=true и синхронизируются заново. Заодно нумерует "
+            "записи, оставшиеся без номера изменения после пакетной вставки.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=None,
+                            help="Срок хранения, дней (по умолчанию SYNC_TOMBSTONE_DAYS)")
+
+    def handle(self, *args, **options):
+        days = options["days"] if options["days"] is not None else settings.SYNC_TOMBSTONE_DAYS
+        deleted = sync.prune(timezone.now() - timedelta(days=days))
+        self.stdout.write(self.style.SUCCESS(f"Удалено надгробий: {deleted}"))
+        stamped = sync.stamp_unstamped()
+        if stamped:
+            self.stdout.write(self.style.WARNING(f"Пронумеровано записей без номера: {stamped}"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from equipment import counters
+from equipment.models import Machine
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает Machine.maintenance_count и Machine.claims_count по фактическим данным."
+
+    def add_arguments(self, parser):
+        parser.add_argument("serials", nargs="*",
+                            help="Зав. номера машин (по умолчанию — все машины)")
+
+    def handle(self, *args, **options):
+        qs = Machine.objects.all()
+        if options["serials"]:
+            qs = qs.filter(serial_number__in=options["serials"])
+        fixed = counters.rebuild(qs)
+        self.stdout.write(self.style.SUCCESS(f"Исправлено машин: {fixed}"))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from equipment import summary
+from equipment.models import Machine
+
+
+class Command(BaseCommand):
+    help = ("Сверяет сводки машин (MachineSummary) с ТО и рекламациями и исправляет расхождения. "
+            "При MACHINE_SUMMARY_REFRESH=batch запускается периодически.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("serials", nargs="*",
+                            help="Зав. номера машин (по умолчанию — все машины)")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        qs = Machine.objects.all()
+        if options["serials"]:
+            qs = qs.filter(serial_number__in=options["serials"])
+        fixed = summary.rebuild(qs, batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Исправлено сводок: {fixed}"))
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from equipment import authentication
+
+
+class Command(BaseCommand):
+    help = ("Отзывает выданные пользователям JWT-токены (access и refresh). Другие процессы "
+            "перестают их принимать не позже чем через JWT_REVOCATION_WINDOW секунд.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("usernames", nargs="*")
+        parser.add_argument("--all", action="store_true", help="Все пользователи")
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if not options["all"]:
+            if not options["usernames"]:
+                raise CommandError("Укажите пользователей или --all.")
+            users = users.filter(username__in=options["usernames"])
+            missing = set(options["usernames"]) - set(users.values_list("username", flat=True))
+            if missing:
+                raise CommandError(f"Нет пользователей: {', '.join(sorted(missing))}")
+        ids = list(users.values_list("pk", flat=True))
+        authentication.revoke(ids)
+        self.stdout.write(self.style.SUCCESS(
+            f"Токены отозваны: {len(ids)} польз. (окно {settings.JWT_REVOCATION_WINDOW} с)"))
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0005_alter_machine_serial_number'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='claim',
+            index=models.Index(fields=['machine', '-failure_date', 'id'], name='claim_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='machine',
+            index=models.Index(fields=['-shipment_date', 'id'], name='machine_shipment_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='maintenance',
+            index=models.Index(fields=['machine', '-date', 'id'], name='maintenance_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:09
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Machine = apps.get_model('equipment', 'Machine')
+    Maintenance = apps.get_model('equipment', 'Maintenance')
+    Claim = apps.get_model('equipment', 'Claim')
+
+    def count(model):
+        qs = (model.objects.filter(machine=OuterRef('pk')).order_by()
+              .values('machine').annotate(n=Count('*')).values('n'))
+        return Coalesce(Subquery(qs, output_field=IntegerField()), 0)
+
+    Machine.objects.update(maintenance_count=count(Maintenance), claims_count=count(Claim))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0006_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='machine',
+            name='claims_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество рекламаций'),
+        ),
+        migrations.AddField(
+            model_name='machine',
+            name='maintenance_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество ТО'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
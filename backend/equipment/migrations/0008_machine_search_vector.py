@@ -0,0 +1,75 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:11
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Поля и веса должны совпадать с equipment.search.WEIGHTED_FIELDS.
+WEIGHTED_FIELDS = (
+    ('model_name', 'A'),
+    ('engine_model', 'B'),
+    ('transmission_model', 'B'),
+    ('engine_serial', 'B'),
+    ('transmission_serial', 'B'),
+    ('service_company', 'C'),
+    ('buyer', 'C'),
+    ('recipient', 'C'),
+    ('delivery_address', 'D'),
+)
+
+VECTOR_SQL = ' || '.join(
+    f"setweight(to_tsvector('russian', coalesce(NEW.{field}, '')), '{weight}')"
+    for field, weight in WEIGHTED_FIELDS
+)
+
+FORWARD_SQL = [
+    f"""
+    CREATE OR REPLACE FUNCTION equipment_machine_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := {VECTOR_SQL};
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+    """,
+    f"""
+    CREATE TRIGGER equipment_machine_search_vector_trg
+    BEFORE INSERT OR UPDATE OF {', '.join(field for field, _ in WEIGHTED_FIELDS)}, search_vector
+    ON equipment_machine
+    FOR EACH ROW EXECUTE FUNCTION equipment_machine_search_vector();
+    """,
+    # Заполнить вектор для уже существующих машин.
+    "UPDATE equipment_machine SET search_vector = NULL;",
+    "CREATE INDEX equipment_machine_search_gin ON equipment_machine USING gin (search_vector);",
+    "CREATE INDEX equipment_machine_serial_prefix ON equipment_machine (serial_number varchar_pattern_ops);",
+]
+
+BACKWARD_SQL = [
+    "DROP INDEX IF EXISTS equipment_machine_serial_prefix;",
+    "DROP INDEX IF EXISTS equipment_machine_search_gin;",
+    "DROP TRIGGER IF EXISTS equipment_machine_search_vector_trg ON equipment_machine;",
+    "DROP FUNCTION IF EXISTS equipment_machine_search_vector();",
+]
+
+
+def postgres_only(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0007_machine_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='machine',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(postgres_only(FORWARD_SQL), postgres_only(BACKWARD_SQL)),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Q, Sum
+
+
+def fill_summaries(apps, schema_editor):
+    Machine = apps.get_model('equipment', 'Machine')
+    Maintenance = apps.get_model('equipment', 'Maintenance')
+    Claim = apps.get_model('equipment', 'Claim')
+    MachineSummary = apps.get_model('equipment', 'MachineSummary')
+
+    rows = {pk: {} for pk in Machine.objects.values_list('pk', flat=True)}
+    for pk, last_date, hours in (Maintenance.objects.order_by().values_list('machine_id')
+                                 .annotate(last=Max('date'), hours=Max('operating_hours'))):
+        rows[pk].update(last_maintenance_date=last_date, operating_hours=hours or 0)
+    for pk, last_failure, hours, open_claims, downtime in (
+            Claim.objects.order_by().values_list('machine_id').annotate(
+                last=Max('failure_date'), hours=Max('operating_hours'),
+                open=Count('id', filter=Q(restored_date__isnull=True)), downtime=Sum('downtime_hours'))):
+        row = rows[pk]
+        row.update(last_failure_date=last_failure, open_claims=open_claims, downtime_total=downtime or 0)
+        row['operating_hours'] = max(row.get('operating_hours', 0), hours or 0)
+    MachineSummary.objects.bulk_create(
+        [MachineSummary(machine_id=pk, **row) for pk, row in rows.items()], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0009_change_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MachineSummary',
+            fields=[
+                ('machine', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='equipment.machine', verbose_name='Машина')),
+                ('last_maintenance_date', models.DateField(blank=True, null=True, verbose_name='Дата последнего ТО')),
+                ('last_failure_date', models.DateField(blank=True, null=True, verbose_name='Дата последнего отказа')),
+                ('operating_hours', models.PositiveIntegerField(default=0, verbose_name='Последняя наработка, м/час')),
+                ('open_claims', models.PositiveIntegerField(default=0, verbose_name='Открытые рекламации')),
+                ('downtime_total', models.PositiveIntegerField(default=0, verbose_name='Суммарный простой, часов')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Сводка по машине',
+                'verbose_name_plural': 'Сводки по машинам',
+            },
+        ),
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Max
+from django.utils import timezone
+
+
+def number_existing_rows(apps, schema_editor):
+    # Уникальные номера без перебора строк: машины, затем ТО, затем рекламации по id.
+    offset = 0
+    for name in ('Machine', 'Maintenance', 'Claim'):
+        model = apps.get_model('equipment', name)
+        model.objects.update(change_seq=F('id') + offset)
+        offset += model.objects.aggregate(m=Max('id'))['m'] or 0
+    apps.get_model('equipment', 'ChangeVersion').objects.update_or_create(
+        key='sync', defaults={'version': offset, 'updated_at': timezone.now()})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0010_machine_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='claim',
+            name='change_seq',
+            field=models.PositiveBigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='machine',
+            name='change_seq',
+            field=models.PositiveBigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='maintenance',
+            name='change_seq',
+            field=models.PositiveBigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.PositiveBigIntegerField(db_index=True)),
+                ('model', models.CharField(max_length=16)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('client', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('service_org', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Удалённая запись',
+                'verbose_name_plural': 'Удалённые записи',
+            },
+        ),
+        migrations.RunPython(number_existing_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:03
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+def copy_machine_serial(apps, schema_editor):
+    serial = apps.get_model('equipment', 'Machine').objects.filter(
+        pk=OuterRef('machine_id')).values('serial_number')[:1]
+    for name in ('Maintenance', 'Claim'):
+        apps.get_model('equipment', name).objects.update(machine_serial=Subquery(serial))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0011_sync_changes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='claim',
+            options={'ordering': ['machine_serial', '-failure_date'], 'verbose_name': 'Рекламация', 'verbose_name_plural': 'Рекламации'},
+        ),
+        migrations.AlterModelOptions(
+            name='maintenance',
+            options={'ordering': ['machine_serial', '-date'], 'verbose_name': 'ТО', 'verbose_name_plural': 'ТО'},
+        ),
+        migrations.AddField(
+            model_name='claim',
+            name='machine_serial',
+            field=models.CharField(blank=True, editable=False, max_length=32, verbose_name='Зав. № машины'),
+        ),
+        migrations.AddField(
+            model_name='maintenance',
+            name='machine_serial',
+            field=models.CharField(blank=True, editable=False, max_length=32, verbose_name='Зав. № машины'),
+        ),
+        # до индексов: заполнить таблицу дешевле, чем заодно перестраивать индекс
+        migrations.RunPython(copy_machine_serial, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='claim',
+            index=models.Index(fields=['machine_serial', '-failure_date', 'id'], name='claim_serial_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='machine',
+            index=models.Index(fields=['client', '-shipment_date', 'id'], name='machine_client_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='machine',
+            index=models.Index(fields=['service_org', '-shipment_date', 'id'], name='machine_service_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='maintenance',
+            index=models.Index(fields=['machine_serial', '-date', 'id'], name='maintenance_serial_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:35
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.conf import settings
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+# Индексы pg_trgm, которые 0012 создавала сырым SQL (вне состояния миграций)
+OLD_TRIGRAM_SQL = [
+    f"DROP INDEX IF EXISTS {table}_{column}_trgm;" for table, column in (
+        ('equipment_machine', 'serial_number'),
+        ('equipment_machine', 'service_company'),
+        ('equipment_maintenance', 'service_company'),
+        ('equipment_claim', 'failure_node'),
+        ('equipment_claim', 'recovery_method'),
+    )
+]
+
+
+def postgres_only(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class AddTrigramIndex(migrations.AddIndex):
+    """AddIndex для GIN-индекса pg_trgm: в состоянии — всегда, в БД — только в PostgreSQL."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0012_record_machine_serial_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(postgres_only(OLD_TRIGRAM_SQL), migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='claim',
+            index=models.Index(fields=['failure_node'], name='claim_failure_node_idx'),
+        ),
+        AddTrigramIndex(
+            model_name='claim',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('failure_node'), name='gin_trgm_ops'), name='claim_failure_node_trgm_idx'),
+        ),
+        AddTrigramIndex(
+            model_name='claim',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('recovery_method'), name='gin_trgm_ops'), name='claim_recovery_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='machine',
+            index=models.Index(fields=['service_company'], name='machine_service_company_idx'),
+        ),
+        AddTrigramIndex(
+            model_name='machine',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('serial_number'), name='gin_trgm_ops'), name='machine_serial_trgm_idx'),
+        ),
+        AddTrigramIndex(
+            model_name='machine',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('service_company'), name='gin_trgm_ops'), name='machine_service_trgm_idx'),
+        ),
+        AddTrigramIndex(
+            model_name='machine',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('model_name'), name='gin_trgm_ops'), name='machine_model_trgm_idx'),
+        ),
+        AddTrigramIndex(
+            model_name='machine',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('engine_model'), name='gin_trgm_ops'), name='machine_engine_trgm_idx'),
+        ),
+        AddTrigramIndex(
+            model_name='machine',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('transmission_model'), name='gin_trgm_ops'), name='machine_transmission_trgm_idx'),
+        ),
+        AddTrigramIndex(
+            model_name='machine',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('steer_axle_model'), name='gin_trgm_ops'), name='machine_steer_axle_trgm_idx'),
+        ),
+        AddTrigramIndex(
+            model_name='machine',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('drive_axle_model'), name='gin_trgm_ops'), name='machine_drive_axle_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='maintenance',
+            index=models.Index(fields=['service_company'], name='maintenance_service_idx'),
+        ),
+        AddTrigramIndex(
+            model_name='maintenance',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('service_company'), name='gin_trgm_ops'), name='maintenance_service_trgm_idx'),
+        ),
+    ]
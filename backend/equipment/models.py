@@ -1,7 +1,21 @@
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models.functions import Upper
 from django.contrib.auth.models import User
 from django.core.validators import RegexValidator
 
+from . import counters, sync
+from .counters import COUNTER_FIELDS
+
+
+def trigram_index(field, name):
+    """
+    GIN-индекс pg_trgm для фильтров icontains: Django ищет по UPPER(поле) LIKE UPPER('%...%'),
+    поэтому индекс — по тому же выражению (только PostgreSQL, см. миграцию 0013).
+    """
+    return GinIndex(OpClass(Upper(field), name="gin_trgm_ops"), name=name)
+
 
 class Machine(models.Model):
     model_name = models.CharField(
@@ -56,14 +70,121 @@ class Machine(models.Model):
         on_delete=models.SET_NULL, verbose_name="Сервисная организация"
     )
 
+    # Денормализованные счётчики, поддерживаются Maintenance/Claim (см. counters.py)
+    maintenance_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Количество ТО")
+    claims_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Количество рекламаций")
+
+    # Заполняется триггером PostgreSQL (миграция 0008), см. search.py
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # Номер последнего изменения для /api/sync/ (см. sync.py)
+    change_seq = models.PositiveBigIntegerField(default=0, editable=False, db_index=True)
+
     class Meta:
         ordering = ["serial_number"]
+        indexes = [
+            models.Index(fields=["-shipment_date", "id"],
+                         name="machine_shipment_keyset_idx"),
+            # списки клиента и сервисной организации (restrict_by_role) в порядке keyset
+            models.Index(fields=["client", "-shipment_date", "id"],
+                         name="machine_client_keyset_idx"),
+            models.Index(fields=["service_org", "-shipment_date", "id"],
+                         name="machine_service_keyset_idx"),
+            # фильтры списка машин и рекламаций (machine__service_company)
+            models.Index(fields=["service_company"], name="machine_service_company_idx"),
+            trigram_index("serial_number", "machine_serial_trgm_idx"),
+            trigram_index("service_company", "machine_service_trgm_idx"),
+            trigram_index("model_name", "machine_model_trgm_idx"),
+            trigram_index("engine_model", "machine_engine_trgm_idx"),
+            trigram_index("transmission_model", "machine_transmission_trgm_idx"),
+            trigram_index("steer_axle_model", "machine_steer_axle_trgm_idx"),
+            trigram_index("drive_axle_model", "machine_drive_axle_trgm_idx"),
+        ]
         verbose_name = "Машина"
         verbose_name_plural = "Машины"
 
     def __str__(self):
         return f"{self.model_name} #{self.serial_number}"
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            old_owners, serial_changed = None, False
+            if not self._state.adding:
+                # Обновление машины не должно затирать вычисляемые поля (счётчики,
+                # search_vector), которые меняются в обход экземпляра.
+                update_fields = kwargs.get("update_fields")
+                if update_fields is None:
+                    update_fields = [
+                        f.name for f in self._meta.concrete_fields
+                        if not f.primary_key and f.editable
+                    ]
+                kwargs["update_fields"] = [*update_fields, "change_seq"]
+                old_owners = sync.machine_owners_changed(self)
+                serial_changed = "serial_number" in update_fields
+            # прежние владельцы для событий удаления (signals.publish_owners_changed)
+            self._old_owners = old_owners
+            sync.stamp(self)
+            super().save(*args, **kwargs)
+            if old_owners is not None:
+                sync.restamp_machine_records(self)
+            if serial_changed:
+                # копия номера в ТО и рекламациях (CountedByMachine.machine_serial)
+                for model in (Maintenance, Claim):
+                    (model.objects.filter(machine_id=self.pk)
+                     .exclude(machine_serial=self.serial_number)
+                     .update(machine_serial=self.serial_number))
+
+
+class CountedByMachine(models.Model):
+    """
+    Запись, которая учитывается в счётчике машины (ТО, рекламация).
+    Вставка и перенос на другую машину меняют счётчик в одной транзакции с записью.
+    """
+    counter_field = None
+    sync_kind = None
+
+    # Номер последнего изменения для /api/sync/ (см. sync.py)
+    change_seq = models.PositiveBigIntegerField(default=0, editable=False, db_index=True)
+    # Копия Machine.serial_number: списки сортируются по номеру машины без JOIN.
+    # Поддерживается save() здесь и в Machine, после bulk_create — сигналом.
+    machine_serial = models.CharField(
+        max_length=32, blank=True, editable=False, verbose_name="Зав. № машины")
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            if self._state.adding:
+                self.machine_serial = self.machine.serial_number
+                sync.stamp(self)
+                super().save(*args, **kwargs)
+                counters.adjust(self.machine_id, self.counter_field, 1)
+                return
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                kwargs["update_fields"] = [*update_fields, "change_seq"]
+            if update_fields is not None and "machine" not in update_fields:
+                sync.stamp(self)
+                return super().save(*args, **kwargs)
+            if update_fields is not None:
+                kwargs["update_fields"].append("machine_serial")
+            self.machine_serial = self.machine.serial_number
+            old_machine_id = (type(self).objects.filter(pk=self.pk)
+                              .values_list("machine_id", flat=True).first())
+            # Прежняя машина нужна сигналам, чтобы сбросить и её версию.
+            self._old_machine_id = old_machine_id
+            if old_machine_id is not None and old_machine_id != self.machine_id:
+                # прежним владельцам запись больше не видна
+                sync.bury_record(self.sync_kind, self.pk, old_machine_id)
+            sync.stamp(self)
+            super().save(*args, **kwargs)
+            if old_machine_id is not None and old_machine_id != self.machine_id:
+                counters.adjust(old_machine_id, self.counter_field, -1)
+                counters.adjust(self.machine_id, self.counter_field, 1)
+
 
 class MaintenanceType(models.Model):
     name = models.CharField(max_length=100, unique=True, verbose_name="Вид ТО")
@@ -77,7 +198,7 @@ class MaintenanceType(models.Model):
         return self.name
 
 
-class Maintenance(models.Model):
+class Maintenance(CountedByMachine):
     machine = models.ForeignKey(
         Machine, on_delete=models.CASCADE, verbose_name="Зав. № машины")
     maintenance_type = models.ForeignKey(
@@ -93,8 +214,19 @@ class Maintenance(models.Model):
     service_company = models.CharField(
         max_length=255, blank=True, verbose_name="Организация, проводившая ТО")
 
+    counter_field = COUNTER_FIELDS["maintenance"]
+    sync_kind = sync.MAINTENANCE
+
     class Meta:
-        ordering = ["-date", "machine__serial_number"]
+        ordering = ["machine_serial", "-date"]
+        indexes = [
+            models.Index(fields=["machine", "-date", "id"],
+                         name="maintenance_keyset_idx"),
+            models.Index(fields=["machine_serial", "-date", "id"],
+                         name="maintenance_serial_keyset_idx"),
+            models.Index(fields=["service_company"], name="maintenance_service_idx"),
+            trigram_index("service_company", "maintenance_service_trgm_idx"),
+        ]
         verbose_name = "ТО"
         verbose_name_plural = "ТО"
 
@@ -102,7 +234,7 @@ class Maintenance(models.Model):
         return f"ТО {self.maintenance_type} — {self.machine}"
 
 
-class Claim(models.Model):
+class Claim(CountedByMachine):
     machine = models.ForeignKey(
         Machine, on_delete=models.CASCADE, verbose_name="Зав. № машины")
     failure_date = models.DateField(
@@ -122,10 +254,93 @@ class Claim(models.Model):
     downtime_hours = models.PositiveIntegerField(
         null=True, blank=True, verbose_name="Время простоя (часов)")
 
+    counter_field = COUNTER_FIELDS["claim"]
+    sync_kind = sync.CLAIM
+
     class Meta:
-        ordering = ["-failure_date", "machine__serial_number"]
+        ordering = ["machine_serial", "-failure_date"]
+        indexes = [
+            models.Index(fields=["machine", "-failure_date", "id"],
+                         name="claim_keyset_idx"),
+            models.Index(fields=["machine_serial", "-failure_date", "id"],
+                         name="claim_serial_keyset_idx"),
+            models.Index(fields=["failure_node"], name="claim_failure_node_idx"),
+            trigram_index("failure_node", "claim_failure_node_trgm_idx"),
+            trigram_index("recovery_method", "claim_recovery_trgm_idx"),
+        ]
         verbose_name = "Рекламация"
         verbose_name_plural = "Рекламации"
 
     def __str__(self):
         return f"Рекламация {self.machine} ({self.failure_date})"
+
+
+class ChangeVersion(models.Model):
+    """
+    Счётчик изменений по ключу: таблица ("machine", "maintenance", ...) или отдельная
+    машина ("machine:42"). Увеличивается при каждой записи (см. signals.py, versions.py)
+    и служит дешёвым валидатором для ETag / Last-Modified.
+    """
+    key = models.CharField(max_length=64, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Версия данных"
+        verbose_name_plural = "Версии данных"
+
+    def __str__(self):
+        return f"{self.key} v{self.version}"
+
+
+class MachineSummary(models.Model):
+    """
+    Производные данные машины для списков, поиска и аналитики (read model).
+    Обновляется из сигналов ТО и рекламаций или пакетно (см. summary.py);
+    счётчики ТО/рекламаций остаются на самой машине (Machine.*_count).
+    """
+    machine = models.OneToOneField(
+        Machine, on_delete=models.CASCADE, primary_key=True,
+        related_name="summary", verbose_name="Машина")
+    last_maintenance_date = models.DateField(
+        null=True, blank=True, verbose_name="Дата последнего ТО")
+    last_failure_date = models.DateField(
+        null=True, blank=True, verbose_name="Дата последнего отказа")
+    operating_hours = models.PositiveIntegerField(
+        default=0, verbose_name="Последняя наработка, м/час")
+    open_claims = models.PositiveIntegerField(
+        default=0, verbose_name="Открытые рекламации")
+    downtime_total = models.PositiveIntegerField(
+        default=0, verbose_name="Суммарный простой, часов")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Сводка по машине"
+        verbose_name_plural = "Сводки по машинам"
+
+    def __str__(self):
+        return f"Сводка {self.machine_id}"
+
+
+class Tombstone(models.Model):
+    """
+    След удалённой машины, ТО или рекламации для /api/sync/ (см. sync.py).
+    Владельцы — клиент и сервисная организация машины на момент удаления.
+    """
+    seq = models.PositiveBigIntegerField(db_index=True)
+    model = models.CharField(max_length=16)
+    object_id = models.PositiveBigIntegerField()
+    client = models.ForeignKey(
+        User, null=True, blank=True, related_name="+", on_delete=models.DO_NOTHING,
+        db_constraint=False)
+    service_org = models.ForeignKey(
+        User, null=True, blank=True, related_name="+", on_delete=models.DO_NOTHING,
+        db_constraint=False)
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Удалённая запись"
+        verbose_name_plural = "Удалённые записи"
+
+    def __str__(self):
+        return f"{self.model}:{self.object_id} (удалено, #{self.seq})"
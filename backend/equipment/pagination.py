@@ -0,0 +1,149 @@
+import base64
+import json
+from datetime import date, datetime
+
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def _encode(values):
+    raw = json.dumps([v.isoformat() if isinstance(v, (date, datetime)) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode(token, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise NotFound("Некорректный курсор.")
+    if not isinstance(values, list) or len(values) != size:
+        raise NotFound("Некорректный курсор.")
+    return values
+
+
+def _value(obj, path):
+    if isinstance(obj, dict):  # строки из .values() (fastread)
+        return obj[path]
+    for part in path.split("__"):
+        obj = getattr(obj, part) if obj is not None else None
+    return obj
+
+
+def _parse(ordering):
+    return [(f[1:], True) if f.startswith("-") else (f, False) for f in ordering]
+
+
+def keyset_order_by(ordering):
+    """
+    Выражения ORDER BY для keyset-сортировки. NULL всегда считается «больше» любого значения
+    (как по умолчанию в PostgreSQL), чтобы сортировка совпадала с обычными b-tree индексами.
+    """
+    return [F(field).desc(nulls_first=True) if desc else F(field).asc(nulls_last=True)
+            for field, desc in _parse(ordering)]
+
+
+def _nullable(model, path):
+    if model is None:
+        return True
+    for part in path.split("__"):
+        field = model._meta.get_field(part)
+        if field.null:
+            return True
+        model = field.related_model
+    return False
+
+
+def _leading_bound(field, desc, value, nullable):
+    """Диапазон по первой колонке сортировки: с него индекс начинается сразу у курсора."""
+    if value is None:
+        return Q() if desc else Q(**{f"{field}__isnull": True})
+    if desc:
+        return Q(**{f"{field}__lte": value})
+    bound = Q(**{f"{field}__gte": value})
+    return bound | Q(**{f"{field}__isnull": True}) if nullable else bound
+
+
+def keyset_filter(ordering, values, model=None):
+    """
+    Q для строк, идущих строго после строки со значениями values. С model ветки IS NULL
+    для NOT NULL колонок не добавляются (без model все колонки считаются NULL-допустимыми).
+    """
+    ordering = _parse(ordering)
+    result = Q(pk__in=[])
+    equal = Q()
+    for (field, desc), value in zip(ordering, values):
+        nullable = _nullable(model, field)
+        if value is None:
+            after = Q(**{f"{field}__isnull": False}) if desc else Q(pk__in=[])
+            same = Q(**{f"{field}__isnull": True})
+        else:
+            after = Q(**{f"{field}__lt": value}) if desc else Q(**{f"{field}__gt": value})
+            if nullable and not desc:
+                after |= Q(**{f"{field}__isnull": True})
+            same = Q(**{field: value})
+        result |= equal & after
+        equal &= same
+    (field, desc), value = ordering[0], values[0]
+    return _leading_bound(field, desc, value, _nullable(model, field)) & result
+
+
+class KeysetPagination(PageNumberPagination):
+    """
+    Обычная постраничная пагинация, а при передаче ?cursor= — keyset-пагинация
+    по view.keyset_ordering: без COUNT(*) и OFFSET, стоимость страницы не зависит от её номера.
+    Первая страница запрашивается с пустым курсором (?cursor=), следующие — по ссылке next.
+    В этом режиме параметр ?ordering игнорируется.
+    """
+    cursor_query_param = "cursor"
+    # сортировка курсора; None — view.keyset_ordering
+    keyset_ordering = None
+    # всегда keyset, даже без ?cursor= (вложенные списки карточки машины)
+    keyset_only = False
+
+    def __init__(self, keyset_ordering=None, keyset_only=None):
+        if keyset_ordering is not None:
+            self.keyset_ordering = keyset_ordering
+        if keyset_only is not None:
+            self.keyset_only = keyset_only
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.keyset_only or self.cursor_query_param in request.query_params
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        ordering = self.keyset_ordering or view.keyset_ordering
+        page_size = self.get_page_size(request)
+        token = request.query_params.get(self.cursor_query_param, "")
+
+        queryset = queryset.order_by(*keyset_order_by(ordering))
+        if token:
+            queryset = queryset.filter(
+                keyset_filter(ordering, _decode(token, len(ordering)), queryset.model))
+
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        self.next_cursor = None
+        if self.has_next:
+            self.next_cursor = _encode([_value(rows[-1], field) for field, _ in _parse(ordering)])
+        return rows
+
+    def get_next_link(self):
+        if not getattr(self, "keyset", False):
+            return super().get_next_link()
+        if not self.next_cursor:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response({
+            "next": self.get_next_link(),
+            "results": data,
+        })
@@ -0,0 +1,159 @@
+import threading
+import time
+
+from django.conf import settings
+
+CLIENT_GROUP = "Клиент"
+SERVICE_GROUP = "Сервисная организация"
+MANAGER_GROUP = "Менеджер"
+
+# Атрибут, в котором роль запоминается на объекте пользователя.
+# request.user живёт ровно один запрос, поэтому это и есть мемоизация на запрос.
+_USER_ATTR = "_silant_role"
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Процессный кэш с TTL: ключ -> (значение, момент истечения). Роли, а также
+    версии и права для JWT (authentication.py). Считает попадания и промахи,
+    чтобы было видно, насколько он полезен. TTL берётся из настройки setting при
+    каждой записи, поэтому override_settings и изменённые настройки действуют сразу.
+    """
+
+    def __init__(self, setting, default):
+        self.setting = setting
+        self.default = default
+        self._data = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] > now:
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return _MISSING
+
+    @property
+    def ttl(self):
+        return getattr(settings, self.setting, self.default)
+
+    def set(self, key, value):
+        ttl = self.ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+
+    def invalidate(self, keys=None):
+        with self._lock:
+            if keys is None:
+                self._data.clear()
+                return
+            for key in keys:
+                self._data.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+role_cache = TTLCache("ROLE_CACHE_TTL", 60)
+
+
+def role_from_groups(group_names, is_superuser=False):
+    """Роль по набору имён групп; приоритет: менеджер > сервис > клиент."""
+    if is_superuser or MANAGER_GROUP in group_names:
+        return "manager"
+    if SERVICE_GROUP in group_names:
+        return "service"
+    if CLIENT_GROUP in group_names:
+        return "client"
+    return None
+
+
+def get_user_role(user):
+    if not user.is_authenticated:
+        return None
+
+    role = getattr(user, _USER_ATTR, _MISSING)
+    if role is not _MISSING:
+        return role
+
+    if user.is_superuser:
+        role = "manager"
+    else:
+        role = role_cache.get(user.pk)
+    if role is _MISSING:
+        # Все группы пользователя одним запросом вместо трёх exists().
+        names = set(user.groups.values_list("name", flat=True))
+        role = role_from_groups(names, user.is_superuser)
+        role_cache.set(user.pk, role)
+
+    setattr(user, _USER_ATTR, role)
+    return role
+
+
+async def aget_user_role(user):
+    """get_user_role() для async-view: те же мемоизация и кэш, группы — через async ORM."""
+    if not user.is_authenticated:
+        return None
+
+    role = getattr(user, _USER_ATTR, _MISSING)
+    if role is not _MISSING:
+        return role
+
+    role = "manager" if user.is_superuser else role_cache.get(user.pk)
+    if role is _MISSING:
+        names = {name async for name in user.groups.values_list("name", flat=True)}
+        role = role_from_groups(names, user.is_superuser)
+        role_cache.set(user.pk, role)
+
+    # дальше синхронные restrict_by_role() / get_user_role() берут роль отсюда без запросов
+    setattr(user, _USER_ATTR, role)
+    return role
+
+
+def role_scope(user):
+    """Ключ видимости данных: у кого он совпадает, тот видит одно и то же."""
+    role = get_user_role(user)
+    # все менеджеры видят одно и то же
+    if role == "manager":
+        return "manager:*"
+    if role is None:
+        return "none" if user.is_authenticated else "anonymous"
+    return f"{role}:{user.pk}"
+
+
+def restrict_by_role(qs, user, machine_path=""):
+    """
+    Ограничивает queryset видимыми пользователю данными.
+    machine_path — путь до машины от модели queryset ("" для Machine, "machine__" для ТО и рекламаций).
+    """
+    role = get_user_role(user)
+    if role == "manager":
+        return qs
+    # по id: ленивому пользователю из JWT (authentication.ClaimsUser) не нужна строка User
+    if role == "service":
+        return qs.filter(**{f"{machine_path}service_org_id": user.pk})
+    if role == "client":
+        return qs.filter(**{f"{machine_path}client_id": user.pk})
+    return qs.none()
@@ -0,0 +1,91 @@
+"""
+Поиск машин для /api/search.
+
+На PostgreSQL используется взвешенный tsvector (Machine.search_vector), который
+поддерживает триггер из миграции 0008, и GIN-индекс по нему; результаты
+ранжируются через ts_rank. На остальных СУБД (SQLite в тестах) — прежний
+поиск через icontains. Цифровой запрос ищется как префикс зав. номера
+(индекс varchar_pattern_ops на PostgreSQL).
+
+Одинаковые одновременные запросы поиска (тот же URL и та же область видимости
+роли) выполняются один раз на процесс — flight, см. views.MachineSearchView.
+"""
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import Case, F, IntegerField, Q, Value, When
+
+from core.singleflight import SingleFlight
+
+SEARCH_CONFIG = "russian"
+
+# Поля tsvector и их веса; должны совпадать с триггером в миграции 0008.
+WEIGHTED_FIELDS = (
+    ("model_name", "A"),
+    ("engine_model", "B"),
+    ("transmission_model", "B"),
+    ("engine_serial", "B"),
+    ("transmission_serial", "B"),
+    ("service_company", "C"),
+    ("buyer", "C"),
+    ("recipient", "C"),
+    ("delivery_address", "D"),
+)
+
+flight = SingleFlight(ttl=getattr(settings, "SINGLE_FLIGHT_TTL", 1))
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def search_serial(qs, q):
+    exact_first = Case(When(serial_number=q, then=Value(0)),
+                       default=Value(1), output_field=IntegerField())
+    return (qs.filter(serial_number__startswith=q)
+            .annotate(exact=exact_first)
+            .order_by("exact", "serial_number"))
+
+
+def _prefix_tsquery(q):
+    """«пд двиг» -> 'пд:* & двиг:*' — каждое слово ищется как префикс."""
+    tokens = _TOKEN_RE.findall(q.lower())
+    return " & ".join(f"{token}:*" for token in tokens)
+
+
+class PostgresSearchEngine:
+    def search(self, qs, q):
+        raw = _prefix_tsquery(q)
+        if not raw:
+            return qs.none()
+        query = SearchQuery(raw, search_type="raw", config=SEARCH_CONFIG)
+        return (qs.filter(search_vector=query)
+                .annotate(rank=SearchRank(F("search_vector"), query))
+                .order_by("-rank", "serial_number"))
+
+
+class BasicSearchEngine:
+    def search(self, qs, q):
+        condition = Q()
+        for field, _ in WEIGHTED_FIELDS:
+            condition |= Q(**{f"{field}__icontains": q})
+        return qs.filter(condition).order_by("serial_number")
+
+
+ENGINES = {
+    "postgres": PostgresSearchEngine,
+    "basic": BasicSearchEngine,
+}
+
+
+def get_engine(using="default"):
+    name = getattr(settings, "MACHINE_SEARCH_ENGINE", None)
+    if not name:
+        name = "postgres" if connections[using].vendor == "postgresql" else "basic"
+    return ENGINES[name]()
+
+
+def search_machines(qs, q):
+    if q.isdigit():
+        return search_serial(qs, q)
+    return get_engine(qs.db).search(qs, q)
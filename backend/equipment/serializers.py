@@ -2,6 +2,26 @@ from rest_framework import serializers
 from .models import Machine, Maintenance, Claim, MaintenanceType
 
 
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PK-поле, которое при пакетном создании берёт объект из context["prefetched"][field_name]
+    (загружено одним запросом на весь пакет) вместо отдельного запроса на каждую запись.
+    """
+
+    def to_internal_value(self, data):
+        prefetched = self.context.get("prefetched", {}).get(self.field_name)
+        if prefetched is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            return prefetched[int(data)]
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        except KeyError:
+            self.fail("does_not_exist", pk_value=data)
+
+
 class MaintenanceTypeSerializer(serializers.ModelSerializer):
     class Meta:
         model = MaintenanceType
@@ -50,8 +70,15 @@ class ClaimSerializer(serializers.ModelSerializer):
 
 
 class MachineListSerializer(serializers.ModelSerializer):
-    maintenance_count = serializers.SerializerMethodField()
-    claims_count = serializers.SerializerMethodField()
+    # Из сводки MachineSummary (select_related("summary")), без агрегатов по ТО/рекламациям
+    last_maintenance_date = serializers.DateField(
+        source="summary.last_maintenance_date", read_only=True)
+    operating_hours = serializers.IntegerField(
+        source="summary.operating_hours", read_only=True)
+    open_claims = serializers.IntegerField(
+        source="summary.open_claims", read_only=True)
+    downtime_total = serializers.IntegerField(
+        source="summary.downtime_total", read_only=True)
 
     class Meta:
         model = Machine
@@ -64,23 +91,25 @@ class MachineListSerializer(serializers.ModelSerializer):
             "service_company",
             "maintenance_count",
             "claims_count",
+            "last_maintenance_date",
+            "operating_hours",
+            "open_claims",
+            "downtime_total",
         ]
         read_only_fields = fields
 
-    def get_maintenance_count(self, obj):
-        return getattr(obj, 'maintenance_count', obj.maintenance_set.count())
-
-    def get_claims_count(self, obj):
-        return getattr(obj, 'claims_count', obj.claim_set.count())
-
 
 class MachineDetailSerializer(serializers.ModelSerializer):
+    # Только последние записи (Prefetch(..., to_attr=...) в MachineViewSet.get_queryset),
+    # полные списки — /api/machines/{id}/maintenance/ и /api/machines/{id}/claims/
     maintenance = MaintenanceSerializer(
-        many=True, read_only=True, source="maintenance_set"
+        many=True, read_only=True, source="latest_maintenance"
     )
     claims = ClaimSerializer(
-        many=True, read_only=True, source="claim_set"
+        many=True, read_only=True, source="latest_claims"
     )
+    maintenance_total = serializers.IntegerField(source="maintenance_count", read_only=True)
+    claims_total = serializers.IntegerField(source="claims_count", read_only=True)
 
     class Meta:
         model = Machine
@@ -95,7 +124,8 @@ class MachineDetailSerializer(serializers.ModelSerializer):
             "shipment_date",
             "buyer", "recipient", "delivery_address",
             "options", "service_company",
-            "maintenance", "claims",
+            "maintenance", "maintenance_total",
+            "claims", "claims_total",
         ]
         read_only_fields = fields
 
@@ -118,8 +148,31 @@ class MachineAnonSerializer(serializers.ModelSerializer):
         read_only_fields = fields
 
 
+class MachineSearchSerializer(MachineAnonSerializer):
+    # Поиск для авторизованных: поля анонимного ответа и сводка MachineSummary
+    last_maintenance_date = serializers.DateField(
+        source="summary.last_maintenance_date", read_only=True)
+    operating_hours = serializers.IntegerField(
+        source="summary.operating_hours", read_only=True)
+    open_claims = serializers.IntegerField(
+        source="summary.open_claims", read_only=True)
+    downtime_total = serializers.IntegerField(
+        source="summary.downtime_total", read_only=True)
+
+    class Meta(MachineAnonSerializer.Meta):
+        fields = MachineAnonSerializer.Meta.fields + (
+            "last_maintenance_date",
+            "operating_hours",
+            "open_claims",
+            "downtime_total",
+        )
+        read_only_fields = fields
+
+
 class MaintenanceWriteSerializer(serializers.ModelSerializer):
-    machine_id = serializers.PrimaryKeyRelatedField(
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
+
+    machine_id = PrefetchedPrimaryKeyRelatedField(
         source="machine", queryset=Machine.objects.all(), write_only=True
     )
 
@@ -133,7 +186,7 @@ class MaintenanceWriteSerializer(serializers.ModelSerializer):
 
 
 class ClaimWriteSerializer(serializers.ModelSerializer):
-    machine_id = serializers.PrimaryKeyRelatedField(
+    machine_id = PrefetchedPrimaryKeyRelatedField(
         source="machine", queryset=Machine.objects.all(), write_only=True
     )
 
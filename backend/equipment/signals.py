@@ -0,0 +1,274 @@
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission, User
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+
+from . import authentication, counters, events, summary, sync, versions
+from .models import Machine, Maintenance, Claim, MaintenanceType
+from .roles import role_cache
+
+# Отправляется после bulk_create (импорт, пакетное создание), для которого Django
+# не шлёт post_save: sender — модель, objects — созданные экземпляры.
+bulk_created = Signal()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_roles_on_groups_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if not reverse:
+        role_cache.invalidate([instance.pk])
+    elif pk_set is not None:
+        role_cache.invalidate(pk_set)
+    else:
+        # group.user_set.clear(): неизвестно, кого затронуло
+        role_cache.invalidate()
+
+
+@receiver(post_save, sender=User)
+def invalidate_role_on_user_save(sender, instance, **kwargs):
+    role_cache.invalidate([instance.pk])
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_roles_on_group_change(sender, **kwargs):
+    # Переименование или удаление группы меняет роли всех её участников.
+    role_cache.invalidate()
+
+
+# Claims JWT-токенов (authentication.py): роль, группы и права должны устареть
+# вместе с данными, из которых они выданы.
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def expire_claims_on_access_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == "pre_clear":
+        # group.user_set.clear(): после очистки участников уже не узнать
+        authentication.changed(instance.user_set.values_list("pk", flat=True))
+    elif action in ("post_add", "post_remove", "post_clear"):
+        if not reverse:
+            authentication.changed([instance.pk])
+        elif pk_set:
+            authentication.changed(pk_set)
+
+
+@receiver(post_save, sender=User)
+def expire_claims_on_user_save(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and set(update_fields) <= {"last_login"}):
+        return
+    authentication.changed([instance.pk])
+
+
+@receiver(post_delete, sender=User)
+def expire_claims_on_user_delete(sender, instance, **kwargs):
+    authentication.changed([instance.pk])
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def expire_claims_on_group_change(sender, instance, created=False, **kwargs):
+    authentication.permission_cache.invalidate()
+    if not created:
+        authentication.changed(instance.user_set.values_list("pk", flat=True))
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+@receiver(post_delete, sender=Permission)
+def invalidate_group_permissions(sender, **kwargs):
+    authentication.permission_cache.invalidate()
+
+
+def _deleted_with_machine(origin):
+    return isinstance(origin, Machine) or getattr(origin, "model", None) is Machine
+
+
+@receiver(post_delete, sender=Maintenance)
+@receiver(post_delete, sender=Claim)
+def decrement_machine_counter(sender, instance, origin=None, **kwargs):
+    # При каскадном удалении самой машины пересчитывать нечего.
+    if _deleted_with_machine(origin):
+        return
+    counters.adjust(instance.machine_id, instance.counter_field, -1)
+
+
+@receiver(bulk_created, sender=Maintenance)
+@receiver(bulk_created, sender=Claim)
+def increment_machine_counters(sender, objects, **kwargs):
+    deltas = {}
+    for obj in objects:
+        deltas[obj.machine_id] = deltas.get(obj.machine_id, 0) + 1
+    counters.adjust_many(sender.counter_field, deltas)
+
+
+@receiver(bulk_created, sender=Maintenance)
+@receiver(bulk_created, sender=Claim)
+def copy_bulk_created_machine_serial(sender, objects, **kwargs):
+    # bulk_create обходит save(): номер машины копируется UPDATE на пачку
+    serial = Machine.objects.filter(pk=OuterRef("machine_id")).values("serial_number")[:1]
+    pks = [obj.pk for obj in objects]
+    for start in range(0, len(pks), 500):
+        sender.objects.filter(pk__in=pks[start:start + 500]).update(machine_serial=Subquery(serial))
+
+
+RECORD_TABLES = {Maintenance: versions.MAINTENANCE, Claim: versions.CLAIM}
+
+
+@receiver(post_save, sender=Machine)
+def bump_machine_version(sender, instance, **kwargs):
+    versions.bump([versions.MACHINE, versions.machine_key(instance.pk)])
+
+
+@receiver(post_delete, sender=Machine)
+def bump_deleted_machine_version(sender, instance, **kwargs):
+    # ТО и рекламации машины удалены каскадом, их сигналы версии не трогают.
+    versions.bump([versions.MACHINE, versions.machine_key(instance.pk),
+                   versions.MAINTENANCE, versions.CLAIM])
+
+
+@receiver(post_save, sender=Maintenance)
+@receiver(post_save, sender=Claim)
+@receiver(post_delete, sender=Maintenance)
+@receiver(post_delete, sender=Claim)
+def bump_record_version(sender, instance, origin=None, **kwargs):
+    if _deleted_with_machine(origin):
+        return
+    keys = [RECORD_TABLES[sender], versions.machine_key(instance.machine_id)]
+    old_machine_id = getattr(instance, "_old_machine_id", None)
+    if old_machine_id is not None and old_machine_id != instance.machine_id:
+        keys.append(versions.machine_key(old_machine_id))
+    versions.bump(keys)
+
+
+@receiver(post_save, sender=MaintenanceType)
+@receiver(post_delete, sender=MaintenanceType)
+def bump_maintenance_type_version(sender, **kwargs):
+    versions.bump([versions.MAINTENANCE_TYPE])
+
+
+@receiver(bulk_created)
+def bump_bulk_created_version(sender, objects, **kwargs):
+    if sender is Machine:
+        versions.bump([versions.MACHINE])
+        return
+    keys = {versions.machine_key(obj.machine_id) for obj in objects}
+    versions.bump([RECORD_TABLES[sender], *keys])
+
+
+def _summary_on_signal():
+    return getattr(settings, "MACHINE_SUMMARY_REFRESH", "signal") == "signal"
+
+
+@receiver(post_save, sender=Machine)
+def create_machine_summary(sender, instance, created, **kwargs):
+    if created:
+        summary.ensure([instance.pk])
+
+
+@receiver(post_save, sender=Maintenance)
+@receiver(post_save, sender=Claim)
+@receiver(post_delete, sender=Maintenance)
+@receiver(post_delete, sender=Claim)
+def refresh_machine_summary(sender, instance, origin=None, **kwargs):
+    if _deleted_with_machine(origin) or not _summary_on_signal():
+        return
+    summary.refresh([instance.machine_id, getattr(instance, "_old_machine_id", None)])
+
+
+@receiver(bulk_created)
+def refresh_bulk_created_summary(sender, objects, **kwargs):
+    if sender is Machine:
+        summary.ensure([obj.pk for obj in objects])
+    elif _summary_on_signal():
+        summary.refresh({obj.machine_id for obj in objects})
+
+
+@receiver(post_delete, sender=Machine)
+def bury_machine(sender, instance, **kwargs):
+    sync.bury(sync.MACHINE, [instance.pk], instance.client_id, instance.service_org_id)
+
+
+@receiver(post_delete, sender=Maintenance)
+@receiver(post_delete, sender=Claim)
+def bury_record(sender, instance, origin=None, **kwargs):
+    # Вместе с машиной: клиенту синхронизации хватает надгробия самой машины.
+    if _deleted_with_machine(origin):
+        return
+    sync.bury_record(sender.sync_kind, instance.pk, instance.machine_id)
+
+
+@receiver(bulk_created)
+def stamp_bulk_created(sender, objects, **kwargs):
+    # после коммита: пакет не держит блокировку последовательности sync, пока пишется
+    transaction.on_commit(lambda: sync.stamp_committed(sender, objects))
+
+
+def _publish_on_commit(event):
+    transaction.on_commit(lambda: events.broker.publish(event))
+
+
+@receiver(post_save, sender=Machine)
+@receiver(post_delete, sender=Machine)
+def publish_machine_change(sender, instance, created=None, **kwargs):
+    # Без подписчиков в этом процессе (WSGI, команды) события не собираются.
+    if events.broker.connections:
+        _publish_on_commit(events.event_for(sync.MACHINE, instance, instance, deleted=created is None))
+
+
+@receiver(post_save, sender=Machine)
+def publish_owners_changed(sender, instance, created, **kwargs):
+    old_owners = getattr(instance, "_old_owners", None)
+    if created or old_owners is None or not events.broker.connections:
+        return
+    # удаление получает только тот из прежних владельцев, кто сменился
+    old_client, old_service_org = old_owners
+    client = old_client if old_client != instance.client_id else None
+    service_org = old_service_org if old_service_org != instance.service_org_id else None
+    if client is None and service_org is None:
+        return
+    records = [(sync.MACHINE, instance.pk)]
+    for model in (Maintenance, Claim):
+        records += [(model.sync_kind, pk) for pk in
+                    model.objects.filter(machine_id=instance.pk).values_list("pk", flat=True)]
+    for kind, pk in records:
+        _publish_on_commit(events.lost_access_event(kind, pk, instance.pk, client, service_org))
+
+
+@receiver(post_save, sender=Maintenance)
+@receiver(post_save, sender=Claim)
+def publish_record_saved(sender, instance, **kwargs):
+    if not events.broker.connections:
+        return
+    _publish_on_commit(events.event_for(sender.sync_kind, instance, instance.machine))
+    old_machine_id = getattr(instance, "_old_machine_id", None)
+    if old_machine_id is not None and old_machine_id != instance.machine_id:
+        old_machine = Machine.objects.filter(pk=old_machine_id).first()
+        if old_machine is not None:
+            _publish_on_commit(events.event_for(sender.sync_kind, instance, old_machine, deleted=True))
+
+
+@receiver(post_delete, sender=Maintenance)
+@receiver(post_delete, sender=Claim)
+def publish_record_deleted(sender, instance, origin=None, **kwargs):
+    if events.broker.connections and not _deleted_with_machine(origin):
+        _publish_on_commit(events.event_for(sender.sync_kind, instance, instance.machine, deleted=True))
+
+
+@receiver(bulk_created)
+def publish_bulk_created(sender, objects, **kwargs):
+    if not events.broker.connections:
+        return
+    if sender is Machine:
+        kind, machines = sync.MACHINE, {obj.pk: obj for obj in objects}
+    else:
+        kind, machines = sender.sync_kind, Machine.objects.in_bulk({obj.machine_id for obj in objects})
+
+    def publish():
+        # события собираются после stamp_bulk_created (раньше в очереди on_commit),
+        # чтобы нести уже выданные номера
+        for obj in objects:
+            machine = obj if sender is Machine else machines[obj.machine_id]
+            events.broker.publish(events.event_for(kind, obj, machine))
+    transaction.on_commit(publish)
@@ -0,0 +1,91 @@
+"""
+Сводка по машине (MachineSummary): дата последнего ТО и отказа, последняя
+наработка, открытые рекламации (без даты восстановления), суммарный простой.
+
+refresh() пересчитывает сводки указанных машин двумя агрегатными запросами и
+записывает их одним upsert-ом. Перед расчётом строки машин блокируются
+(FOR NO KEY UPDATE, по возрастанию pk) до конца транзакции: иначе в READ
+COMMITTED два параллельных пересчёта могут посчитать разные снимки, и
+последним запишется более старый. NO KEY не конфликтует с блокировками
+FOR KEY SHARE, которые берут вставки ТО и рекламаций по внешнему ключу. Вызывается из сигналов сохранения/удаления ТО и
+рекламаций (signals.py), если MACHINE_SUMMARY_REFRESH = "signal"; при "batch"
+сводки обновляет периодический запуск rebuild_machine_summary. rebuild() сверяет
+все сводки с данными и исправляет расхождения.
+"""
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import Coalesce
+
+from . import versions
+from .models import Machine, MachineSummary, Maintenance, Claim
+
+FIELDS = ("last_maintenance_date", "last_failure_date", "operating_hours",
+          "open_claims", "downtime_total")
+EMPTY = {"last_maintenance_date": None, "last_failure_date": None,
+         "operating_hours": 0, "open_claims": 0, "downtime_total": 0}
+
+
+def compute(machine_ids):
+    """{machine_id: значения полей сводки} по фактическим ТО и рекламациям."""
+    result = {pk: dict(EMPTY) for pk in machine_ids}
+    maintenance = (Maintenance.objects.filter(machine_id__in=machine_ids).order_by()
+                   .values_list("machine_id").annotate(last=Max("date"), hours=Max("operating_hours")))
+    for pk, last_date, hours in maintenance:
+        result[pk].update(last_maintenance_date=last_date, operating_hours=hours or 0)
+    claims = (Claim.objects.filter(machine_id__in=machine_ids).order_by()
+              .values_list("machine_id").annotate(
+                  last=Max("failure_date"), hours=Max("operating_hours"),
+                  open=Count("id", filter=Q(restored_date__isnull=True)),
+                  downtime=Coalesce(Sum("downtime_hours"), 0)))
+    for pk, last_failure, hours, open_claims, downtime in claims:
+        row = result[pk]
+        row.update(last_failure_date=last_failure, open_claims=open_claims, downtime_total=downtime)
+        row["operating_hours"] = max(row["operating_hours"], hours or 0)
+    return result
+
+
+def _write(values):
+    MachineSummary.objects.bulk_create(
+        [MachineSummary(machine_id=pk, **row) for pk, row in values.items()],
+        update_conflicts=True, unique_fields=["machine"], update_fields=[*FIELDS, "updated_at"],
+    )
+
+
+def ensure(machine_ids):
+    """Пустые сводки для новых машин."""
+    MachineSummary.objects.bulk_create(
+        [MachineSummary(machine_id=pk) for pk in machine_ids], ignore_conflicts=True)
+
+
+def _lock(machine_ids):
+    """Блокирует существующие машины из machine_ids; возвращает их pk."""
+    return list(Machine.objects.filter(pk__in=machine_ids).order_by("pk")
+                .select_for_update(no_key=True).values_list("pk", flat=True))
+
+
+def refresh(machine_ids):
+    with transaction.atomic():
+        ids = _lock({pk for pk in machine_ids if pk is not None})
+        if ids:
+            _write(compute(ids))
+
+
+def rebuild(queryset=None, batch_size=1000):
+    """Сверяет сводки с данными (по всем машинам или по queryset); возвращает число исправленных."""
+    queryset = Machine.objects.all() if queryset is None else queryset
+    ids = list(queryset.order_by("pk").values_list("pk", flat=True))
+    fixed = 0
+    for start in range(0, len(ids), batch_size):
+        with transaction.atomic():
+            batch = _lock(ids[start:start + batch_size])
+            actual = compute(batch)
+            stored = {row.pop("machine_id"): row for row in
+                      MachineSummary.objects.filter(machine_id__in=batch).values("machine_id", *FIELDS)}
+            stale = {pk: row for pk, row in actual.items() if stored.get(pk) != row}
+            if stale:
+                _write(stale)
+        if stale:
+            # списки и карточки, закэшированные по версиям, должны увидеть новые сводки
+            versions.bump([versions.MACHINE, *(versions.machine_key(pk) for pk in stale)])
+            fixed += len(stale)
+    return fixed
@@ -0,0 +1,203 @@
+"""
+Инкрементальная синхронизация: /api/sync/?since=<токен>.
+
+У машин, ТО и рекламаций есть change_seq — номер изменения из одной общей
+возрастающей последовательности (строка "sync" в ChangeVersion). Номер выдаётся
+в транзакции записи и держит блокировку строки последовательности до её
+коммита, поэтому записи становятся видны строго в порядке номеров и курсор
+since не пропускает изменений. Цена — записи машин, ТО и рекламаций во всей
+установке сериализуются на этой строке. Поэтому пакетные вставки (импорт,
+пакетное создание) получают номера не в своей транзакции, а после её коммита
+в отдельной короткой (stamp_committed): до этого у строк change_seq = 0, и
+/api/sync/ их не отдаёт. Строки, оставшиеся без номера (процесс упал между
+коммитом и нумерацией), нумерует stamp_unstamped() (prune_sync_tombstones). Удаления оставляют надгробия (Tombstone) с
+владельцами машины на момент удаления — по ним надгробия ограничиваются ролью.
+
+Перенос ТО/рекламации на другую машину и смена клиента/сервисной организации
+машины оставляют надгробия для прежних владельцев и перенумеровывают записи,
+чтобы их получили новые. Удаление машины даёт одно надгробие машины: её ТО и
+рекламации клиент удаляет у себя сам.
+
+Старые надгробия удаляет prune_sync_tombstones; клиент с токеном старше
+удалённых получает reset=true и должен синхронизироваться заново с since=0.
+"""
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, Max, Value, When
+from django.utils import timezone
+
+SEQUENCE_KEY = "sync"
+HORIZON_KEY = "sync:horizon"
+MACHINE = "machine"
+MAINTENANCE = "maintenance"
+CLAIM = "claim"
+
+
+def _models():
+    from .models import ChangeVersion, Claim, Machine, Maintenance, Tombstone
+    return ChangeVersion, Machine, Maintenance, Claim, Tombstone
+
+
+def allocate(count=1):
+    """
+    Резервирует count номеров подряд и возвращает первый. Вызывать в транзакции
+    записи: блокировка строки последовательности держится до её конца.
+    """
+    ChangeVersion = _models()[0]
+    now = timezone.now()
+    updated = ChangeVersion.objects.filter(key=SEQUENCE_KEY).update(
+        version=F("version") + count, updated_at=now)
+    if not updated:
+        try:
+            with transaction.atomic():
+                ChangeVersion.objects.create(key=SEQUENCE_KEY, version=count, updated_at=now)
+        except IntegrityError:
+            ChangeVersion.objects.filter(key=SEQUENCE_KEY).update(
+                version=F("version") + count, updated_at=now)
+    last = ChangeVersion.objects.values_list("version", flat=True).get(key=SEQUENCE_KEY)
+    return last - count + 1
+
+
+def stamp(instance):
+    instance.change_seq = allocate()
+
+
+def restamp(model, objects_or_pks, batch_size=500):
+    """Новые номера уже записанным строкам (bulk_create, перенумерация) — UPDATE на пачку."""
+    pks = [getattr(obj, "pk", obj) for obj in objects_or_pks]
+    if not pks:
+        return
+    first = allocate(len(pks))
+    seqs = {pk: first + i for i, pk in enumerate(pks)}
+    for start in range(0, len(pks), batch_size):
+        batch = pks[start:start + batch_size]
+        model.objects.filter(pk__in=batch).update(change_seq=Case(
+            *(When(pk=pk, then=Value(seqs[pk])) for pk in batch),
+            default=F("change_seq"), output_field=models.PositiveBigIntegerField()))
+    for obj in objects_or_pks:
+        if hasattr(obj, "pk"):
+            obj.change_seq = seqs[obj.pk]
+
+
+def stamp_committed(model, objects):
+    """Номера пакетной вставке после её коммита: блокировка держится только на время UPDATE."""
+    with transaction.atomic():
+        restamp(model, objects)
+
+
+def stamp_unstamped():
+    """Нумерует записи без номера (change_seq = 0); возвращает их число."""
+    _, Machine, Maintenance, Claim, _ = _models()
+    total = 0
+    for model in (Machine, Maintenance, Claim):
+        pks = list(model.objects.filter(change_seq=0).order_by("pk").values_list("pk", flat=True))
+        if pks:
+            stamp_committed(model, pks)
+            total += len(pks)
+    return total
+
+
+def bury(kind, object_ids, client_id, service_org_id):
+    """Надгробия для удалённых (или ставших невидимыми прежним владельцам) записей."""
+    Tombstone = _models()[4]
+    object_ids = list(object_ids)
+    if not object_ids:
+        return
+    first = allocate(len(object_ids))
+    Tombstone.objects.bulk_create([
+        Tombstone(seq=first + i, model=kind, object_id=pk,
+                  client_id=client_id, service_org_id=service_org_id)
+        for i, pk in enumerate(object_ids)
+    ])
+
+
+def _owners(machine_id):
+    Machine = _models()[1]
+    return Machine.objects.filter(pk=machine_id).values_list("client_id", "service_org_id").first()
+
+
+def bury_record(kind, pk, machine_id):
+    owners = _owners(machine_id)
+    if owners is not None:
+        bury(kind, [pk], *owners)
+
+
+def machine_owners_changed(machine):
+    """
+    Перед сохранением машины: надгробия прежним владельцам, если они сменились.
+    Возвращает прежних владельцев (client_id, service_org_id) или None.
+    """
+    owners = _owners(machine.pk)
+    if owners is None or owners == (machine.client_id, machine.service_org_id):
+        return None
+    _, _, Maintenance, Claim, _ = _models()
+    bury(MACHINE, [machine.pk], *owners)
+    bury(MAINTENANCE, Maintenance.objects.filter(machine_id=machine.pk).values_list("pk", flat=True), *owners)
+    bury(CLAIM, Claim.objects.filter(machine_id=machine.pk).values_list("pk", flat=True), *owners)
+    return owners
+
+
+def restamp_machine_records(machine):
+    _, _, Maintenance, Claim, _ = _models()
+    for model in (Maintenance, Claim):
+        restamp(model, list(model.objects.filter(machine_id=machine.pk)
+                            .order_by("pk").values_list("pk", flat=True)))
+
+
+def _fields(model):
+    return [f.attname for f in model._meta.concrete_fields if f.primary_key or f.editable]
+
+
+def changes(user, since=0, limit=500):
+    """
+    Видимые пользователю изменения с номером больше since, не больше limit штук:
+    {"changes": [...], "next": токен, "has_more": bool, "reset": bool}.
+    """
+    from .roles import restrict_by_role
+
+    ChangeVersion, Machine, Maintenance, Claim, Tombstone = _models()
+    marks = dict(ChangeVersion.objects.filter(key__in=[SEQUENCE_KEY, HORIZON_KEY])
+                 .values_list("key", "version"))
+    if 0 < since < marks.get(HORIZON_KEY, 0):
+        return {"changes": [], "next": "0", "has_more": True, "reset": True}
+    # Всё до прочитанного заранее номера уже закоммичено: если изменений больше нет,
+    # курсор можно сдвинуть до него (через чужие и невидимые роли изменения).
+    watermark = marks.get(SEQUENCE_KEY, 0)
+
+    rows = []
+    for kind, model, path in ((MACHINE, Machine, ""), (MAINTENANCE, Maintenance, "machine__"),
+                              (CLAIM, Claim, "machine__")):
+        qs = restrict_by_role(model.objects.filter(change_seq__gt=since), user, path)
+        for data in qs.order_by("change_seq").values("change_seq", *_fields(model))[:limit + 1]:
+            seq = data.pop("change_seq")
+            rows.append({"seq": seq, "model": kind, "id": data["id"], "deleted": False, "data": data})
+    if since:
+        # с нуля клиенту нечего удалять
+        tombstones = restrict_by_role(Tombstone.objects.filter(seq__gt=since), user)
+        for seq, kind, object_id in tombstones.order_by("seq").values_list(
+                "seq", "model", "object_id")[:limit + 1]:
+            rows.append({"seq": seq, "model": kind, "id": object_id, "deleted": True})
+
+    rows.sort(key=lambda row: row["seq"])
+    batch = rows[:limit]
+    has_more = len(rows) > limit
+    last = batch[-1]["seq"] if batch else since
+    return {
+        "changes": batch,
+        "next": str(last if has_more else max(last, watermark)),
+        "has_more": has_more,
+        "reset": False,
+    }
+
+
+def prune(before):
+    """Удаляет надгробия старше before; возвращает число удалённых."""
+    ChangeVersion, _, _, _, Tombstone = _models()
+    with transaction.atomic():
+        old = Tombstone.objects.filter(deleted_at__lt=before)
+        last = old.aggregate(last=Max("seq"))["last"]
+        if not last:
+            return 0
+        deleted, _ = old.delete()
+        ChangeVersion.objects.update_or_create(
+            key=HORIZON_KEY, defaults={"version": last, "updated_at": timezone.now()})
+    return deleted
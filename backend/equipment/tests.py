@@ -1,3 +1,1319 @@
-from django.test import TestCase
+import asyncio
+import csv
+import os
+import tempfile
+import time
+import zipfile
+from datetime import date
+from xml.etree import ElementTree
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission, User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import viewsets
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .models import ChangeVersion, Machine, MachineSummary, MaintenanceType, Maintenance, Claim
+from .roles import CLIENT_GROUP, MANAGER_GROUP, SERVICE_GROUP, get_user_role, role_cache
+from .search import _prefix_tsquery
+from .signals import bulk_created
+from .detail_cache import LRUCache, detail_cache
+from . import async_views, authentication, benchmark, events, facets, search, summary, sync, versions
+from .fastread import ValuesReader
+from .bulk import BulkCreateMixin
+from .importers import MachineImporter, import_file
+from .pagination import KeysetPagination, keyset_filter, keyset_order_by
+from .serializers import (
+    ClaimSerializer, MachineAnonSerializer, MachineListSerializer, MaintenanceSerializer,
+)
+from .views import MachineViewSet
+
+
+class UserRoleTests(TestCase):
+    def setUp(self):
+        role_cache.invalidate()
+        role_cache.reset_stats()
+        self.client_group = Group.objects.create(name=CLIENT_GROUP)
+        self.service_group = Group.objects.create(name=SERVICE_GROUP)
+        self.manager_group = Group.objects.create(name=MANAGER_GROUP)
+        self.user = User.objects.create_user("dealer")
+
+    def fresh(self):
+        return User.objects.get(pk=self.user.pk)
+
+    def test_role_priority(self):
+        self.user.groups.add(self.client_group, self.service_group)
+        self.assertEqual(get_user_role(self.fresh()), "service")
+        self.user.groups.add(self.manager_group)
+        self.assertEqual(get_user_role(self.fresh()), "manager")
+
+    def test_single_query_and_memoized_on_user(self):
+        self.user.groups.add(self.client_group)
+        user = self.fresh()
+        with self.assertNumQueries(1):
+            self.assertEqual(get_user_role(user), "client")
+            self.assertEqual(get_user_role(user), "client")
+
+    def test_cached_across_requests(self):
+        self.user.groups.add(self.client_group)
+        get_user_role(self.fresh())
+        other_request_user = self.fresh()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_user_role(other_request_user), "client")
+        stats = role_cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_invalidated_on_groups_change(self):
+        self.user.groups.add(self.client_group)
+        self.assertEqual(get_user_role(self.fresh()), "client")
+        self.service_group.user_set.add(self.user)
+        self.assertEqual(get_user_role(self.fresh()), "service")
+        self.user.groups.clear()
+        self.assertIsNone(get_user_role(self.fresh()))
+
+    def test_superuser_needs_no_query(self):
+        admin = User.objects.create_superuser("admin")
+        with self.assertNumQueries(0):
+            self.assertEqual(get_user_role(admin), "manager")
+
+
+class FleetTestCase(TestCase):
+    """Небольшой парк: две машины у разных клиентов/сервисных организаций."""
+
+    def setUp(self):
+        cache.clear()
+        role_cache.invalidate()
+        search.flight.clear()
+        self.manager = User.objects.create_user("manager")
+        manager_group = Group.objects.create(name=MANAGER_GROUP)
+        manager_group.permissions.set(Permission.objects.filter(content_type__app_label="equipment"))
+        self.manager.groups.add(manager_group)
+        service_group = Group.objects.create(name=SERVICE_GROUP)
+        client_group = Group.objects.create(name=CLIENT_GROUP)
+        self.service = User.objects.create_user("service")
+        self.service.groups.add(service_group)
+        self.owner = User.objects.create_user("owner")
+        self.owner.groups.add(client_group)
+        self.other = User.objects.create_user("other")
+        self.other.groups.add(client_group)
+
+        self.m1 = Machine.objects.create(
+            serial_number="0001", model_name="ПД1,5", engine_model="Kubota",
+            service_company="Сервис-1", shipment_date=date(2022, 1, 10),
+            client=self.owner, service_org=self.service)
+        self.m2 = Machine.objects.create(
+            serial_number="0002", model_name="ПД3,0", engine_model="ММЗ",
+            service_company="Сервис-2", shipment_date=date(2023, 5, 1),
+            client=self.other)
+        self.to1 = MaintenanceType.objects.create(name="ТО-1")
+        self.to2 = MaintenanceType.objects.create(name="ТО-2")
+        Maintenance.objects.create(machine=self.m1, maintenance_type=self.to1,
+                                   date=date(2022, 6, 1), operating_hours=100,
+                                   service_company="Сервис-1")
+        Maintenance.objects.create(machine=self.m2, maintenance_type=self.to2,
+                                   date=date(2023, 8, 1), operating_hours=50)
+        Claim.objects.create(machine=self.m1, failure_date=date(2022, 9, 1),
+                             failure_node="Двигатель", downtime_hours=12)
+        self.api = APIClient()
+
+    def login(self, user):
+        self.api.force_authenticate(user)
+
+
+class FacetsTests(FleetTestCase):
+    def test_combined_endpoint_matches_sections(self):
+        self.login(self.manager)
+        combined = self.api.get("/api/facets/").json()
+        self.assertEqual(set(combined), {"machines", "maintenance", "claims"})
+        self.assertEqual(combined["machines"], self.api.get("/api/machines/facets/").json())
+        self.assertEqual(combined["maintenance"], self.api.get("/api/maintenance/facets/").json())
+        self.assertEqual(combined["claims"], self.api.get("/api/claims/facets/").json())
+        self.assertEqual(combined["machines"]["model_name"], ["ПД1,5", "ПД3,0"])
+        self.assertEqual(combined["maintenance"]["maintenance_type"],
+                         [[self.to1.id, "ТО-1"], [self.to2.id, "ТО-2"]])
+        self.assertEqual(combined["maintenance"]["service_company"], ["Сервис-1"])
+        self.assertEqual(combined["claims"]["failure_node"], ["Двигатель"])
+
+    def test_one_row_per_distinct_value(self):
+        get_user_role(self.manager)
+        for rows, build in facets.ASYNC_SECTIONS.values():
+            rows = list(rows(self.manager))
+            built = build(rows)
+            self.assertEqual(len([r for r in rows if r[1] not in ("", None)]),
+                             sum(len(values) for values in built.values()))
+
+    def test_scoped_by_role(self):
+        self.login(self.other)
+        data = self.api.get("/api/facets/").json()
+        self.assertEqual(data["machines"]["model_name"], ["ПД3,0"])
+        self.assertEqual(data["maintenance"]["machine_serial"], ["0002"])
+        self.assertEqual(data["claims"]["failure_node"], [])
+
+    def test_cached_and_invalidated_on_write(self):
+        self.login(self.manager)
+        self.api.get("/api/facets/")
+        with self.assertNumQueries(1):  # только версии таблиц
+            self.api.get("/api/facets/")
+        Claim.objects.create(machine=self.m2, failure_node="Гидравлика")
+        data = self.api.get("/api/facets/").json()
+        self.assertEqual(data["claims"]["failure_node"], ["Гидравлика", "Двигатель"])
+        # фасеты машин от рекламаций не зависят и остаются в кэше
+        with CaptureQueriesContext(connection) as queries:
+            self.api.get("/api/machines/facets/")
+        self.assertEqual(len(queries), 1)
+
+    def test_kept_on_rolled_back_write(self):
+        self.login(self.manager)
+        self.api.get("/api/facets/")
+        with transaction.atomic():
+            Claim.objects.create(machine=self.m2, failure_node="Гидравлика")
+            transaction.set_rollback(True)
+        # версии меняются вместе с записью: откат не сбрасывает кэш
+        with self.assertNumQueries(1):
+            data = self.api.get("/api/facets/").json()
+        self.assertEqual(data["claims"]["failure_node"], ["Двигатель"])
+
+
+class CoalescingTests(FleetTestCase):
+    def concurrently(self, n, make):
+        async def run():
+            return await asyncio.gather(*(make() for _ in range(n)))
+        return async_to_sync(run)()
+
+    def assertCoalesced(self, flight, make, keys=1):
+        with CaptureQueriesContext(connection) as single:
+            expected = self.concurrently(1, make)[0]
+        cache.clear()
+        flight.clear()
+        shared = flight.stats()["shared"]
+        with CaptureQueriesContext(connection) as concurrent:
+            results = self.concurrently(10, make)
+        self.assertEqual(len(concurrent), len(single))
+        # 9 из 10 вызовов ждали чужого вычисления по каждому ключу
+        self.assertEqual(flight.stats()["shared"] - shared, 9 * keys)
+        return expected, results
+
+    def test_concurrent_facets_share_one_query_set(self):
+        get_user_role(self.manager)
+        expected, results = self.assertCoalesced(
+            facets.flight, lambda: facets.aget_all_facets(self.manager), keys=len(facets.SECTIONS))
+        self.assertEqual(results, [expected] * 10)
+
+    def test_concurrent_searches_share_one_query_set(self):
+        factory = AsyncRequestFactory()
+        expected, results = self.assertCoalesced(
+            search.flight, lambda: async_views.search(factory.get("/api/search", {"q": "ПД"})))
+        self.assertEqual({response.content for response in results}, {expected.content})
+        self.assertIn(b"0001", expected.content)
+
+
+class KeysetPaginationTests(FleetTestCase):
+    def walk(self, url):
+        seen, pages = [], 0
+        while url:
+            data = self.api.get(url).json()
+            self.assertNotIn("count", data)
+            seen += [row["id"] for row in data["results"]]
+            url, pages = data["next"], pages + 1
+        return seen, pages
+
+    def test_machines_walk_matches_ordering(self):
+        for i in range(45):
+            shipment = None if i % 7 == 0 else date(2020, 1 + i % 12, 1)
+            Machine.objects.create(serial_number=f"9{i:03d}", model_name="ПД",
+                                   shipment_date=shipment)
+        self.login(self.manager)
+        seen, pages = self.walk("/api/machines/?cursor=")
+        machines = list(Machine.objects.all())
+        expected = [m.id for m in sorted(
+            machines, key=lambda m: (m.shipment_date is not None, -(m.shipment_date or date.min).toordinal(), m.id))]
+        self.assertEqual(seen, expected)
+        self.assertEqual(pages, 3)
+
+    def test_maintenance_walk_is_role_scoped(self):
+        for i in range(25):
+            Maintenance.objects.create(machine=self.m1, maintenance_type=self.to1,
+                                       date=date(2024, 1, 1 + i % 5))
+        self.login(self.owner)
+        seen, _ = self.walk("/api/maintenance/?cursor=")
+        expected = list(Maintenance.objects.filter(machine=self.m1)
+                        .order_by("-date", "id").values_list("id", flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_page_number_mode_unchanged(self):
+        self.login(self.manager)
+        data = self.api.get("/api/claims/").json()
+        self.assertEqual(data["count"], 1)
+
+    def test_invalid_cursor(self):
+        self.login(self.manager)
+        self.assertEqual(self.api.get("/api/claims/?cursor=garbage").status_code, 404)
+
+    def where(self, model, ordering, values):
+        sql = str(model.objects.filter(keyset_filter(ordering, values, model)).query)
+        return sql.split(" WHERE ", 1)[1]
+
+    def test_leading_column_bounded(self):
+        # первое условие — диапазон по ведущей колонке индекса, дальше — уточнение
+        where = self.where(Machine, ("-shipment_date", "id"), ["2024-01-01", 5])
+        self.assertTrue(where.startswith('("equipment_machine"."shipment_date" <= 2024-01-01'), where)
+        where = self.where(Maintenance, ("machine_serial", "-date", "id"), ["0001", "2024-01-01", 5])
+        self.assertTrue(where.startswith('("equipment_maintenance"."machine_serial" >= 0001'), where)
+        # NOT NULL колонки без веток IS NULL
+        self.assertNotIn('"machine_serial" IS NULL', where)
+        self.assertNotIn('"id" IS NULL', where)
+
+
+class MachineCountersTests(FleetTestCase):
+    def counts(self, machine):
+        machine.refresh_from_db()
+        return machine.maintenance_count, machine.claims_count
+
+    def test_maintained_on_create_move_and_delete(self):
+        self.assertEqual(self.counts(self.m1), (1, 1))
+        claim = Claim.objects.create(machine=self.m1, failure_node="Мост")
+        self.assertEqual(self.counts(self.m1), (1, 2))
+        claim.machine = self.m2
+        claim.save()
+        self.assertEqual(self.counts(self.m1), (1, 1))
+        self.assertEqual(self.counts(self.m2), (1, 1))
+        Maintenance.objects.filter(machine=self.m2).delete()
+        self.assertEqual(self.counts(self.m2), (0, 1))
+
+    def test_machine_update_keeps_counters(self):
+        stale = Machine.objects.get(pk=self.m1.pk)
+        Maintenance.objects.create(machine=self.m1, maintenance_type=self.to2)
+        stale.buyer = "ООО Ромашка"
+        stale.save()
+        self.assertEqual(self.counts(self.m1), (2, 1))
+
+    def test_rebuild(self):
+        Machine.objects.filter(pk=self.m1.pk).update(maintenance_count=7, claims_count=0)
+        call_command("rebuild_machine_counters", stdout=StringIO())
+        self.assertEqual(self.counts(self.m1), (1, 1))
+
+    def test_list_uses_counters_without_joins(self):
+        self.login(self.manager)
+        self.api.get("/api/machines/")
+        # версии для ETag, COUNT(*) и сама страница
+        with self.assertNumQueries(3):
+            rows = self.api.get("/api/machines/").json()["results"]
+        by_serial = {r["serial_number"]: r for r in rows}
+        self.assertEqual(by_serial["0001"]["maintenance_count"], 1)
+        self.assertEqual(by_serial["0001"]["claims_count"], 1)
+
+
+class MachineSummaryTests(FleetTestCase):
+    def summary(self, machine):
+        row = MachineSummary.objects.get(machine=machine)
+        return (row.last_maintenance_date, row.last_failure_date, row.operating_hours,
+                row.open_claims, row.downtime_total)
+
+    def test_refreshed_on_create_move_and_delete(self):
+        self.assertEqual(self.summary(self.m1), (date(2022, 6, 1), date(2022, 9, 1), 100, 1, 12))
+        claim = Claim.objects.create(machine=self.m1, failure_date=date(2023, 2, 1),
+                                     operating_hours=250, restored_date=date(2023, 2, 3),
+                                     downtime_hours=48)
+        self.assertEqual(self.summary(self.m1), (date(2022, 6, 1), date(2023, 2, 1), 250, 1, 60))
+        claim.machine = self.m2
+        claim.save()
+        self.assertEqual(self.summary(self.m1), (date(2022, 6, 1), date(2022, 9, 1), 100, 1, 12))
+        self.assertEqual(self.summary(self.m2), (date(2023, 8, 1), date(2023, 2, 1), 250, 0, 48))
+        Maintenance.objects.filter(machine=self.m2).delete()
+        self.assertEqual(self.summary(self.m2), (None, date(2023, 2, 1), 250, 0, 48))
+
+    def test_bulk_created_and_batch_mode(self):
+        machine = Machine.objects.bulk_create([Machine(serial_number="0003")])[0]
+        bulk_created.send(sender=Machine, objects=[machine])
+        self.assertEqual(self.summary(machine), (None, None, 0, 0, 0))
+        with override_settings(MACHINE_SUMMARY_REFRESH="batch"):
+            Maintenance.objects.create(machine=machine, maintenance_type=self.to1,
+                                       date=date(2024, 3, 1), operating_hours=20)
+            self.assertEqual(self.summary(machine)[0], None)
+        call_command("rebuild_machine_summary", "0003", stdout=StringIO())
+        self.assertEqual(self.summary(machine), (date(2024, 3, 1), None, 20, 0, 0))
+
+    def test_refresh_locks_machines_before_computing(self):
+        with CaptureQueriesContext(connection) as queries:
+            summary.refresh([self.m2.pk, None, self.m1.pk])
+        sql = [q["sql"] for q in queries.captured_queries if "SAVEPOINT" not in q["sql"]]
+        self.assertIn('FROM "equipment_machine"', sql[0])
+        self.assertIn("ORDER BY", sql[0])
+        if connection.features.has_select_for_update:
+            self.assertIn("FOR NO KEY UPDATE", sql[0])
+        self.assertEqual(self.summary(self.m2)[2], 50)
+
+    def test_rebuild_fixes_drift(self):
+        MachineSummary.objects.filter(machine=self.m1).update(operating_hours=7, open_claims=5)
+        MachineSummary.objects.filter(machine=self.m2).delete()
+        out = StringIO()
+        call_command("rebuild_machine_summary", stdout=out)
+        self.assertIn("2", out.getvalue())
+        self.assertEqual(self.summary(self.m1), (date(2022, 6, 1), date(2022, 9, 1), 100, 1, 12))
+        self.assertEqual(self.summary(self.m2)[2], 50)
+
+    def test_list_and_search_read_summary(self):
+        self.login(self.manager)
+        self.api.get("/api/machines/")
+        with self.assertNumQueries(3):
+            rows = self.api.get("/api/machines/").json()["results"]
+        row = {r["serial_number"]: r for r in rows}["0001"]
+        self.assertEqual((row["last_maintenance_date"], row["operating_hours"],
+                          row["open_claims"], row["downtime_total"]), ("2022-06-01", 100, 1, 12))
+        found = self.api.get("/api/search", {"q": "0001"}).json()["results"]
+        self.assertEqual(found[0]["operating_hours"], 100)
+        # поля анонимного поиска остаются в ответе авторизованному
+        self.assertLessEqual(set(MachineAnonSerializer.Meta.fields), set(found[0]))
+        self.assertEqual(found[0]["engine_serial"], self.m1.engine_serial)
+
+
+class MachineSearchTests(FleetTestCase):
+    def search(self, q):
+        response = self.api.get("/api/search", {"q": q})
+        self.assertEqual(response.status_code, 200)
+        return [row["serial_number"] for row in response.json()["results"]]
+
+    def test_serial_prefix_exact_first(self):
+        Machine.objects.create(serial_number="000", model_name="ПД")
+        self.assertEqual(self.search("000"), ["000", "0001", "0002"])
+        self.assertEqual(self.search("0002"), ["0002"])
+
+    def test_text_search_scoped_by_role(self):
+        self.assertEqual(self.search("kubota"), ["0001"])
+        self.login(self.other)
+        self.assertEqual(self.search("kubota"), [])
+
+    def test_prefix_tsquery(self):
+        self.assertEqual(_prefix_tsquery("ПД двиг!"), "пд:* & двиг:*")
+        self.assertEqual(_prefix_tsquery("&|!"), "")
+
+
+class ExportTests(FleetTestCase):
+    def download(self, url):
+        response = self.api.get(url)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content)
+
+    def test_csv_honors_filters_and_role(self):
+        self.login(self.manager)
+        body = self.download("/api/machines/export/?model_name=ПД3,0").decode("utf-8-sig")
+        lines = list(csv.reader(StringIO(body)))
+        self.assertEqual(lines[0][0], "Зав. № машины")
+        self.assertEqual([line[0] for line in lines[1:]], ["0002"])
+
+        self.login(self.owner)
+        body = self.download("/api/maintenance/export/").decode("utf-8-sig")
+        self.assertEqual([line[0] for line in csv.reader(StringIO(body))][1:], ["0001"])
+
+    def test_xlsx_is_valid_workbook(self):
+        self.login(self.manager)
+        body = self.download("/api/claims/export/?file_format=xlsx")
+        with zipfile.ZipFile(BytesIO(body)) as archive:
+            sheet = archive.read("xl/worksheets/sheet1.xml").decode("utf-8")
+        self.assertIn("Двигатель", sheet)
+        self.assertEqual(sheet.count("<row>"), 2)
+
+    def test_unknown_format(self):
+        self.login(self.manager)
+        self.assertEqual(self.api.get("/api/claims/export/?file_format=pdf").status_code, 400)
+
+    def test_csv_formulas_neutralized(self):
+        Claim.objects.filter(machine=self.m1).update(
+            recovery_method='=HYPERLINK("http://evil","x")', used_spare="-1+2", failure_description="@SUM(A1)")
+        self.login(self.manager)
+        body = self.download("/api/claims/export/").decode("utf-8-sig")
+        row = list(csv.reader(StringIO(body)))[1]
+        self.assertIn("'=HYPERLINK(\"http://evil\",\"x\")", row)
+        self.assertIn("'-1+2", row)
+        self.assertIn("'@SUM(A1)", row)
+        # числа не экранируются, импорт выгрузки возвращает исходный текст
+        Claim.objects.all().delete()
+        self.upload_claims(body.encode("utf-8"))
+        self.assertEqual(Claim.objects.get().recovery_method, '=HYPERLINK("http://evil","x")')
+
+    def upload_claims(self, content):
+        response = self.api.post("/api/claims/import/", {
+            "file": SimpleUploadedFile("rows.csv", content)}, format="multipart")
+        self.assertEqual(response.json()["created"], 1)
+
+    def test_xlsx_drops_xml_illegal_characters(self):
+        Claim.objects.filter(machine=self.m1).update(failure_description="сбой\x01\x0b датчика")
+        self.login(self.manager)
+        body = self.download("/api/claims/export/?file_format=xlsx")
+        with zipfile.ZipFile(BytesIO(body)) as archive:
+            sheet = ElementTree.fromstring(archive.read("xl/worksheets/sheet1.xml"))
+        texts = [t.text for t in sheet.iter("{http://schemas.openxmlformats.org/spreadsheetml/2006/main}t")]
+        self.assertIn("сбой датчика", texts)
+
+
+class ImportTests(FleetTestCase):
+    def upload(self, url, content, name="rows.csv"):
+        return self.api.post(url, {"file": SimpleUploadedFile(name, content)}, format="multipart")
+
+    def test_maintenance_rows_and_errors(self):
+        content = (
+            "machine_serial,maintenance_type,date,operating_hours\n"
+            "0001,ТО-2,2024-03-01,250\n"
+            "0002,ТО-1,2024-03-02,\n"
+            "9999,ТО-1,2024-03-03,10\n"
+            "0001,ТО-9,не дата,много\n"
+        ).encode("utf-8")
+        self.login(self.manager)
+        report = self.upload("/api/maintenance/import/", content).json()
+        self.assertEqual((report["rows"], report["created"], report["failed"]), (4, 2, 2))
+        self.assertEqual(report["errors"][0]["row"], 4)
+        self.assertIn("machine_serial", report["errors"][0]["errors"])
+        self.assertEqual(set(report["errors"][1]["errors"]),
+                         {"maintenance_type", "date", "operating_hours"})
+        self.m1.refresh_from_db()
+        self.assertEqual(self.m1.maintenance_count, 2)
+
+    def test_export_round_trip(self):
+        self.login(self.manager)
+        exported = b"".join(self.api.get("/api/claims/export/").streaming_content)
+        report = self.upload("/api/claims/import/", exported).json()
+        self.assertEqual(report["created"], 1)
+        self.assertEqual(Claim.objects.filter(failure_node="Двигатель").count(), 2)
+
+    def test_machines_reject_duplicates(self):
+        content = "serial_number,model_name\n0001,ПД\n0100,ПД\n0100,ПД\n".encode("utf-8")
+        self.login(self.manager)
+        report = self.upload("/api/machines/import/?dry_run=1", content).json()
+        self.assertEqual([e["row"] for e in report["errors"]], [2, 4])
+        self.assertFalse(Machine.objects.filter(serial_number="0100").exists())
+
+    def test_unreadable_files_rejected(self):
+        self.login(self.manager)
+        cp1251 = "machine_serial,maintenance_type\n0001,ТО-1\n".encode("cp1251")
+        for kind in ("machines", "maintenance", "claims"):
+            with self.subTest(kind=kind):
+                response = self.upload(f"/api/{kind}/import/", cp1251)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("UTF-8", response.json()["file"][0])
+                response = self.upload(f"/api/{kind}/import/", b"not a workbook", name="rows.xlsx")
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("XLSX", response.json()["file"][0])
+        path = self.tmp_csv("serial_number,model_name\n0200,ПД\n")
+        with open(path, "wb") as f:
+            f.write("serial_number,model_name\n0200,ПД\n".encode("cp1251"))
+        with self.assertRaisesMessage(CommandError, "UTF-8"):
+            call_command("import_equipment", "machines", path, stdout=StringIO())
+
+    def test_decode_error_mid_file_reported(self):
+        # больше буфера TextIOWrapper: заголовок и первые строки читаются успешно
+        good = "".join(f"{3000 + i},ПД\n" for i in range(2000))
+        content = f"serial_number,model_name\n{good}".encode("utf-8") + "9999,ПД\n".encode("cp1251")
+        report = import_file("machines", BytesIO(content), "rows.csv", batch_size=100)
+        self.assertGreater(report.created, 0)
+        self.assertEqual(report.created, report.rows)
+        self.assertEqual(report.errors[0]["row"], report.rows + 2)
+        self.assertIn("UTF-8", report.errors[0]["errors"]["__all__"][0])
+
+    def test_rejected_batch_retried_row_by_row(self):
+        content = "serial_number,model_name\n0300,ПД\n0001,ПД\n0301,ПД\n".encode("utf-8")
+        # как при параллельной загрузке: 0001 появилась уже после проверки пачки
+        with mock.patch.object(MachineImporter, "resolve", return_value={"existing": set()}):
+            report = import_file("machines", BytesIO(content), "rows.csv")
+        self.assertEqual(report.created, 2)
+        self.assertEqual([e["row"] for e in report.errors], [3])
+        self.assertEqual(set(Machine.objects.filter(serial_number__in=["0300", "0301"])
+                             .values_list("serial_number", flat=True)), {"0300", "0301"})
+
+    def test_manager_only(self):
+        self.login(self.service)
+        response = self.upload("/api/claims/import/", b"machine_serial\n0001\n")
+        self.assertEqual(response.status_code, 403)
+
+    def test_command(self):
+        path = self.tmp_csv("serial_number,model_name\n0200,ПД\n")
+        out = StringIO()
+        call_command("import_equipment", "machines", path, stdout=out)
+        self.assertIn("загружено: 1", out.getvalue())
+
+    def tmp_csv(self, text):
+        handle = tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, encoding="utf-8")
+        with handle:
+            handle.write(text)
+        self.addCleanup(os.remove, handle.name)
+        return handle.name
+
+
+class IndexTests(FleetTestCase):
+    def serials(self, model):
+        return dict(model.objects.values_list("pk", "machine_serial"))
+
+    def test_machine_serial_kept_in_sync(self):
+        self.assertEqual(set(self.serials(Maintenance).values()), {"0001", "0002"})
+        claim = Claim.objects.create(machine=self.m2, failure_node="Мост")
+        self.assertEqual(self.serials(Claim)[claim.pk], "0002")
+        claim.machine = self.m1
+        claim.save(update_fields=["machine"])
+        self.assertEqual(self.serials(Claim)[claim.pk], "0001")
+
+        records = Maintenance.objects.bulk_create(
+            [Maintenance(machine=self.m2, maintenance_type=self.to1)])
+        bulk_created.send(sender=Maintenance, objects=records)
+        self.assertEqual(self.serials(Maintenance)[records[0].pk], "0002")
+
+        self.m2.serial_number = "0202"
+        self.m2.save()
+        self.assertEqual(set(Maintenance.objects.filter(machine=self.m2)
+                             .values_list("machine_serial", flat=True)), {"0202"})
+
+    def plan(self, queryset):
+        with transaction.atomic():
+            if connection.vendor == "postgresql":
+                # на таблицах в несколько строк планировщик иначе выбирает seq scan
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+            return queryset.explain()
+
+    def test_key_queries_use_indexes(self):
+        cases = {
+            "machine_service_keyset_idx": Machine.objects.filter(service_org=self.service).order_by(
+                *keyset_order_by(("-shipment_date", "id"))),
+            "machine_client_keyset_idx": Machine.objects.filter(client=self.owner).order_by(
+                *keyset_order_by(("-shipment_date", "id"))),
+            "maintenance_keyset_idx": Maintenance.objects.filter(machine=self.m1).order_by(
+                *keyset_order_by(("-date", "id"))),
+            "claim_keyset_idx": Claim.objects.filter(machine=self.m1).order_by(
+                *keyset_order_by(("-failure_date", "id"))),
+            "maintenance_serial_keyset_idx": Maintenance.objects.order_by(
+                *keyset_order_by(("machine_serial", "-date", "id")))[:20],
+            "claim_serial_keyset_idx": Claim.objects.order_by(
+                *keyset_order_by(("machine_serial", "-failure_date", "id")))[:20],
+            "claim_failure_node_idx": Claim.objects.filter(failure_node="Двигатель"),
+            "maintenance_service_idx": Maintenance.objects.filter(service_company="Сервис-1"),
+            "machine_service_company_idx": Machine.objects.filter(service_company="Сервис-1"),
+        }
+        if connection.vendor == "postgresql":
+            cases.update({
+                "maintenance_service_trgm_idx":
+                    Maintenance.objects.filter(service_company__icontains="сервис"),
+                "claim_failure_node_trgm_idx": Claim.objects.filter(failure_node__icontains="двиг"),
+                "claim_recovery_trgm_idx": Claim.objects.filter(recovery_method__icontains="замена"),
+                "machine_service_trgm_idx":
+                    Claim.objects.filter(machine__service_company__icontains="сервис"),
+                "machine_serial_trgm_idx": Machine.objects.filter(serial_number__icontains="001"),
+            })
+            for field in ("model_name", "engine_model", "transmission_model",
+                          "steer_axle_model", "drive_axle_model"):
+                index = "machine_{}_trgm_idx".format(field.removesuffix("_model").removesuffix("_name"))
+                cases[index] = Machine.objects.filter(**{f"{field}__icontains": "пд"})
+        for index, queryset in cases.items():
+            with self.subTest(index=index):
+                self.assertIn(index, self.plan(queryset))
+
+
+class BulkCreateTests(FleetTestCase):
+    def setUp(self):
+        super().setUp()
+        maintainer = Group.objects.get(name=SERVICE_GROUP)
+        maintainer.permissions.set(Permission.objects.filter(
+            content_type__app_label="equipment", codename__in=["add_maintenance", "add_claim"]))
+
+    def test_maintenance_per_item_results(self):
+        self.login(self.service)
+        items = [
+            {"machine_id": self.m1.id, "maintenance_type": self.to1.id, "date": "2024-01-01"},
+            {"machine_id": self.m2.id, "maintenance_type": self.to1.id, "date": "2024-01-02"},
+            {"machine_id": self.m1.id, "maintenance_type": 999, "date": "2024-01-03"},
+            {"machine_id": self.m1.id, "maintenance_type": self.to2.id, "date": "2024-01-04"},
+        ]
+        response = self.api.post("/api/maintenance/", items, format="json")
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([r["status"] for r in response.json()], [201, 403, 400, 201])
+        self.m1.refresh_from_db()
+        self.assertEqual(self.m1.maintenance_count, 3)
+
+    def test_query_count_does_not_grow_with_items(self):
+        self.login(self.manager)
+
+        def post(n):
+            items = [{"machine_id": self.m1.id, "failure_node": f"Узел {i}"} for i in range(n)]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.api.post("/api/claims/", items, format="json")
+            self.assertEqual(response.status_code, 201)
+            return len(queries)
+
+        post(1)  # прогрев: права пользователя и роль
+        self.assertEqual(post(2), post(40))
+        self.assertEqual(Claim.objects.filter(machine=self.m1).count(), 44)
+
+    def test_single_create_checks_machine_owner(self):
+        self.login(self.service)
+        response = self.api.post("/api/maintenance/", {
+            "machine_id": self.m2.id, "maintenance_type": self.to1.id}, format="json")
+        self.assertEqual(response.status_code, 403)
+
+    def test_permission_check_required(self):
+        with self.assertRaises(ImproperlyConfigured):
+            type("NoCheckViewSet", (BulkCreateMixin, viewsets.GenericViewSet), {})
+        with self.assertRaises(ImproperlyConfigured):
+            type("TypoViewSet", (BulkCreateMixin, viewsets.GenericViewSet),
+                 {"bulk_machine_check": "_ensure_can_create"})
+
+
+class ConditionalGetTests(FleetTestCase):
+    def test_machine_detail_not_modified_until_history_changes(self):
+        self.login(self.manager)
+        url = f"/api/machines/{self.m1.id}/"
+        first = self.api.get(url)
+        etag = first["ETag"]
+        self.assertTrue(first.has_header("Last-Modified"))
+
+        with self.assertNumQueries(1):
+            response = self.api.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Запись другой машины карточку не меняет.
+        Claim.objects.create(machine=self.m2, failure_node="Мост")
+        self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Claim.objects.create(machine=self.m1, failure_node="Мост")
+        response = self.api.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_only_canonical_machine_pk(self):
+        # у "01" был бы свой ключ версии machine:01, который записи не сбрасывают
+        self.login(self.manager)
+        for suffix in ("", "maintenance/", "claims/"):
+            self.assertEqual(self.api.get(f"/api/machines/0{self.m1.id}/{suffix}").status_code, 404)
+            self.assertEqual(self.api.get(f"/api/machines/{self.m1.id}/{suffix}").status_code, 200)
+
+    def test_list_etag_depends_on_user_and_params(self):
+        self.login(self.owner)
+        etag = self.api.get("/api/claims/")["ETag"]
+        self.assertEqual(self.api.get("/api/claims/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.api.get("/api/claims/?page=1", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.login(self.other)
+        self.assertEqual(self.api.get("/api/claims/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_machine_list_changes_with_counters(self):
+        self.login(self.manager)
+        etag = self.api.get("/api/machines/")["ETag"]
+        Maintenance.objects.create(machine=self.m2, maintenance_type=self.to1)
+        self.assertEqual(self.api.get("/api/machines/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_bulk_create_bumps_versions(self):
+        self.login(self.manager)
+        etag = self.api.get("/api/maintenance/")["ETag"]
+        self.api.post("/api/maintenance/", [{"machine_id": self.m1.id, "maintenance_type": self.to1.id}],
+                      format="json")
+        self.assertEqual(self.api.get("/api/maintenance/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class DetailCacheTests(FleetTestCase):
+    def setUp(self):
+        super().setUp()
+        detail_cache.clear()
+
+    def test_cached_until_machine_history_changes(self):
+        self.login(self.manager)
+        url = f"/api/machines/{self.m1.id}/"
+        first = self.api.get(url).json()
+        # версии + проверка доступа, без Prefetch и сериализации
+        with self.assertNumQueries(2):
+            self.assertEqual(self.api.get(url).json(), first)
+        self.assertEqual(detail_cache.stats()["local_hits"], 1)
+
+        Maintenance.objects.create(machine=self.m1, maintenance_type=self.to2, date=date(2024, 1, 1))
+        self.assertEqual(len(self.api.get(url).json()["maintenance"]), 2)
+
+    def test_cached_payload_still_role_checked(self):
+        self.login(self.manager)
+        self.api.get(f"/api/machines/{self.m1.id}/")
+        self.login(self.other)
+        self.assertEqual(self.api.get(f"/api/machines/{self.m1.id}/").status_code, 404)
+
+    def test_key_uses_integer_pk(self):
+        # в обход маршрута: кэш сам не должен заводить ключ на каждую запись pk
+        view = MachineViewSet.as_view({"get": "retrieve"})
+        factory = APIRequestFactory()
+        for pk in (str(self.m1.id), f"00{self.m1.id}"):
+            request = factory.get(f"/api/machines/{pk}/")
+            force_authenticate(request, self.manager)
+            self.assertEqual(view(request, pk=pk).status_code, 200)
+        self.assertEqual(detail_cache.stats()["local_hits"], 1)
+        self.assertEqual(detail_cache.stats()["size"], 1)
+
+    def test_lru_eviction(self):
+        lru = LRUCache(maxsize=2)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        lru.get("a")
+        lru.set("c", 3)
+        self.assertEqual(list(lru._data), ["a", "c"])
+
+
+class BenchmarkTests(TestCase):
+    def test_generated_fleet_and_baseline_comparison(self):
+        call_command("generate_fleet", machines=5, maintenance=2, claims=1,
+                     clients=2, services=1, stdout=StringIO())
+        self.assertEqual(Machine.objects.count(), 5)
+        self.assertEqual(Maintenance.objects.count(), 10)
+        self.assertEqual(sum(Machine.objects.values_list("claims_count", flat=True)), 5)
+
+        results = benchmark.run(roles=["manager"], scenarios=["machines-list", "machines-detail"],
+                                repeat=2, warmup=1)
+        self.assertEqual({r["status"] for r in results.values()}, {200})
+
+        baseline = {key: dict(r, queries=r["queries"] - 1) for key, r in results.items()}
+        self.assertTrue(all(regressed for *_, regressed in benchmark.compare(baseline, results)))
+
+    def test_all_scenarios_run_and_cold_cache_reaches_db(self):
+        call_command("generate_fleet", machines=5, maintenance=2, claims=1,
+                     clients=2, services=1, stdout=StringIO())
+        results = benchmark.run(roles=["manager"], repeat=2, warmup=1, cold=True)
+        self.assertEqual({key.split(" [")[0] for key in results}, set(benchmark.SCENARIOS))
+        self.assertEqual({key for key, r in results.items() if r["status"] >= 500}, set())
+        self.assertEqual(results["sync-full [manager]"]["status"], 200)
+        counts = Machine.objects.count(), Maintenance.objects.count(), Claim.objects.count()
+        # импорт с dry_run данных не меняет
+        self.assertEqual((Machine.objects.count(), Maintenance.objects.count(), Claim.objects.count()), counts)
+        # повторный поиск не отдаётся из кэша объединения запросов
+        self.assertGreater(results["search-text [manager]"]["queries"], 0)
+
+
+class FastReadTests(FleetTestCase):
+    def setUp(self):
+        super().setUp()
+        Claim.objects.create(machine=self.m2, failure_date=None, failure_node="Гидравлика",
+                             failure_description="течь\u2028шланга «высокого» давления\n\t",
+                             used_spare="")
+
+    def test_reader_matches_serializers(self):
+        for serializer_class, qs in (
+                (MaintenanceSerializer, Maintenance.objects.select_related("machine", "maintenance_type")),
+                (ClaimSerializer, Claim.objects.select_related("machine")),
+                (MachineListSerializer, Machine.objects.all())):
+            qs = qs.order_by("pk")
+            reader = ValuesReader(serializer_class)
+            self.assertEqual(reader.rows(reader.values(qs)), serializer_class(qs, many=True).data)
+
+    def test_responses_byte_identical(self):
+        self.login(self.manager)
+        claim = Claim.objects.filter(machine=self.m2).first()
+        urls = [
+            "/api/machines/", "/api/machines/?cursor=", "/api/machines/?ordering=model_name",
+            "/api/maintenance/", "/api/maintenance/?cursor=",
+            f"/api/maintenance/{Maintenance.objects.first().pk}/",
+            "/api/claims/", "/api/claims/?cursor=", f"/api/claims/{claim.pk}/",
+            "/api/search?q=000", "/api/claims/999999/",
+        ]
+        for url in urls:
+            fast = self.api.get(url)
+            with override_settings(FAST_READ=False):
+                slow = self.api.get(url)
+            self.assertEqual(fast.status_code, slow.status_code, url)
+            self.assertEqual(fast.content, slow.content, url)
+        self.assertIn(b"\\u2028", self.api.get(f"/api/claims/{claim.pk}/").content)
+
+
+
+class SparseFieldsTests(FleetTestCase):
+    def setUp(self):
+        super().setUp()
+        detail_cache.clear()
+        self.login(self.manager)
+
+    def get_sql(self, url):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.api.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response, [q["sql"] for q in captured.captured_queries]
+
+    def test_list_fields_narrow_columns(self):
+        for fast in (True, False):
+            with override_settings(FAST_READ=fast):
+                response, sql = self.get_sql("/api/machines/?fields=id,serial_number")
+            self.assertEqual(list(response.json()["results"][0]), ["id", "serial_number"])
+            machine_sql = [q for q in sql if 'FROM "equipment_machine"' in q and "COUNT" not in q]
+            self.assertTrue(machine_sql)
+            self.assertNotIn('"engine_model"', machine_sql[-1])
+
+    def test_collapsed_maintenance_type_skips_join(self):
+        for fast in (True, False):
+            with override_settings(FAST_READ=fast):
+                response, sql = self.get_sql("/api/maintenance/?expand=&exclude=machine_serial")
+            row = response.json()["results"][0]
+            self.assertIsInstance(row["maintenance_type"], int)
+            self.assertNotIn("machine_serial", row)
+            self.assertFalse([q for q in sql if "equipment_maintenancetype" in q])
+
+    def test_detail_skips_unrequested_prefetch(self):
+        url = f"/api/machines/{self.m1.id}/"
+        response, sql = self.get_sql(url + "?fields=id,serial_number,maintenance")
+        self.assertEqual(list(response.json()), ["id", "serial_number", "maintenance"])
+        self.assertEqual(response.json()["maintenance"][0]["machine_serial"], "0001")
+        self.assertFalse([q for q in sql if "equipment_claim" in q])
+        self.assertTrue([q for q in sql if "equipment_maintenance" in q])
+
+        # другой набор полей — другой ключ кэша карточки
+        response, _ = self.get_sql(url + "?expand=")
+        self.assertNotIn("maintenance", response.json())
+        self.assertIn("buyer", response.json())
+
+    def test_unknown_fields_rejected(self):
+        response = self.api.get("/api/claims/?fields=id,nope&expand=machine_serial")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {"fields", "expand"})
+
+
+class MachineHistoryTests(FleetTestCase):
+    def setUp(self):
+        super().setUp()
+        detail_cache.clear()
+        for month in range(1, 6):
+            Maintenance.objects.create(machine=self.m1, maintenance_type=self.to2,
+                                       date=date(2023, month, 1))
+        self.login(self.owner)
+
+    @override_settings(MACHINE_HISTORY_EMBED=2)
+    def test_detail_embeds_latest_with_totals(self):
+        data = self.api.get(f"/api/machines/{self.m1.id}/").json()
+        self.assertEqual([m["date"] for m in data["maintenance"]], ["2023-05-01", "2023-04-01"])
+        self.assertEqual(data["maintenance_total"], 6)
+        self.assertEqual((len(data["claims"]), data["claims_total"]), (1, 1))
+
+    def test_history_cursor_pages_and_date_filter(self):
+        url = f"/api/machines/{self.m1.id}/maintenance/"
+        seen, next_url, pages = [], url, 0
+        with mock.patch.object(KeysetPagination, "page_size", 4):
+            while next_url:
+                page = self.api.get(next_url).json()
+                self.assertNotIn("count", page)
+                seen += [row["date"] for row in page["results"]]
+                next_url, pages = page["next"], pages + 1
+        self.assertEqual((len(seen), pages), (6, 2))
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+        page = self.api.get(url, {"date_after": "2023-02-01", "date_before": "2023-03-31"}).json()
+        self.assertEqual([row["date"] for row in page["results"]], ["2023-03-01", "2023-02-01"])
+        self.assertEqual(self.api.get(url, {"date_after": "вчера"}).status_code, 400)
+
+        claims = self.api.get(f"/api/machines/{self.m1.id}/claims/",
+                              {"failure_date_after": "2022-01-01"}).json()
+        self.assertEqual(len(claims["results"]), 1)
+
+    def test_history_role_scoped_and_same_on_both_paths(self):
+        url = f"/api/machines/{self.m1.id}/maintenance/"
+        fast = self.api.get(url)
+        with override_settings(FAST_READ=False):
+            self.assertEqual(self.api.get(url).content, fast.content)
+        self.login(self.other)
+        self.assertEqual(self.api.get(url).status_code, 404)
+
+
+@override_settings(ANALYTICS_MAINTENANCE_INTERVAL=50)
+class AnalyticsTests(FleetTestCase):
+    def groups(self, **params):
+        response = self.api.get("/api/analytics/", params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return {g["key"]: g for g in response.json()["groups"]}
+
+    def test_reliability_by_model(self):
+        self.login(self.manager)
+        groups = self.groups()
+        self.assertEqual(set(groups), {"ПД1,5", "ПД3,0"})
+        g = groups["ПД1,5"]
+        self.assertEqual((g["machines"], g["operating_hours"], g["mtbf_hours"]), (1, 100, 100.0))
+        self.assertEqual((g["failures"], g["downtime_total"], g["downtime_mean"]), (1, 12, 12.0))
+        self.assertEqual(g["failure_nodes"], {"Двигатель": 1})
+        # 100 м/ч при интервале 50 — положено 2 ТО, выполнено 1
+        self.assertEqual((g["maintenance_done"], g["maintenance_expected"], g["maintenance_compliance"]),
+                         (1, 2, 0.5))
+        self.assertIsNone(groups["ПД3,0"]["mtbf_hours"])
+
+    def test_period_series_and_date_filter(self):
+        self.login(self.manager)
+        g = self.groups(group_by="service_company", period="year")["Сервис-1"]
+        self.assertEqual(g["series"], [
+            {"period": "2022-01-01", "failures": 1, "downtime": 12, "maintenance": 1}])
+        g = self.groups(group_by="service_company", date_after="2023-01-01")["Сервис-1"]
+        self.assertEqual((g["failures"], g["mtbf_hours"]), (0, 100.0))
+        self.assertEqual(self.api.get("/api/analytics/", {"period": "week"}).status_code, 400)
+
+    def test_role_scope_and_cache_invalidation(self):
+        self.login(self.owner)
+        self.assertEqual(set(self.groups()), {"ПД1,5"})
+        with CaptureQueriesContext(connection) as captured:
+            self.groups()
+        self.assertLessEqual(len(captured), 2)  # версии (+ роль), без агрегатов
+
+        Claim.objects.create(machine=self.m1, failure_date=date(2024, 1, 1),
+                             failure_node="Гидравлика", operating_hours=300, downtime_hours=4)
+        g = self.groups()["ПД1,5"]
+        self.assertEqual((g["failures"], g["operating_hours"], g["mtbf_hours"]), (2, 300, 150.0))
+
+
+class SyncTests(FleetTestCase):
+    def sync(self, since="0", **params):
+        response = self.api.get("/api/sync/", {"since": since, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def keys(self, page):
+        return {(c["model"], c["id"], c["deleted"]) for c in page["changes"]}
+
+    def test_full_then_incremental_in_batches(self):
+        self.login(self.manager)
+        seen, since, has_more = [], "0", True
+        while has_more:
+            page = self.sync(since, limit=2)
+            self.assertLessEqual(len(page["changes"]), 2)
+            seen += page["changes"]
+            since, has_more = page["next"], page["has_more"]
+        self.assertEqual(len(seen), 5)
+        self.assertEqual([c["seq"] for c in seen], sorted(c["seq"] for c in seen))
+        self.assertEqual(self.sync(since)["changes"], [])
+
+        claim = Claim.objects.get()
+        claim.restored_date = date(2022, 9, 5)
+        claim.save()
+        removed = Maintenance.objects.get(machine=self.m2).pk
+        Maintenance.objects.filter(machine=self.m2).delete()
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            added = Maintenance.objects.bulk_create([Maintenance(
+                machine=self.m1, maintenance_type=self.to2, date=date(2023, 1, 1))])
+            bulk_created.send(sender=Maintenance, objects=added)
+        page = self.sync(since)
+        self.assertEqual(self.keys(page), {
+            ("claim", claim.pk, False), ("maintenance", removed, True),
+            ("maintenance", added[0].pk, False)})
+        self.assertEqual(page["changes"][0]["data"]["restored_date"], "2022-09-05")
+
+    def test_bulk_insert_numbered_after_commit(self):
+        def sequence():
+            return ChangeVersion.objects.get(key=sync.SEQUENCE_KEY).version
+        before = sequence()
+        with self.captureOnCommitCallbacks() as callbacks, transaction.atomic():
+            added = Maintenance.objects.bulk_create([Maintenance(
+                machine=self.m1, maintenance_type=self.to2, date=date(2023, 1, 1)) for _ in range(3)])
+            bulk_created.send(sender=Maintenance, objects=added)
+            # блокировка последовательности не берётся в транзакции вставки
+            self.assertEqual(sequence(), before)
+        self.assertEqual(set(Maintenance.objects.filter(pk__in=[m.pk for m in added])
+                             .values_list("change_seq", flat=True)), {0})
+        for callback in callbacks:
+            callback()
+        self.assertEqual(sorted(Maintenance.objects.filter(pk__in=[m.pk for m in added])
+                                .values_list("change_seq", flat=True)), [before + 1, before + 2, before + 3])
+
+    def test_unstamped_rows_numbered_by_prune(self):
+        Claim.objects.update(change_seq=0)
+        call_command("prune_sync_tombstones", stdout=StringIO())
+        self.assertFalse(Claim.objects.filter(change_seq=0).exists())
+
+    def test_role_scope_and_ownership_changes(self):
+        self.login(self.owner)
+        since = self.sync()["next"]
+        self.assertEqual({c["model"] for c in self.sync()["changes"]}, {"machine", "maintenance", "claim"})
+        self.login(self.other)
+        other_since = self.sync()["next"]
+
+        claim = Claim.objects.get()
+        claim.machine = self.m2
+        claim.save()
+        self.login(self.owner)
+        self.assertEqual(self.keys(self.sync(since)), {("claim", claim.pk, True)})
+        self.login(self.other)
+        self.assertEqual(self.keys(self.sync(other_since)), {("claim", claim.pk, False)})
+
+        self.m1.client = self.other
+        self.m1.save()
+        self.login(self.owner)
+        page = self.sync(since)
+        self.assertTrue(all(c["deleted"] for c in page["changes"]))
+        self.assertIn(("machine", self.m1.pk, True), self.keys(page))
+        self.login(self.other)
+        self.assertIn(("machine", self.m1.pk, False), self.keys(self.sync(other_since)))
+
+        self.m2.delete()
+        self.login(self.owner)
+        self.assertNotIn(("machine", self.m2.pk, True), self.keys(self.sync(since)))
+
+    def test_pruned_tombstones_force_reset(self):
+        self.login(self.manager)
+        since = self.sync()["next"]
+        Claim.objects.get().delete()
+        call_command("prune_sync_tombstones", "--days", "-1", stdout=StringIO())
+        self.assertTrue(self.sync(since)["reset"])
+        self.assertFalse(self.sync(self.sync()["next"])["reset"])
+        self.assertEqual(self.api.get("/api/sync/", {"since": "abc"}).status_code, 400)
+
+
+class ChangeEventsTests(FleetTestCase):
+    def create_claim(self, machine):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Claim.objects.create(machine=machine, failure_node="Мост")
+
+    async def test_role_filtered_events_after_commit(self):
+        owner = events.stream(events.accepts_for("client", self.owner.pk), heartbeat=0.05)
+        other = events.stream(events.accepts_for("client", self.other.pk), heartbeat=0.05)
+        try:
+            self.assertTrue((await anext(owner)).startswith("retry:"))
+            await anext(other)
+            self.assertEqual(events.broker.connections, 2)
+
+            claim = await sync_to_async(self.create_claim)(self.m1)
+            chunk = await asyncio.wait_for(anext(owner), 2)
+            self.assertIn(f"id: {claim.change_seq}\nevent: change\n", chunk)
+            self.assertIn(f'"model": "claim", "id": {claim.pk}, "op": "upsert"', chunk)
+            self.assertEqual(await asyncio.wait_for(anext(other), 2), ": ping\n\n")
+        finally:
+            await owner.aclose()
+            await other.aclose()
+        self.assertEqual(events.broker.connections, 0)
+
+    def move_machine(self, machine, client):
+        with self.captureOnCommitCallbacks(execute=True):
+            machine.client = client
+            machine.save()
+
+    async def drain(self, stream):
+        chunks = []
+        while True:
+            chunk = await asyncio.wait_for(anext(stream), 2)
+            if chunk == ": ping\n\n":
+                return chunks
+            chunks.append(chunk)
+
+    async def test_previous_owner_gets_deletes(self):
+        streams = {name: events.stream(events.accepts_for(role, user.pk), heartbeat=0.05)
+                   for name, role, user in (("owner", "client", self.owner), ("other", "client", self.other),
+                                            ("manager", "manager", self.manager))}
+        try:
+            for stream in streams.values():
+                await anext(stream)
+            await sync_to_async(self.move_machine)(self.m1, self.other)
+            received = {name: await self.drain(stream) for name, stream in streams.items()}
+        finally:
+            for stream in streams.values():
+                await stream.aclose()
+        records = await sync_to_async(lambda: (
+            list(Maintenance.objects.filter(machine=self.m1).values_list("pk", flat=True)),
+            list(Claim.objects.filter(machine=self.m1).values_list("pk", flat=True))))()
+        expected = [f'"model": "machine", "id": {self.m1.pk}, "op": "delete"']
+        expected += [f'"model": "maintenance", "id": {pk}, "op": "delete"' for pk in records[0]]
+        expected += [f'"model": "claim", "id": {pk}, "op": "delete"' for pk in records[1]]
+        self.assertEqual(len(received["owner"]), len(expected))
+        for chunk, text in zip(received["owner"], expected):
+            self.assertIn(text, chunk)
+        # новый владелец и менеджер получают только изменение машины
+        for name in ("other", "manager"):
+            self.assertEqual(len(received[name]), 1)
+            self.assertIn(f'"model": "machine", "id": {self.m1.pk}, "op": "upsert"', received[name][0])
+
+    async def test_slow_subscriber_gets_reset(self):
+        stream = events.stream(events.accepts_for("manager", self.manager.pk))
+        try:
+            await anext(stream)
+            subscription = next(iter(events.broker._subscribers))
+            for i in range(subscription.queue.maxsize + 1):
+                subscription.offer({"seq": i})
+            self.assertEqual(await anext(stream), "event: reset\ndata: {}\n\n")
+        finally:
+            await stream.aclose()
+
+    async def test_stream_ends_with_token(self):
+        stream = events.stream(events.accepts_for("manager", self.manager.pk), heartbeat=5,
+                               expires_at=time.time() + 0.1)
+        try:
+            await anext(stream)
+            self.assertEqual(await asyncio.wait_for(anext(stream), 2), events.EXPIRED)
+            with self.assertRaises(StopAsyncIteration):
+                await anext(stream)
+        finally:
+            await stream.aclose()
+
+    async def test_stream_closed_on_revoke_or_role_change(self):
+        for change in (authentication.revoke, authentication.changed):
+            token = await sync_to_async(lambda: authentication.add_claims(
+                AccessToken.for_user(self.manager), self.manager))()
+            stream = events.stream(events.accepts_for("manager", self.manager.pk), heartbeat=0.05,
+                                   still_valid=lambda: authentication.atoken_current(token))
+            try:
+                await anext(stream)
+                self.assertEqual(await asyncio.wait_for(anext(stream), 2), ": ping\n\n")
+                await sync_to_async(change)([self.manager.pk])
+                chunks = []
+                while not chunks or chunks[-1] != events.EXPIRED:
+                    chunks.append(await asyncio.wait_for(anext(stream), 2))
+                self.assertLessEqual(len(chunks), 2)
+            finally:
+                await stream.aclose()
+
+    async def test_endpoint_auth(self):
+        response = await self.async_client.get("/api/events/")
+        self.assertEqual(response.status_code, 401)
+        access = str(AccessToken.for_user(self.owner))
+        # access-токен в URL не принимается: только короткий билет
+        response = await self.async_client.get("/api/events/", {"token": access})
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.post(
+            "/api/events/ticket/", headers={"Authorization": f"Bearer {access}"})
+        self.assertEqual(response.status_code, 200)
+        ticket = response.json()["ticket"]
+        response = await self.async_client.get("/api/events/", {"ticket": ticket})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        response = await self.async_client.get(
+            "/api/events/", headers={"Authorization": f"Bearer {access}"})
+        self.assertEqual(response.status_code, 200)
+
+    async def test_ticket_is_single_purpose_and_short(self):
+        access = AccessToken.for_user(self.owner)
+        ticket = authentication.EventsTicket.for_access(access)
+        self.assertEqual(ticket[authentication.STREAM_EXP], access["exp"])
+        self.assertLessEqual(ticket["exp"] - ticket["iat"], settings.EVENTS_TICKET_LIFETIME)
+        response = await self.async_client.get("/api/me/", headers={"Authorization": f"Bearer {ticket}"})
+        self.assertEqual(response.status_code, 401)
+        with override_settings(EVENTS_TICKET_LIFETIME=-1):
+            expired = str(authentication.EventsTicket.for_access(access))
+        response = await self.async_client.get("/api/events/", {"ticket": expired})
+        self.assertEqual(response.status_code, 401)
+
+    def test_endpoint_requires_asgi(self):
+        self.assertEqual(self.client.get("/api/events/").status_code, 501)
+
+
+class AsyncReadViewsTests(FleetTestCase):
+    async def get(self, url, user, sync=False):
+        headers = {"Authorization": f"Bearer {AccessToken.for_user(user)}"} if user else {}
+        if sync:
+            with mock.patch.object(async_views, "_wants_plain_json", return_value=False):
+                return await self.async_client.get(url, headers=headers)
+        # без перехода в синхронный DRF-view
+        with mock.patch.object(async_views, "sync_to_async", side_effect=AssertionError(url)):
+            return await self.async_client.get(url, headers=headers)
+
+    async def test_same_responses_as_sync_views(self):
+        cases = [
+            (None, "/api/search?q=000"), (None, "/api/search?q=kubota"),
+            (self.owner, "/api/search?q=000"), (self.manager, "/api/search?q=0"),
+            (self.manager, "/api/facets/"), (self.service, "/api/claims/facets/"),
+            (self.owner, "/api/machines/facets/"), (None, "/api/maintenance/facets/"),
+            (self.owner, "/api/me/"),
+        ]
+        for user, url in cases:
+            fast = await self.get(url, user)
+            slow = await self.get(url, user, sync=True)
+            self.assertEqual((fast.status_code, fast.content), (slow.status_code, slow.content), url)
+            self.assertEqual(fast["Content-Type"], slow["Content-Type"])
+
+    async def test_unusual_requests_fall_back_to_drf(self):
+        for url, status in (("/api/search?q=", 400), ("/api/search?q=000&page=9", 404),
+                            ("/api/me/", 401), ("/api/search?q=000&fields=serial_number", 200)):
+            response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, status, url)
+        response = await self.async_client.get(
+            "/api/me/", headers={"Authorization": "Bearer broken"})
+        self.assertEqual(response.json()["code"], "token_not_valid")
+        response = await self.async_client.get("/api/search?q=000", headers={"Accept": "text/html"})
+        self.assertIn("text/html", response["Content-Type"])
+
+
+class ClaimsAuthenticationTests(FleetTestCase):
+    def setUp(self):
+        super().setUp()
+        authentication.version_cache.invalidate()
+        authentication.permission_cache.invalidate()
+        authentication.reset_stats()
+        for user in (self.manager, self.owner):
+            user.set_password("pass")
+            user.save()
+
+    def obtain(self, user):
+        response = self.client.post("/api/auth/token/", {"username": user.username, "password": "pass"})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def get(self, path, access):
+        return self.client.get(path, headers={"Authorization": f"Bearer {access}"})
+
+    def test_claims_skip_user_and_permission_queries(self):
+        access = self.obtain(self.owner)["access"]
+        self.assertEqual(AccessToken(access)["role"], "client")
+        self.get("/api/machines/", access)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.get("/api/machines/", access)
+        self.assertEqual([m["serial_number"] for m in response.json()["results"]], ["0001"])
+        sql = " ".join(q["sql"] for q in ctx.captured_queries)
+        self.assertNotIn("auth_", sql)
+        self.assertNotIn("user:", sql)  # версии пользователя — из процессного кэша
+
+    def test_model_permissions_from_cached_group_set(self):
+        access = self.obtain(self.manager)["access"]
+        payload = {"serial_number": "0042", "model_name": "ПД1,5"}
+        self.assertEqual(self.client.post("/api/machines/", payload,
+                                          headers={"Authorization": f"Bearer {access}"}).status_code, 201)
+        user = authentication.ClaimsUser(AccessToken(access))
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perms(["equipment.add_machine", "equipment.change_claim"]))
+            self.assertFalse(user.has_perm("auth.add_user"))
+        self.assertEqual(authentication.stats()["materialized"], 0)
+        self.assertEqual(user.username, "manager")
+        self.assertFalse(user.email)  # остальные поля — из строки User
+        self.assertEqual(authentication.stats()["materialized"], 1)
+
+    def test_group_change_expires_claims_until_refresh(self):
+        tokens = self.obtain(self.owner)
+        self.assertEqual(self.get("/api/machines/", tokens["access"]).status_code, 200)
+        self.owner.groups.set([Group.objects.get(name=MANAGER_GROUP)])
+        response = self.get("/api/machines/", tokens["access"])
+        self.assertEqual((response.status_code, response.json()["code"]), (401, "token_not_valid"))
+
+        access = self.client.post("/api/auth/token/refresh/", {"refresh": tokens["refresh"]}).json()["access"]
+        self.assertEqual(AccessToken(access)["role"], "manager")
+        self.assertEqual(self.get("/api/machines/", access).json()["count"], 2)
+
+    def test_revocation_rejects_access_and_refresh(self):
+        tokens = self.obtain(self.owner)
+        call_command("revoke_tokens", "owner", stdout=StringIO())
+        self.assertEqual(self.get("/api/me/", tokens["access"]).status_code, 401)
+        response = self.client.post("/api/auth/token/refresh/", {"refresh": tokens["refresh"]})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.get("/api/me/", self.obtain(self.owner)["access"]).json()["username"], "owner")
+
+    def test_other_processes_notice_within_window(self):
+        access = self.obtain(self.owner)["access"]
+        self.get("/api/machines/", access)
+        # изменение из другого процесса: версия в БД выросла, локальный кэш ещё старый
+        versions.bump([versions.user_tokens_key(self.owner.pk)])
+        self.assertEqual(self.get("/api/machines/", access).status_code, 200)
+        with mock.patch("equipment.roles.time.monotonic",
+                        return_value=time.monotonic() + settings.JWT_REVOCATION_WINDOW + 1):
+            self.assertEqual(self.get("/api/machines/", access).status_code, 401)
+
+    def test_revocation_window_read_from_settings(self):
+        access = self.obtain(self.owner)["access"]
+        with override_settings(JWT_REVOCATION_WINDOW=0):
+            authentication.version_cache.invalidate()
+            self.get("/api/machines/", access)
+            versions.bump([versions.user_tokens_key(self.owner.pk)])
+            self.assertEqual(self.get("/api/machines/", access).status_code, 401)
+
+    def test_deactivated_user_cannot_refresh(self):
+        tokens = self.obtain(self.owner)
+        self.owner.is_active = False
+        self.owner.save()
+        self.assertEqual(self.get("/api/me/", tokens["access"]).status_code, 401)
+        response = self.client.post("/api/auth/token/refresh/", {"refresh": tokens["refresh"]})
+        self.assertEqual(response.json()["code"], "no_active_account")
+
+    def test_tokens_without_claims_still_accepted(self):
+        response = self.get("/api/me/", AccessToken.for_user(self.owner))
+        self.assertEqual(response.json()["username"], "owner")
+        self.assertEqual(authentication.stats()["legacy"], 1)
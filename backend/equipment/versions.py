@@ -0,0 +1,75 @@
+"""
+Версии изменений для условных GET-запросов.
+
+Ключи — таблицы ("machine", "maintenance", "claim", "maintenancetype") и отдельные
+машины ("machine:<id>"; меняется при записи самой машины, её ТО и рекламаций), а
+также версии пользователей для JWT ("user:<id>:claims", "user:<id>:tokens",
+см. authentication.py).
+Версии хранятся в ChangeVersion и увеличиваются в той же транзакции, что и запись.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ChangeVersion
+
+MACHINE = "machine"
+MAINTENANCE = "maintenance"
+CLAIM = "claim"
+MAINTENANCE_TYPE = "maintenancetype"
+
+
+def machine_key(pk):
+    return f"machine:{pk}"
+
+
+def user_claims_key(pk):
+    return f"user:{pk}:claims"
+
+
+def user_tokens_key(pk):
+    return f"user:{pk}:tokens"
+
+
+def bump(keys):
+    now = timezone.now()
+    for key in sorted(set(keys)):  # единый порядок блокировок строк
+        updated = ChangeVersion.objects.filter(key=key).update(
+            version=F("version") + 1, updated_at=now)
+        if updated:
+            continue
+        try:
+            with transaction.atomic():
+                ChangeVersion.objects.create(key=key, version=1, updated_at=now)
+        except IntegrityError:
+            ChangeVersion.objects.filter(key=key).update(
+                version=F("version") + 1, updated_at=now)
+
+
+def _rows(keys):
+    return ChangeVersion.objects.filter(key__in=keys).values_list("key", "version", "updated_at")
+
+
+def _result(keys, rows):
+    versions = tuple(rows.get(key, (0, None))[0] for key in keys)
+    stamps = [updated_at for _, updated_at in rows.values()]
+    return versions, max(stamps) if stamps else None
+
+
+def get(keys):
+    """(версии в порядке keys, время последнего изменения или None) одним запросом."""
+    return _result(keys, {key: (version, updated_at) for key, version, updated_at in _rows(keys)})
+
+
+async def aget(keys):
+    """get() на async ORM."""
+    return _result(keys, {key: (version, updated_at) async for key, version, updated_at in _rows(keys)})
+
+
+def get_for_view(view, keys):
+    """versions.get(), запомненный на экземпляре view: один запрос на ключи за запрос."""
+    memo = view.__dict__.setdefault("_versions_memo", {})
+    keys = tuple(keys)
+    if keys not in memo:
+        memo[keys] = get(keys)
+    return memo[keys]
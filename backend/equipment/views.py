@@ -1,43 +1,69 @@
-from django.db.models import Q, Count, Prefetch
+from django.conf import settings
+from django.db.models import Prefetch
 from rest_framework import viewsets, permissions, filters
 from rest_framework.exceptions import PermissionDenied
-from rest_framework.generics import ListAPIView
+from rest_framework.generics import ListAPIView, get_object_or_404
 from rest_framework.exceptions import ValidationError
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiTypes
 from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from django.utils.dateparse import parse_date
 
 from .models import Machine, Maintenance, Claim, MaintenanceType
 from .serializers import (
     MachineListSerializer,
     MaintenanceTypeSerializer,
     MaintenanceSerializer, ClaimSerializer,
-    MachineAnonSerializer, MaintenanceWriteSerializer, ClaimWriteSerializer, MachineDetailSerializer, MachineWriteSerializer
+    MachineAnonSerializer, MachineSearchSerializer, MaintenanceWriteSerializer, ClaimWriteSerializer, MachineDetailSerializer, MachineWriteSerializer
 )
-
-CLIENT_GROUP = "Клиент"
-SERVICE_GROUP = "Сервисная организация"
-MANAGER_GROUP = "Менеджер"
-
-
-def get_user_role(user):
-    if not user.is_authenticated:
-        return None
-    if user.is_superuser or user.groups.filter(name=MANAGER_GROUP).exists():
-        return "manager"
-    if user.groups.filter(name=SERVICE_GROUP).exists():
-        return "service"
-    if user.groups.filter(name=CLIENT_GROUP).exists():
-        return "client"
-    return None
+from .importers import import_file
+from .export import CLAIM_COLUMNS, MACHINE_COLUMNS, MAINTENANCE_COLUMNS, export_response
+from . import events as change_events, sync, versions
+from .bulk import BulkCreateMixin
+from .conditional import ConditionalGetMixin
+from .detail_cache import DetailCacheMixin
+from .fastread import FastReadMixin, ValuesReader
+from .fieldsets import SparseFieldsMixin
+from .pagination import KeysetPagination, keyset_order_by
+from .filters import ClaimHistoryFilter, MaintenanceHistoryFilter
+from . import search
+from .search import search_machines
+from .facets import get_facets, get_all_facets
+from .analytics import GROUPS as ANALYTICS_GROUPS, PERIODS as ANALYTICS_PERIODS, get_analytics
+from .authentication import STREAM_EXP, ClaimsJWTAuthentication, EventsTicket, atoken_current
+from .roles import CLIENT_GROUP, SERVICE_GROUP, MANAGER_GROUP, aget_user_role, get_user_role, restrict_by_role, role_scope  # noqa: F401
+
+
+# Сортировка истории машины: совпадает с индексами (machine, -date, id) и (machine, -failure_date, id)
+MAINTENANCE_HISTORY_ORDERING = ("-date", "id")
+CLAIM_HISTORY_ORDERING = ("-failure_date", "id")
 
 
 def _role(user):
     return get_user_role(user)
 
 
+def _import_response(request, kind):
+    if get_user_role(request.user) != "manager":
+        raise PermissionDenied("Загрузка данных доступна только менеджеру.")
+    upload = request.FILES.get("file")
+    if upload is None:
+        raise ValidationError({"file": "Приложите файл CSV или XLSX."})
+    dry_run = request.query_params.get("dry_run") in ("1", "true")
+    try:
+        report = import_file(kind, upload, upload.name, dry_run=dry_run)
+    except DjangoValidationError as e:
+        raise ValidationError({"file": e.messages})
+    return Response(report.as_dict())
+
+
 class DjangoModelPermissionsOrAnonReadOnly(permissions.DjangoModelPermissions):
     def has_permission(self, request, view):
         if request.user.is_anonymous:
@@ -45,7 +71,8 @@ class DjangoModelPermissionsOrAnonReadOnly(permissions.DjangoModelPermissions):
         return super().has_permission(request, view)
 
 
-class MachineViewSet(viewsets.ModelViewSet):
+class MachineViewSet(ConditionalGetMixin, DetailCacheMixin, SparseFieldsMixin, FastReadMixin,
+                     viewsets.ModelViewSet):
     """
     /api/machines        -> список (с пагинацией/поиском/сортировкой)
     /api/machines/{id}   -> детальная карточка (с вложенными ТО и рекламациями)
@@ -68,6 +95,22 @@ class MachineViewSet(viewsets.ModelViewSet):
                      'transmission_serial', 'buyer', 'recipient', 'delivery_address']
     # Разрешённые сортировки
     ordering_fields = ['serial_number', 'shipment_date', 'model_name']
+    pagination_class = KeysetPagination
+    keyset_ordering = ("-shipment_date", "id")
+    # только каноничная запись pk: версии и кэш карточки ключуются по machine:<pk>,
+    # и "/api/machines/01/" не должен получать собственный, никогда не сбрасываемый ключ
+    lookup_value_regex = r"[1-9]\d*"
+    fast_readers = {
+        MachineListSerializer: ValuesReader(MachineListSerializer),
+        MachineAnonSerializer: ValuesReader(MachineAnonSerializer),
+        # вложенные списки /maintenance/ и /claims/
+        MaintenanceSerializer: ValuesReader(MaintenanceSerializer),
+        ClaimSerializer: ValuesReader(ClaimSerializer),
+    }
+    # В списке есть счётчики ТО и рекламаций, поэтому он зависит и от их таблиц.
+    version_keys = {
+        "list": (versions.MACHINE, versions.MAINTENANCE, versions.CLAIM),
+    }
 
     def get_serializer_class(self):
         if not self.request.user.is_authenticated:
@@ -76,38 +119,45 @@ class MachineViewSet(viewsets.ModelViewSet):
             return MachineWriteSerializer
         return MachineListSerializer if self.action == "list" else MachineDetailSerializer
 
+    def get_version_keys(self):
+        if self.action in ("retrieve", "maintenance_history", "claims_history"):
+            # Карточка зависит только от своей машины (вместе с её ТО и рекламациями)
+            # и от названий видов ТО.
+            return [versions.machine_key(int(self.kwargs[self.lookup_field])), versions.MAINTENANCE_TYPE]
+        return super().get_version_keys()
+
     def _restrict_by_role(self, qs):
-        role = get_user_role(self.request.user)
-        if role == "manager":
-            return qs
-        if role == "service":
-            return qs.filter(service_org=self.request.user)
-        if role == "client":
-            return qs.filter(client=self.request.user)
-        return qs.none()
+        return restrict_by_role(qs, self.request.user)
 
     def get_queryset(self):
         qs = Machine.objects.all()
 
-        if self.action == "list":
-            qs = qs.annotate(
-                maintenance_count=Count("maintenance", distinct=True),
-                claims_count=Count("claim", distinct=True),
-            ).order_by("-shipment_date")
+        if self.action in ("list", "export"):
+            # maintenance_count / claims_count — денормализованные поля машины,
+            # последние ТО/наработка/простой — из сводки MachineSummary
+            qs = qs.select_related("summary").order_by("-shipment_date")
             return self._restrict_by_role(qs)
 
         if self.action == "retrieve":
-            qs = qs.prefetch_related(
-                Prefetch(
+            # В карточке только последние MACHINE_HISTORY_EMBED записей (первая страница
+            # /maintenance/ и /claims/), полные количества — в maintenance_total/claims_total.
+            # ?fields= / ?expand= без maintenance/claims — без соответствующего Prefetch.
+            limit = settings.MACHINE_HISTORY_EMBED
+            fieldset = self.get_fieldset()
+            if fieldset.includes("maintenance"):
+                qs = qs.prefetch_related(Prefetch(
                     "maintenance_set",
-                    queryset=Maintenance.objects.select_related(
-                        "maintenance_type").order_by("-date"),
-                ),
-                Prefetch(
+                    queryset=Maintenance.objects.select_related("maintenance_type").order_by(
+                        *keyset_order_by(MAINTENANCE_HISTORY_ORDERING))[:limit],
+                    to_attr="latest_maintenance",
+                ))
+            if fieldset.includes("claims"):
+                qs = qs.prefetch_related(Prefetch(
                     "claim_set",
-                    queryset=Claim.objects.order_by("-failure_date"),
-                ),
-            )
+                    queryset=Claim.objects.order_by(
+                        *keyset_order_by(CLAIM_HISTORY_ORDERING))[:limit],
+                    to_attr="latest_claims",
+                ))
             return self._restrict_by_role(qs)
 
         return self._restrict_by_role(qs)
@@ -129,30 +179,69 @@ class MachineViewSet(viewsets.ModelViewSet):
         self._ensure_manager()
         return super().perform_destroy(instance)
 
+    @action(detail=True, methods=["get"], url_path="maintenance")
+    def maintenance_history(self, request, pk=None):
+        """История ТО машины по курсору (?cursor=): ?date_after=&date_before=, ?maintenance_type="""
+        return self._conditional(
+            self._history, request, Maintenance.objects.select_related("machine", "maintenance_type"),
+            MaintenanceHistoryFilter, MaintenanceSerializer, MAINTENANCE_HISTORY_ORDERING)
+
+    @action(detail=True, methods=["get"], url_path="claims")
+    def claims_history(self, request, pk=None):
+        """Рекламации машины по курсору (?cursor=): ?failure_date_after=&failure_date_before=, ?failure_node="""
+        return self._conditional(
+            self._history, request, Claim.objects.select_related("machine"),
+            ClaimHistoryFilter, ClaimSerializer, CLAIM_HISTORY_ORDERING)
+
+    def _history(self, request, queryset, filterset_class, serializer_class, ordering):
+        pk = self.kwargs[self.lookup_field]
+        get_object_or_404(self._restrict_by_role(Machine.objects.only("pk")), pk=pk)
+        filterset = filterset_class(
+            request.query_params, queryset=queryset.filter(machine_id=pk), request=request)
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+
+        paginator = KeysetPagination(keyset_ordering=ordering, keyset_only=True)
+        reader = self.fast_readers.get(serializer_class) if self._fast_read_enabled() else None
+        if reader is not None:
+            keyset = [f.lstrip("-") for f in ordering]
+            page = paginator.paginate_queryset(reader.values(filterset.qs, extra=keyset), request, self)
+            return paginator.get_paginated_response(reader.rows(page))
+        page = paginator.paginate_queryset(filterset.qs, request, self)
+        serializer = serializer_class(page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
+
     @action(detail=False, methods=["get"])
     def facets(self, request):
-        qs = self._restrict_by_role(Machine.objects.all())
-        data = {
-            "model_name":        list(qs.exclude(model_name="").values_list("model_name", flat=True).distinct().order_by("model_name")),
-            "engine_model":      list(qs.exclude(engine_model="").values_list("engine_model", flat=True).distinct().order_by("engine_model")),
-            "transmission_model": list(qs.exclude(transmission_model="").values_list("transmission_model", flat=True).distinct().order_by("transmission_model")),
-            "steer_axle_model":  list(qs.exclude(steer_axle_model="").values_list("steer_axle_model", flat=True).distinct().order_by("steer_axle_model")),
-            "drive_axle_model":  list(qs.exclude(drive_axle_model="").values_list("drive_axle_model", flat=True).distinct().order_by("drive_axle_model")),
-            "service_company":   list(qs.exclude(service_company="").values_list("service_company", flat=True).distinct().order_by("service_company")),
-        }
-        return Response(data)
-
-
-class MaintenanceTypeViewSet(viewsets.ReadOnlyModelViewSet):
+        return Response(get_facets("machines", request.user))
+
+    @action(detail=False, methods=["post"], url_path="import", parser_classes=[MultiPartParser])
+    def import_rows(self, request):
+        """Массовая загрузка из CSV/XLSX (поле file), только для менеджера; ?dry_run=1 — только проверка"""
+        return _import_response(request, "machines")
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """Выгрузка с теми же фильтрами и сортировкой, что и список: ?file_format=csv|xlsx"""
+        qs = self.filter_queryset(self.get_queryset())
+        return export_response(qs, MACHINE_COLUMNS, "machines", request.query_params.get("file_format", "csv"))
+
+
+class MaintenanceTypeViewSet(ConditionalGetMixin, SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):
     """
     /api/maintenance-types -> список справочника видов ТО
     """
     queryset = MaintenanceType.objects.all().order_by('name')
     serializer_class = MaintenanceTypeSerializer
     permission_classes = [DjangoModelPermissionsOrAnonReadOnly]
+    version_keys = {
+        "list": (versions.MAINTENANCE_TYPE,),
+        "retrieve": (versions.MAINTENANCE_TYPE,),
+    }
 
 
-class MaintenanceViewSet(viewsets.ModelViewSet):
+class MaintenanceViewSet(ConditionalGetMixin, BulkCreateMixin, SparseFieldsMixin, FastReadMixin,
+                         viewsets.ModelViewSet):
     """
     /api/maintenance — список ТО (read-only)
     Фильтры: по виду ТО, сервисной компании, серийному номеру машины и датам.
@@ -168,22 +257,27 @@ class MaintenanceViewSet(viewsets.ModelViewSet):
         "service_company": ["exact", "icontains"]
     }
     ordering_fields = ['date', 'operating_hours', 'order_date']
+    pagination_class = KeysetPagination
+    keyset_ordering = ("machine_serial", "-date", "id")
+    fast_readers = {MaintenanceSerializer: ValuesReader(MaintenanceSerializer)}
+    bulk_prefetch = {
+        "machine_id": Machine.objects.all(),
+        "maintenance_type": MaintenanceType.objects.all(),
+    }
+    bulk_machine_check = "_ensure_can_create_for_machine"
+    version_keys = {
+        "list": (versions.MAINTENANCE, versions.MACHINE, versions.MAINTENANCE_TYPE),
+        "retrieve": (versions.MAINTENANCE, versions.MACHINE, versions.MAINTENANCE_TYPE),
+    }
 
     def get_serializer_class(self):
         return MaintenanceWriteSerializer if self.request.method in ("POST", "PUT", "PATCH") else MaintenanceSerializer
 
     def _restrict_by_role(self, qs):
-        role = get_user_role(self.request.user)
-        if role == "manager":
-            return qs
-        if role == "service":
-            return qs.filter(machine__service_org=self.request.user)
-        if role == "client":
-            return qs.filter(machine__client=self.request.user)
-        return qs.none()
+        return restrict_by_role(qs, self.request.user, "machine__")
 
     def get_queryset(self):
-        return self._restrict_by_role(super().get_queryset()).order_by("machine__serial_number", "-date")
+        return self._restrict_by_role(super().get_queryset()).order_by("machine_serial", "-date")
 
     def _ensure_can_create_for_machine(self, machine):
         role = get_user_role(self.request.user)
@@ -208,6 +302,10 @@ class MaintenanceViewSet(viewsets.ModelViewSet):
         if role == "service" and instance.machine.service_org_id == self.request.user.id:
             return
 
+    def perform_create(self, serializer):
+        self._ensure_can_create_for_machine(serializer.validated_data["machine"])
+        serializer.save()
+
     def perform_update(self, serializer):
         instance = self.get_object()
         role = get_user_role(self.request.user)
@@ -224,16 +322,22 @@ class MaintenanceViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=["get"])
     def facets(self, request):
-        qs = self.get_queryset()
-        data = {
-            "maintenance_type": list(qs.values_list("maintenance_type__id", "maintenance_type__name").distinct().order_by("maintenance_type__name")),
-            "machine_serial": list(qs.values_list("machine__serial_number", flat=True).distinct().order_by("machine__serial_number")),
-            "service_company": list(qs.values_list("service_company", flat=True).exclude(service_company="").distinct().order_by("service_company")),
-        }
-        return Response(data)
+        return Response(get_facets("maintenance", request.user))
+
+    @action(detail=False, methods=["post"], url_path="import", parser_classes=[MultiPartParser])
+    def import_rows(self, request):
+        """Массовая загрузка из CSV/XLSX (поле file), только для менеджера; ?dry_run=1 — только проверка"""
+        return _import_response(request, "maintenance")
 
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """Выгрузка с теми же фильтрами и сортировкой, что и список: ?file_format=csv|xlsx"""
+        qs = self.filter_queryset(self.get_queryset())
+        return export_response(qs, MAINTENANCE_COLUMNS, "maintenance", request.query_params.get("file_format", "csv"))
 
-class ClaimViewSet(viewsets.ModelViewSet):
+
+class ClaimViewSet(ConditionalGetMixin, BulkCreateMixin, SparseFieldsMixin, FastReadMixin,
+                   viewsets.ModelViewSet):
     queryset = Claim.objects.select_related(
         'machine').order_by('-failure_date')
     serializer_class = ClaimSerializer
@@ -248,22 +352,24 @@ class ClaimViewSet(viewsets.ModelViewSet):
     }
 
     ordering_fields = ["failure_date", "downtime_hours", "operating_hours"]
+    pagination_class = KeysetPagination
+    keyset_ordering = ("machine_serial", "-failure_date", "id")
+    fast_readers = {ClaimSerializer: ValuesReader(ClaimSerializer)}
+    bulk_prefetch = {"machine_id": Machine.objects.all()}
+    bulk_machine_check = "_ensure_can_modify"
+    version_keys = {
+        "list": (versions.CLAIM, versions.MACHINE),
+        "retrieve": (versions.CLAIM, versions.MACHINE),
+    }
 
     def get_serializer_class(self):
         return ClaimWriteSerializer if self.request.method in ("POST", "PUT", "PATCH") else ClaimSerializer
 
     def _restrict_by_role(self, qs):
-        role = get_user_role(self.request.user)
-        if role == "manager":
-            return qs
-        if role == "service":
-            return qs.filter(machine__service_org=self.request.user)
-        if role == "client":
-            return qs.filter(machine__client=self.request.user)
-        return qs.none()
+        return restrict_by_role(qs, self.request.user, "machine__")
 
     def get_queryset(self):
-        return self._restrict_by_role(super().get_queryset()).order_by("machine__serial_number", "-failure_date")
+        return self._restrict_by_role(super().get_queryset()).order_by("machine_serial", "-failure_date")
 
     def _ensure_can_modify(self, machine):
         role = get_user_role(self.request.user)
@@ -290,33 +396,31 @@ class ClaimViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=["get"])
     def facets(self, request):
-        qs = self.get_queryset()
-        data = {
-            "failure_node": list(
-                qs.values_list("failure_node", flat=True)
-                  .exclude(failure_node="")
-                  .distinct().order_by("failure_node")
-            ),
-            "machine_serial": list(
-                qs.values_list("machine__serial_number", flat=True)
-                  .distinct().order_by("machine__serial_number")
-            ),
-            "service_company": list(
-                qs.values_list("machine__service_company", flat=True)
-                  .exclude(machine__service_company="")
-                  .distinct().order_by("machine__service_company")
-            ),
-        }
-        return Response(data)
-
-
-class MachineSearchView(ListAPIView):
+        return Response(get_facets("claims", request.user))
+
+    @action(detail=False, methods=["post"], url_path="import", parser_classes=[MultiPartParser])
+    def import_rows(self, request):
+        """Массовая загрузка из CSV/XLSX (поле file), только для менеджера; ?dry_run=1 — только проверка"""
+        return _import_response(request, "claims")
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """Выгрузка с теми же фильтрами и сортировкой, что и список: ?file_format=csv|xlsx"""
+        qs = self.filter_queryset(self.get_queryset())
+        return export_response(qs, CLAIM_COLUMNS, "claims", request.query_params.get("file_format", "csv"))
+
+
+class MachineSearchView(SparseFieldsMixin, FastReadMixin, ListAPIView):
     """
     GET /api/search?q=...
-    Возвращает список машин (MachineListSerializer) по запросу q.
+    Возвращает список машин (MachineSearchSerializer, анониму — MachineAnonSerializer)
+    по запросу q.
     """
-    serializer_class = MachineAnonSerializer
     permission_classes = [DjangoModelPermissionsOrAnonReadOnly]
+    fast_readers = {
+        MachineSearchSerializer: ValuesReader(MachineSearchSerializer),
+        MachineAnonSerializer: ValuesReader(MachineAnonSerializer),
+    }
 
     @extend_schema(
         parameters=[
@@ -324,37 +428,36 @@ class MachineSearchView(ListAPIView):
                 name='q',
                 type=OpenApiTypes.STR,
                 required=True,
-                description='Строка поиска: серийный номер (только цифры) или часть текста (модель, двигатель, покупатель и т.п.)'
+                description='Строка поиска: начало серийного номера (только цифры) или слова из текста (модель, двигатель, покупатель и т.п.)'
             )
         ],
-        responses=MachineListSerializer(many=True),
+        responses=MachineSearchSerializer(many=True),
         summary="Поиск машин"
     )
     def get(self, request, *args, **kwargs):
         return super().get(request, *args, **kwargs)
 
+    def get_serializer_class(self):
+        if self.request.user.is_authenticated:
+            return MachineSearchSerializer
+        return MachineAnonSerializer
+
+    def list(self, request, *args, **kwargs):
+        # ответ зависит только от URL и области видимости: одинаковые одновременные
+        # запросы ждут одного вычисления (рендерится он каждому отдельно)
+        compute = super().list
+        key = ("search", role_scope(request.user), request.build_absolute_uri())
+        return Response(search.flight.do(key, lambda: compute(request, *args, **kwargs).data))
+
     def get_queryset(self):
         q = self.request.query_params.get('q', '').strip()
         if not q:
             raise ValidationError(
                 {'q': 'Введите строку поиска (параметр ?q=...)'})
 
-        qs = Machine.objects.all()
-
-        if q.isdigit():
-            qs = qs.filter(serial_number=q)
-        else:
-            qs = qs.filter(
-                Q(model_name__icontains=q) |
-                Q(engine_model__icontains=q) |
-                Q(engine_serial__icontains=q) |
-                Q(transmission_model__icontains=q) |
-                Q(transmission_serial__icontains=q) |
-                Q(buyer__icontains=q) |
-                Q(recipient__icontains=q) |
-                Q(delivery_address__icontains=q) |
-                Q(service_company__icontains=q)
-            )
+        qs = search_machines(Machine.objects.all(), q)
+        if self.request.user.is_authenticated:
+            qs = qs.select_related("summary")
 
         role = get_user_role(self.request.user)
         if role == "service":
@@ -362,10 +465,7 @@ class MachineSearchView(ListAPIView):
         elif role == "client":
             qs = qs.filter(client=self.request.user)
 
-        return qs.annotate(
-            maintenance_count=Count('maintenance', distinct=True),
-            claims_count=Count('claim', distinct=True),
-        ).order_by('serial_number')
+        return qs
 
 
 @api_view(["GET"])
@@ -380,3 +480,117 @@ def me(request):
         "is_staff": u.is_staff,
         "groups": list(u.groups.values_list("name", flat=True)),
     })
+
+
+@api_view(["GET"])
+def facets(request):
+    """
+    GET /api/facets/ -> фасеты машин, ТО и рекламаций одним ответом
+    """
+    return Response(get_all_facets(request.user))
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def analytics(request):
+    """
+    GET /api/analytics/?group_by=model|engine|transmission|service_company
+        &period=month|quarter|year&date_after=YYYY-MM-DD&date_before=YYYY-MM-DD
+    -> MTBF, простой, отказы по узлам и соблюдение ТО по группам (в пределах роли)
+    """
+    params = request.query_params
+    errors = {}
+    group_by = params.get("group_by", "model")
+    if group_by not in ANALYTICS_GROUPS:
+        errors["group_by"] = f"Допустимые значения: {', '.join(ANALYTICS_GROUPS)}"
+    period = params.get("period") or None
+    if period is not None and period not in ANALYTICS_PERIODS:
+        errors["period"] = f"Допустимые значения: {', '.join(ANALYTICS_PERIODS)}"
+    dates = {}
+    for name in ("date_after", "date_before"):
+        value = params.get(name)
+        if value:
+            try:
+                dates[name] = parse_date(value)
+            except ValueError:
+                dates[name] = None
+            if dates[name] is None:
+                errors[name] = "Дата в формате ГГГГ-ММ-ДД."
+    if errors:
+        raise ValidationError(errors)
+    return Response(get_analytics(request.user, group_by=group_by, period=period, **dates))
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def sync_changes(request):
+    """
+    GET /api/sync/?since=<токен>&limit=N
+    -> изменения машин, ТО и рекламаций (в пределах роли) после токена, по номеру
+       изменения; удалённые — с "deleted": true. Следующий запрос — с since=next,
+       пока has_more; reset=true — токен устарел, начать заново с since=0.
+    """
+    params = request.query_params
+    errors = {}
+    since = params.get("since", "0")
+    if not since.isdigit():
+        errors["since"] = "Токен синхронизации — неотрицательное целое (поле next ответа)."
+    limit = params.get("limit", str(settings.SYNC_BATCH_SIZE))
+    if not limit.isdigit() or not 1 <= int(limit) <= settings.SYNC_BATCH_MAX:
+        errors["limit"] = f"Целое от 1 до {settings.SYNC_BATCH_MAX}."
+    if errors:
+        raise ValidationError(errors)
+    return Response(sync.changes(request.user, since=int(since), limit=int(limit)))
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def events_ticket(request):
+    """
+    POST /api/events/ticket/ -> {"ticket": ..., "expires_in": секунды}: короткий билет
+    для GET /api/events/?ticket=..., чтобы access-токен не попадал в URL.
+    """
+    ticket = EventsTicket.for_access(request.auth)
+    return Response({"ticket": str(ticket), "expires_in": settings.EVENTS_TICKET_LIFETIME})
+
+
+async def events(request):
+    """
+    GET /api/events/?ticket=<билет из /api/events/ticket/>  (или заголовок Authorization: Bearer ...)
+    -> text/event-stream: события "change" о записях машин, ТО и рекламаций в пределах
+       роли, "reset" — поток отстал, данные нужно перечитать, "expired" — токен истёк,
+       отозван или роль сменилась: переподключиться с обновлённым токеном. Только под ASGI.
+    """
+    if request.method != "GET":
+        return JsonResponse({"detail": "Метод не поддерживается."}, status=405)
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {"detail": "Поток событий доступен только при запуске через ASGI (config/asgi.py)."},
+            status=501)
+    auth = ClaimsJWTAuthentication()
+    header = auth.get_header(request)
+    raw = auth.get_raw_token(header) if header else None
+    ticket = request.GET.get("ticket", "")
+    if not raw and not ticket:
+        return JsonResponse({"detail": "Нужен токен доступа или билет потока."}, status=401)
+    try:
+        token = auth.get_validated_token(raw) if raw else EventsTicket(ticket)
+        user = await auth.aget_user(token)
+    except TokenError as e:
+        return JsonResponse({"detail": str(e)}, status=401)
+    except (InvalidToken, AuthenticationFailed) as e:
+        return JsonResponse({"detail": str(e.detail)}, status=401)
+    accepts = change_events.accepts_for(await aget_user_role(user), user.pk)
+    if accepts is None:
+        return JsonResponse({"detail": "Нет доступа к событиям."}, status=403)
+    if change_events.broker.connections >= settings.EVENTS_MAX_CONNECTIONS:
+        return JsonResponse({"detail": "Слишком много подключений, повторите позже."}, status=503)
+
+    # права проверены один раз: поток живёт не дольше токена и закрывается при его отзыве
+    # или смене роли (claims устарели)
+    stream = change_events.stream(accepts, expires_at=token.get(STREAM_EXP, token["exp"]),
+                                  still_valid=lambda: atoken_current(token))
+    response = StreamingHttpResponse(stream, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx не должен буферизовать поток
+    return response
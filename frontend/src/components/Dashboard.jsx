@@ -13,6 +13,7 @@ import {
   updateMachine,
   deleteMachine,
   getMachine,
+  subscribeChanges,
 } from "../api";
 import { useNavigate, useLocation } from "react-router-dom";
 import Modal from "../components/Modal";
@@ -46,6 +47,7 @@ export default function Dashboard({ user }) {
   const [loading, setLoading] = useState(false);
   const [err, setErr] = useState("");
   const [rows, setRows] = useState([]);
+  const [reloadKey, setReloadKey] = useState(0);
 
   const [facetsMachines, setFacetsMachines] = useState(null);
   const [facetsMaint, setFacetsMaint] = useState(null);
@@ -70,23 +72,19 @@ export default function Dashboard({ user }) {
   const query = useQuery();
 
   useEffect(() => {
-    if (tab === "machines") {
-      authFetch("/api/machines/facets/")
-        .then((r) => r.json())
-        .then(setFacetsMachines)
-        .catch(() => setFacetsMachines(null));
-    } else if (tab === "maintenance") {
-      authFetch("/api/maintenance/facets/")
-        .then((r) => r.json())
-        .then(setFacetsMaint)
-        .catch(() => setFacetsMaint(null));
-    } else if (tab === "claims") {
-      authFetch("/api/claims/facets/")
-        .then((r) => r.json())
-        .then(setFacetsClaims)
-        .catch(() => setFacetsClaims(null));
-    }
-  }, [tab]);
+    authFetch("/api/facets/")
+      .then((r) => r.json())
+      .then((d) => {
+        setFacetsMachines(d.machines);
+        setFacetsMaint(d.maintenance);
+        setFacetsClaims(d.claims);
+      })
+      .catch(() => {
+        setFacetsMachines(null);
+        setFacetsMaint(null);
+        setFacetsClaims(null);
+      });
+  }, []);
 
   useEffect(() => {
     if (tab !== "maintenance") return;
@@ -274,6 +272,43 @@ export default function Dashboard({ user }) {
         setLoading(false);
       }
     })();
+  }, [tab, me, query.toString(), reloadKey]);
+
+  // живые обновления: правим строку текущей вкладки вместо перезагрузки списка
+  useEffect(() => {
+    if (!me) return;
+    const sources = {
+      machines: ["machine", (id) => `/api/machines/${id}/?expand=`],
+      maintenance: ["maintenance", (id) => `/api/maintenance/${id}/`],
+      claims: ["claim", (id) => `/api/claims/${id}/`],
+    };
+    const [kind, detailUrl] = sources[tab];
+    const filtered = query.toString() !== "";
+
+    return subscribeChanges(
+      async (event) => {
+        if (event.model !== kind) return;
+        if (event.op === "delete") {
+          setRows((rs) => rs.filter((r) => r.id !== event.id));
+          return;
+        }
+        try {
+          const r = await authFetch(detailUrl(event.id));
+          if (!r.ok) return;
+          const row = await r.json();
+          setRows((rs) => {
+            if (rs.some((x) => x.id === row.id)) {
+              return rs.map((x) => (x.id === row.id ? { ...x, ...row } : x));
+            }
+            // новая запись: при активных фильтрах неизвестно, подходит ли она
+            return filtered ? rs : [row, ...rs];
+          });
+        } catch (e) {
+          console.error(e);
+        }
+      },
+      () => setReloadKey((k) => k + 1)
+    );
   }, [tab, me, query.toString()]);
 
   return (
@@ -1,6 +1,6 @@
 import { useEffect, useState } from "react";
 import { useParams, Link } from "react-router-dom";
-import { authFetch } from "../api";
+import { authFetch, getMachineHistory } from "../api";
 import "../styles/MachinePage.scss";
 
 export default function MachinePage() {
@@ -8,6 +8,8 @@ export default function MachinePage() {
   const [data, setData] = useState(null);
   const [err, setErr] = useState("");
   const [loading, setLoading] = useState(true);
+  // карточка содержит только последние записи; остальное — постранично по курсору
+  const [history, setHistory] = useState({});
 
   useEffect(() => {
     let alive = true;
@@ -15,7 +17,12 @@ export default function MachinePage() {
     authFetch(`/api/machines/${id}/`)
       .then((r) => (r.ok ? r.json() : Promise.reject("Не удалось загрузить")))
       .then((d) => {
-        if (alive) setData(d);
+        if (!alive) return;
+        setData(d);
+        setHistory({
+          maintenance: { rows: d.maintenance, next: null, loaded: false },
+          claims: { rows: d.claims, next: null, loaded: false },
+        });
       })
       .catch((e) => {
         if (alive) setErr(String(e));
@@ -26,6 +33,28 @@ export default function MachinePage() {
     };
   }, [id]);
 
+  const loadMore = (kind) => {
+    const cur = history[kind];
+    getMachineHistory(id, kind, cur.loaded ? cur.next : "")
+      .then(({ results, next }) =>
+        setHistory((h) => ({
+          ...h,
+          [kind]: {
+            rows: cur.loaded ? [...cur.rows, ...results] : results,
+            next,
+            loaded: true,
+          },
+        }))
+      )
+      .catch((e) => setErr(String(e)));
+  };
+
+  const hasMore = (kind, total) => {
+    const cur = history[kind];
+    if (!cur) return false;
+    return cur.loaded ? Boolean(cur.next) : cur.rows.length < total;
+  };
+
   if (loading)
     return (
       <main className="machine">
@@ -122,9 +151,12 @@ export default function MachinePage() {
         )}
       </section>
 
-      {/* ТО (полный список только по этой машине) */}
+      {/* ТО (последние записи, остальные — по кнопке) */}
       <section className="card">
-        <h3>ТО — история обслуживания</h3>
+        <h3>
+          ТО — история обслуживания{" "}
+          <span className="muted">({data.maintenance_total})</span>
+        </h3>
         <table className="tbl">
           <thead>
             <tr>
@@ -137,7 +169,7 @@ export default function MachinePage() {
             </tr>
           </thead>
           <tbody>
-            {data.maintenance.map((x) => (
+            {history.maintenance.rows.map((x) => (
               <tr key={x.id}>
                 <td data-label="Вид ТО">
                   {x.maintenance_type?.name ?? x.maintenance_type}
@@ -149,7 +181,7 @@ export default function MachinePage() {
                 <td data-label="Организация">{x.service_company}</td>
               </tr>
             ))}
-            {data.maintenance.length === 0 && (
+            {history.maintenance.rows.length === 0 && (
               <tr>
                 <td colSpan={6} className="muted">
                   Нет записей
@@ -158,11 +190,18 @@ export default function MachinePage() {
             )}
           </tbody>
         </table>
+        {hasMore("maintenance", data.maintenance_total) && (
+          <button className="btn-more" onClick={() => loadMore("maintenance")}>
+            Показать ещё
+          </button>
+        )}
       </section>
 
       {/* Рекламации */}
       <section className="card">
-        <h3>Рекламации</h3>
+        <h3>
+          Рекламации <span className="muted">({data.claims_total})</span>
+        </h3>
         <table className="tbl">
           <thead>
             <tr>
@@ -177,7 +216,7 @@ export default function MachinePage() {
             </tr>
           </thead>
           <tbody>
-            {data.claims.map((c) => (
+            {history.claims.rows.map((c) => (
               <tr key={c.id}>
                 <td data-label="Дата отказа">{c.failure_date}</td>
                 <td data-label="Наработка">{c.operating_hours}</td>
@@ -189,7 +228,7 @@ export default function MachinePage() {
                 <td data-label="Простой (ч)">{c.downtime_hours}</td>
               </tr>
             ))}
-            {data.claims.length === 0 && (
+            {history.claims.rows.length === 0 && (
               <tr>
                 <td colSpan={8} className="muted">
                   Нет записей
@@ -198,6 +237,11 @@ export default function MachinePage() {
             )}
           </tbody>
         </table>
+        {hasMore("claims", data.claims_total) && (
+          <button className="btn-more" onClick={() => loadMore("claims")}>
+            Показать ещё
+          </button>
+        )}
       </section>
     </main>
   );